@@ -0,0 +1,60 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from replay import ReplayDisplay, ReplayMouse
+from screen_keyboard import ScreenKeyboard
+from test_ignition_demo import exit_logic, hello_world, login_logic
+
+# Recorded test the Ignition helpers are replayed from
+RECORDED_TEST = "test_hello_world_screen_keyboard"
+
+
+def bench_screen_keyboard_type(replay_of, run_replayed, resources):
+    replay = replay_of(RECORDED_TEST)
+    display, mouse = ReplayDisplay(replay), ReplayMouse(replay)
+
+    run_replayed(replay, "ScreenKeyboard.type", lambda keyboard: keyboard.type(resources["LOGIN_USER"]),
+                 prepare=lambda: new_screen_keyboard(replay, display, mouse, resources))
+
+
+def bench_login_logic(replay_of, run_replayed, resources):
+    replay = replay_of(RECORDED_TEST)
+    display, mouse = ReplayDisplay(replay), ReplayMouse(replay)
+
+    run_replayed(replay, "login_logic", lambda keyboard: login_logic(display, mouse, keyboard, resources),
+                 prepare=lambda: new_screen_keyboard(replay, display, mouse, resources))
+
+
+def bench_hello_world(replay_of, run_replayed, resources):
+    replay = replay_of(RECORDED_TEST)
+    display, mouse = ReplayDisplay(replay), ReplayMouse(replay)
+
+    run_replayed(replay, "hello_world", lambda: hello_world(display, mouse, resources))
+
+
+def bench_exit_logic(replay_of, run_replayed, resources):
+    replay = replay_of(RECORDED_TEST)
+    display, mouse = ReplayDisplay(replay), ReplayMouse(replay)
+
+    run_replayed(replay, "exit_logic", lambda: exit_logic(display, mouse, resources))
+
+
+def new_screen_keyboard(replay, display, mouse, resources) -> ScreenKeyboard:
+    """Creates a screen keyboard at the point of the replay where the recorded test created it."""
+    replay.rewind("ScreenKeyboard.__init__")
+    return ScreenKeyboard(display, mouse, resources)
@@ -0,0 +1,357 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Writes the synthetic recordings replayed by the benchmarks when a test is not recorded.
+
+The tests are run against a simulated Ignition client drawn from the resource images, and
+recorded as with HMI_RECORD_DIR. The words drawn on every screen are stored with the
+recording, so the benchmarks run without the application and without Tesseract: texts are
+looked up among the stored words, and the time OCR takes is not part of the results. Run it
+with the packages of the tests installed:
+    python benchmarks/make_synthetic_recordings.py
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+
+HMI_TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(HMI_TESTS_DIR, "src")
+sys.path.insert(0, SRC_DIR)
+
+from aurora_tests.rectangle import Rectangle
+from clock import VirtualClock, set_default_clock
+from frame_screenshot import FrameScreenshot
+from ignition_app import IgnitionApp
+from replay import DEFAULT_DEVICE, Recorder
+from step_profiler import helper_stack
+from test_ignition_demo import exit_logic, test_hello_world_screen_keyboard
+
+# Folder of the synthetic recordings, next to the recordings of real test runs
+SYNTHETIC_DIR = os.path.join(HMI_TESTS_DIR, "benchmarks", "synthetic")
+
+# Recorded test of the synthetic screen keyboard recording
+SCREEN_KEYBOARD_TEST = "test_hello_world_screen_keyboard"
+
+# Resource folder the screens are drawn from
+RES_FOLDER = "res_1920_1080"
+
+# Screen size of the resources
+SCREEN_SIZE = (1920, 1080)
+
+# Time the simulated client takes to show the next screen after a click, in seconds
+TRANSITION_S = 0.4
+
+# Time the simulated client takes to log in, in seconds
+LOGIN_TIME_S = 2.0
+
+# Colors of the drawn screens, in BGR
+BACKGROUND_COLOR = (250, 250, 251)
+HEADER_COLOR = (135, 92, 5)
+KEYBOARD_COLOR = (200, 196, 192)
+MENU_COLOR = (235, 230, 225)
+TEXT_COLOR = (40, 40, 40)
+HEADER_TEXT_COLOR = (255, 255, 255)
+
+# Font of the drawn texts
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 1.0
+FONT_THICKNESS = 2
+
+# Keys shown in each mode of the drawn screen keyboard, as in `SCREEN_KB`, in rows
+KEYBOARD_ROWS = {
+    "letters": (
+        ("SML_Y", "SML_O"),
+        ("SML_A", "SML_G", "SML_K", "SML_L"),
+        ("SHIFT_LEFT", "SML_M", "SML_N", "SML_E", "SML_I", "SML_T"),
+        ("123", "ENTER"),
+    ),
+    "shift": (
+        (),
+        (),
+        ("BIG_I",),
+        (),
+    ),
+    "numbers": (
+        ("NUM_1",),
+        ("HASH",),
+        (),
+        ("ABC", "ENTER"),
+    ),
+}
+
+# Gap between the drawn keys, in pixels
+KEY_GAP_PX = 12
+
+# Keyboard mode after clicking a key of the drawn screen keyboard, for the keys switching it
+KEYBOARD_SWITCHES = {"SHIFT_LEFT": "shift", "BIG_I": "letters", "123": "numbers", "ABC": "letters"}
+
+
+class Screen:
+    """A drawn screen, with the words drawn on it and the rectangles of its clickable parts."""
+
+    def __init__(self) -> None:
+        width, height = SCREEN_SIZE
+        self.image = np.full((height, width, 3), BACKGROUND_COLOR, dtype=np.uint8)
+        self.lines: List[List[Tuple[str, Rectangle]]] = []
+        self.targets: Dict[str, Rectangle] = {}
+
+    def fill(self, x1: int, y1: int, x2: int, y2: int, color: Tuple[int, int, int]) -> None:
+        """Fills a rectangle with a color."""
+        self.image[y1:y2, x1:x2] = color
+
+    def text(self, text: str, x: int, y: int, color: Tuple[int, int, int] = TEXT_COLOR) -> Rectangle:
+        """
+        Draws a text on one line, keeping the bounding box of every word, and makes it clickable.
+
+        Args:
+            text (str): The text, one or more words.
+            x (int): The left edge of the text.
+            y (int): The baseline of the text.
+            color (Tuple[int, int, int], optional): The text color. Defaults to TEXT_COLOR.
+
+        Returns:
+            Rectangle: The rectangle bounding the text.
+        """
+        space = cv2.getTextSize(" ", FONT, FONT_SCALE, FONT_THICKNESS)[0][0]
+        line = []
+        for word in text.split():
+            (width, height), baseline = cv2.getTextSize(word, FONT, FONT_SCALE, FONT_THICKNESS)
+            cv2.putText(self.image, word, (x, y), FONT, FONT_SCALE, color, FONT_THICKNESS, cv2.LINE_AA)
+            line.append((word, Rectangle([x, y - height, x + width, y + baseline])))
+            x += width + space
+        self.lines.append(line)
+        rec = Rectangle([line[0][1].p1.x, line[0][1].p1.y, line[-1][1].p2.x, line[-1][1].p2.y])
+        self.targets[text] = rec
+        return rec
+
+    def paste(self, image_file: str, x: int, y: int, name: str) -> Rectangle:
+        """
+        Draws a resource image and makes it clickable.
+
+        Args:
+            image_file (str): The resource image, relative to the working folder.
+            x (int): The left edge of the image on the screen.
+            y (int): The top edge of the image on the screen.
+            name (str): The name of the clicked target.
+
+        Returns:
+            Rectangle: The rectangle bounding the image.
+        """
+        image = cv2.imread(image_file, cv2.IMREAD_COLOR)
+        height, width = image.shape[:2]
+        self.image[y:y + height, x:x + width] = image
+        self.targets[name] = Rectangle([x, y, x + width, y + height])
+        return self.targets[name]
+
+
+class SimulatedIgnition:
+    """
+    The Ignition client with the demo project, drawn from the resource images.
+
+    A click changes the screen once the client took its time for it on the clock, as the
+    real client takes its time for the screen transitions.
+    """
+
+    def __init__(self, resources: Dict, clock: VirtualClock) -> None:
+        """
+        Initializes the client, not running yet.
+
+        Args:
+            resources (Dict): The resource values.
+            clock (VirtualClock): The clock the client takes its time on.
+        """
+        self._resources = resources
+        self._clock = clock
+        self._screen = "closed"
+        self._keyboard: Optional[str] = None
+        self._menu = False
+        self._pending: Optional[Tuple[float, Callable[[], None]]] = None
+        self._drawn: Dict[tuple, Screen] = {}
+
+    def launch(self) -> None:
+        """Starts the client on its login screen."""
+        self._screen, self._keyboard, self._menu, self._pending = "login", None, False, None
+
+    def close(self) -> None:
+        """Kills the client."""
+        self._screen, self._pending = "closed", None
+
+    def grab(self) -> FrameScreenshot:
+        """Returns the screen shown now, knowing the words drawn on it."""
+        screen = self._show()
+        return FrameScreenshot(screen.image.copy(), lines=screen.lines)
+
+    def click(self, point: Any) -> None:
+        """Clicks a point of the screen shown now."""
+        screen = self._show()
+        target = next((name for name, rec in screen.targets.items()
+                       if rec.p1.x <= point.x <= rec.p2.x and rec.p1.y <= point.y <= rec.p2.y), None)
+
+        if target in KEYBOARD_SWITCHES:
+            self._keyboard = KEYBOARD_SWITCHES[target]
+        elif target == "kb_icon":
+            self._later(TRANSITION_S, lambda: setattr(self, "_keyboard", "letters" if not self._keyboard else None))
+        elif target == "login_btn":
+            self._later(LOGIN_TIME_S, lambda: self._go("main"))
+        elif target == "Empty":
+            self._later(TRANSITION_S, lambda: self._go("hello_tab"))
+        elif target == "Say Hello":
+            self._later(TRANSITION_S, lambda: self._go("hello"))
+        elif target == "Command":
+            self._later(TRANSITION_S, lambda: setattr(self, "_menu", True))
+        elif target == "Logout":
+            self._later(TRANSITION_S, lambda: self._go("login"))
+        elif target == "Exit":
+            self._later(TRANSITION_S, lambda: self._go("closed"))
+
+    def _later(self, delay_s: float, change: Callable[[], None]) -> None:
+        """Changes the screen after a while."""
+        self._pending = (self._clock.monotonic() + delay_s, change)
+
+    def _go(self, screen: str) -> None:
+        """Shows another screen, with the screen keyboard and the Command menu closed."""
+        self._screen, self._keyboard, self._menu = screen, None, False
+
+    def _show(self) -> Screen:
+        """Returns the screen shown now, drawing it the first time it is shown."""
+        if self._pending and self._clock.monotonic() >= self._pending[0]:
+            change, self._pending = self._pending[1], None
+            change()
+        key = (self._screen, self._keyboard, self._menu)
+        if key not in self._drawn:
+            self._drawn[key] = self._draw()
+        return self._drawn[key]
+
+    def _draw(self) -> Screen:
+        """Draws the screen shown now."""
+        screen = Screen()
+        if self._screen == "closed":
+            return screen
+
+        width, height = SCREEN_SIZE
+        screen.fill(0, 0, width, 60, HEADER_COLOR)
+        if self._screen == "login":
+            screen.text("Username", 860, 150)
+            screen.fill(860, 170, 1160, 215, (255, 255, 255))
+            screen.text("Password", 860, 270)
+            screen.fill(860, 290, 1160, 335, (255, 255, 255))
+            screen.paste(self._resources["LOGIN_BTN_ICON"], (width - 313) // 2, 400, "login_btn")
+            if self._keyboard:
+                screen.paste(self._resources["SCREEN_KB_ON_ICON"], width - 81, 11, "kb_icon")
+                self._draw_keyboard(screen)
+            else:
+                screen.paste(self._resources["SCREEN_KB_OFF_ICON"], width - 80, 12, "kb_icon")
+            return screen
+
+        screen.text("Command", 40, 42, HEADER_TEXT_COLOR)
+        screen.text("Empty", 320, 120)
+        if self._screen in ("hello_tab", "hello"):
+            screen.text("Say Hello", 860, 500)
+        if self._screen == "hello":
+            screen.text("Hello World", 860, 640)
+        if self._menu:
+            screen.fill(20, 60, 220, 210, MENU_COLOR)
+            screen.text("Logout", 40, 115)
+            screen.text("Exit", 40, 180)
+        return screen
+
+    def _draw_keyboard(self, screen: Screen) -> None:
+        """Draws the screen keyboard in its current mode."""
+        width, height = SCREEN_SIZE
+        screen.fill(0, height - 4 * (100 + KEY_GAP_PX) - KEY_GAP_PX, width, height, KEYBOARD_COLOR)
+        for row, names in enumerate(KEYBOARD_ROWS[self._keyboard]):
+            x, y = 300, height - (4 - row) * (100 + KEY_GAP_PX)
+            for name in names:
+                rec = screen.paste(self._resources["SCREEN_KB"][name], x, y, name)
+                x = int(rec.p2.x) + KEY_GAP_PX
+
+
+class RecordedDisplay:
+    """The display of a simulated device, recording the grabbed frames as the record_session fixture does."""
+
+    def __init__(self, device: Any, recorder: Recorder, test: str) -> None:
+        self._device = device
+        self._recorder = recorder
+        self._test = test
+
+    def grab(self) -> FrameScreenshot:
+        """Grabs the screen of the device."""
+        screenshot = self._device.grab()
+        self._recorder.frame(screenshot, helper_stack(sys._getframe(1), SRC_DIR, self._test))
+        return screenshot
+
+
+class RecordedMouse:
+    """The mouse of a simulated device, recording the clicks as the record_session fixture does."""
+
+    def __init__(self, device: Any, recorder: Recorder, test: str) -> None:
+        self._device = device
+        self._recorder = recorder
+        self._test = test
+
+    def click(self, point: Any) -> None:
+        """Clicks a point."""
+        self._device.click(point)
+        self._recorder.input("click", [int(point.x), int(point.y)], helper_stack(sys._getframe(1), SRC_DIR, self._test))
+
+
+def record_screen_keyboard_test(resources: Dict, clock: VirtualClock) -> None:
+    """
+    Records the screen keyboard test, with the setup and teardown of its `ignition_app` fixture.
+
+    Args:
+        resources (Dict): The resource values.
+        clock (VirtualClock): The clock of the test.
+    """
+    folder = os.path.join(SYNTHETIC_DIR, SCREEN_KEYBOARD_TEST, DEFAULT_DEVICE)
+    shutil.rmtree(folder, ignore_errors=True)
+    recorder = Recorder(folder, clock)
+    client = SimulatedIgnition(resources, clock)
+    client.launch()
+    display = RecordedDisplay(client, recorder, SCREEN_KEYBOARD_TEST)
+    mouse = RecordedMouse(client, recorder, SCREEN_KEYBOARD_TEST)
+
+    app = IgnitionApp(display, mouse, resources, start=client.launch,
+                      exit=lambda: exit_logic(display, mouse, resources), kill=client.close)
+    app.show_login_screen()
+    test_hello_world_screen_keyboard(display, mouse, resources, app)
+    app.exit()
+    recorder.save()
+
+
+def main() -> None:
+    clock = VirtualClock()
+    set_default_clock(clock)
+    with tempfile.TemporaryDirectory() as work:
+        # The helpers learn text regions and screen states next to the resources, so they run on a copy
+        shutil.copytree(os.path.join(HMI_TESTS_DIR, RES_FOLDER), os.path.join(work, RES_FOLDER))
+        cwd = os.getcwd()
+        os.chdir(work)
+        try:
+            with open(os.path.join(RES_FOLDER, "res.json")) as file:
+                resources = json.load(file)
+            record_screen_keyboard_test(resources, clock)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, Optional
+import cv2
+import numpy as np
+
+# Side in pixels of the tiles a frame is averaged over when comparing frames
+SAMPLE_STEP = 8
+
+# Only every this many rows and columns of a frame are averaged, keeping the comparison well below a millisecond
+_SUBSAMPLE = 2
+
+# Absolute difference of the mean of any one tile above which a frame counts as changed
+CHANGE_THRESHOLD = 8.0
+
+
+class ChangeDetector:
+    """
+    Tells whether the screen changed since the last changed frame it was shown.
+
+    Frames are compared tile by tile, by the mean of every SAMPLE_STEP x SAMPLE_STEP tile,
+    which takes less than a millisecond on a 1080p frame. A change of a single tile counts, so
+    a small text or icon appearing is noticed too. Helpers use it to skip analysing a frame
+    that shows the same as the previous one, e.g. a list that no longer scrolls.
+    """
+
+    def __init__(self, threshold: float = CHANGE_THRESHOLD) -> None:
+        """
+        Initializes the change detector.
+
+        Args:
+            threshold (float, optional): The absolute difference of the mean of any one tile above
+                which a frame counts as changed. Defaults to CHANGE_THRESHOLD.
+        """
+        self._threshold = threshold
+        self._reference: Optional[np.ndarray] = None
+
+    def changed(self, screenshot: Any) -> bool:
+        """
+        Checks whether a frame differs from the last changed frame, and remembers it if it does.
+
+        The first frame always counts as changed.
+
+        Args:
+            screenshot (Any): The grabbed screenshot.
+
+        Returns:
+            bool: True if the frame changed, False otherwise.
+        """
+        sample = frame_sample(screenshot)
+        if self._reference is not None and not samples_differ(sample, self._reference, self._threshold):
+            return False
+        self._reference = sample
+        return True
+
+
+def frame_sample(screenshot: Any) -> Optional[np.ndarray]:
+    """
+    Returns the mean of every SAMPLE_STEP x SAMPLE_STEP tile of a screenshot for a cheap comparison.
+
+    The means are taken over the green channel, the one closest to the brightness, and over
+    every other row and column only. Unlike a sparse sample of pixels, the tile means still
+    change with strokes of text two pixels wide, wherever they fall.
+
+    Args:
+        screenshot (Any): A NumPy image array, or an AuroraTests screenshot keeping its captured
+            frame in the `image` attribute.
+
+    Returns:
+        Optional[np.ndarray]: The tile means, or None if there is no screenshot.
+    """
+    if screenshot is None:
+        return None
+    image = screenshot if isinstance(screenshot, np.ndarray) else np.asarray(screenshot.image)
+    height, width = image.shape[:2]
+    size = (max(width // SAMPLE_STEP, 1), max(height // SAMPLE_STEP, 1))
+    # A strided view, so only the averaged pixels are read
+    plane = image[::_SUBSAMPLE, ::_SUBSAMPLE, 1] if image.ndim == 3 else image[::_SUBSAMPLE, ::_SUBSAMPLE]
+    return cv2.resize(plane, size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def samples_differ(sample: Optional[np.ndarray], reference: Optional[np.ndarray],
+                   threshold: float = CHANGE_THRESHOLD) -> bool:
+    """
+    Checks whether two frame samples differ.
+
+    Args:
+        sample (Optional[np.ndarray]): The sample of one frame.
+        reference (Optional[np.ndarray]): The sample of the other frame.
+        threshold (float, optional): The absolute difference of any one tile mean above which the
+            samples differ. Defaults to CHANGE_THRESHOLD.
+
+    Returns:
+        bool: True if the samples differ, or only one of them is missing, False otherwise.
+    """
+    if sample is None or reference is None:
+        return sample is not reference
+    if sample.shape != reference.shape:
+        return True
+    # The largest tile difference, so a change confined to a few tiles is not averaged away
+    return int(np.max(np.abs(sample - reference))) > threshold
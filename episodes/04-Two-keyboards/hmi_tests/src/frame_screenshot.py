@@ -0,0 +1,89 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Hashable, List, Optional, Tuple
+import numpy as np
+from aurora_tests.rectangle import Rectangle
+from screen_text import find_in_lines, pytesseract, recognize_lines
+from template_matcher import find_images
+
+
+class FrameScreenshot:
+    """
+    A screenshot backed by a raw BGR frame in memory.
+
+    It offers the same `find_image` and `find_text` as the screenshots grabbed by the
+    AuroraTests displays, using OpenCV template matching and Tesseract OCR. The frame is
+    recognized by OCR at most once, and not at all if its words are already known.
+    """
+
+    def __init__(self, image: np.ndarray, display: Optional[Hashable] = None,
+                 lines: Optional[List[List[Tuple[str, Rectangle]]]] = None) -> None:
+        """
+        Initializes the screenshot.
+
+        Args:
+            image (np.ndarray): The BGR frame.
+            display (Optional[Hashable], optional): The display the frame was grabbed from, keeping the
+                scale images are found at. Defaults to None, meaning displays of the same size share it.
+            lines (Optional[List[List[Tuple[str, Rectangle]]]], optional): The words on the frame with
+                their bounding boxes, line by line, e.g. stored with a recording. Defaults to None,
+                meaning they are recognized by OCR at the first text search.
+        """
+        self.image = image
+        self.display = display
+        self._lines = lines
+
+    @property
+    def recognized_lines(self) -> Optional[List[List[Tuple[str, Rectangle]]]]:
+        """The words on the frame with their bounding boxes, line by line, or None if not recognized yet."""
+        return self._lines
+
+    def find_image(self, image_file: str, region: Optional[Rectangle] = None) -> Optional[Rectangle]:
+        """
+        Finds an image on the screenshot.
+
+        Args:
+            image_file (str): The image file to find.
+            region (Optional[Rectangle], optional): The region to search in. Defaults to the whole screenshot.
+
+        Returns:
+            Optional[Rectangle]: The rectangle bounding the found image, or None if not found.
+        """
+        return find_images(self.image, [image_file], region, display=self.display).get(image_file)
+
+    def find_text(self, text: str, region: Optional[Rectangle] = None,
+                  ignore_case: bool = False, substring: bool = False) -> Optional[Rectangle]:
+        """
+        Finds a text on the screenshot.
+
+        Args:
+            text (str): The text to find, one or more words.
+            region (Optional[Rectangle], optional): The region to search in. Defaults to the whole screenshot.
+            ignore_case (bool, optional): Whether to ignore the letter case. Defaults to False.
+            substring (bool, optional): Whether the text may be a part of a longer text. Defaults to False.
+
+        Returns:
+            Optional[Rectangle]: The rectangle bounding the found text, or None if not found.
+
+        Raises:
+            ImportError: If the words on the frame are not known and pytesseract is not installed.
+        """
+        if self._lines is None:
+            if pytesseract is None:
+                raise ImportError("pytesseract is required to find texts on the screen")
+            self._lines = recognize_lines(self.image)
+
+        area = (region.p1.x, region.p1.y, region.p2.x, region.p2.y) if region else None
+        return find_in_lines(self._lines, text, area, ignore_case, substring)
@@ -0,0 +1,166 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, Callable, Dict, Optional
+import pytest
+from aurora_tests.interfaces.idisplay import IDisplay
+from aurora_tests.interfaces.imouse import IMouse
+from aurora_tests.rectangle import Rectangle
+from screen_text import OcrScreenshot, TextRegions
+from screen_waits import wait_for_text
+
+# Screens of the Ignition application
+LOGIN_SCREEN = "login"
+MAIN_SCREEN = "main"
+UNKNOWN_SCREEN = "unknown"
+
+# Texts telling the screens apart
+_LOGIN_TEXT = "Username"
+_MAIN_TEXT = "Command"
+
+# Command menu entry logging the user out, back to the login screen
+_LOGOUT_TEXT = "Logout"
+
+
+class IgnitionApp:
+    """
+    The Ignition Vision client, kept running across the tests of a session.
+
+    The screen tells whether the application is running and logged in, so an instance left
+    running, also by an earlier session, is reused. Tests start from the login screen, reached
+    by logging out. The application is restarted only when that screen cannot be reached, and
+    killed first when it cannot be exited, so a stuck instance is not left running next to the new one.
+    """
+
+    def __init__(self, display: IDisplay, mouse: IMouse, resources: Dict,
+                 start: Callable[[], Any], exit: Callable[[], Any], kill: Callable[[], Any]) -> None:
+        """
+        Initializes the application.
+
+        Args:
+            display (IDisplay): The display showing the application.
+            mouse (IMouse): The mouse to click with.
+            resources (Dict): The resource values.
+            start (Callable[[], Any]): Launches the application and waits for its login screen.
+            exit (Callable[[], Any]): Exits the application from its main screen.
+            kill (Callable[[], Any]): Kills the application if it is running, whatever it shows.
+        """
+        self._display = display
+        self._mouse = mouse
+        self._resources = resources
+        self._start = start
+        self._exit = exit
+        self._kill = kill
+        self._text_regions = TextRegions(resources)
+        self._command_menu: Optional[Rectangle] = None
+        self.launches = 0
+
+    def screen(self) -> str:
+        """
+        Tells which screen the application shows.
+
+        Returns:
+            str: LOGIN_SCREEN, MAIN_SCREEN, or UNKNOWN_SCREEN if the application is not running
+                or shows something else, e.g. a dialog.
+        """
+        screenshot = OcrScreenshot(self._display.grab())
+        if self._text_regions.find_text(screenshot, _LOGIN_TEXT):
+            return LOGIN_SCREEN
+        self._command_menu = self._text_regions.find_text(screenshot, _MAIN_TEXT)
+        if self._command_menu:
+            return MAIN_SCREEN
+        return UNKNOWN_SCREEN
+
+    def show_login_screen(self) -> None:
+        """
+        Brings the application to its login screen, launching it if it is not running.
+
+        A logged in application is logged out. The application is restarted if neither works.
+
+        Raises:
+            AssertionError: If the login screen is not shown after a restart either.
+        """
+        screen = self.screen()
+        if screen == MAIN_SCREEN and self._logout():
+            return
+        if screen != LOGIN_SCREEN:
+            self.restart(screen)
+
+    def restart(self, screen: str = UNKNOWN_SCREEN) -> None:
+        """
+        Exits the application if it is running and launches it again.
+
+        An application not showing its main screen, or failing to exit from it, is killed.
+
+        Args:
+            screen (str, optional): The screen the application shows. Defaults to UNKNOWN_SCREEN.
+
+        Raises:
+            AssertionError: If the login screen is not shown after the start.
+        """
+        exited = False
+        if screen == MAIN_SCREEN:
+            try:
+                self._exit()
+                exited = True
+            except AssertionError:
+                pass
+        if not exited:
+            self._kill()
+        self.launches += 1
+        self._start()
+
+    def exit(self) -> None:
+        """
+        Exits the application if it shows its main screen. On the login screen it is left running for the next session.
+
+        Raises:
+            AssertionError: If the application cannot be exited.
+        """
+        if self.screen() == MAIN_SCREEN:
+            self._exit()
+
+    def _logout(self) -> bool:
+        """
+        Logs out from the main screen through the Command menu, found by the last screen check.
+
+        Returns:
+            bool: True if the login screen is shown, False otherwise.
+        """
+        self._mouse.click(self._command_menu.center())
+
+        logout = wait_for_text(self._display, _LOGOUT_TEXT, self._resources["SCREEN_TRANSITION_DELAY_S"],
+                               text_regions=self._text_regions).found
+        if not logout:
+            return False
+        self._mouse.click(logout.center())
+
+        return bool(wait_for_text(self._display, _LOGIN_TEXT, self._resources["LOGIN_DELAY_S"],
+                                  text_regions=self._text_regions))
+
+
+def is_last_test_using(request: pytest.FixtureRequest, fixture: str) -> bool:
+    """
+    Tells whether no test after the running one uses a fixture in this session.
+
+    Args:
+        request (pytest.FixtureRequest): The request of the running test.
+        fixture (str): The fixture name.
+
+    Returns:
+        bool: True if the running test is the last one using the fixture, False otherwise.
+    """
+    items = request.session.items
+    later = items[items.index(request.node) + 1:] if request.node in items else []
+    return not any(fixture in getattr(item, "fixturenames", ()) for item in later)
@@ -0,0 +1,145 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Modes of the on-screen keyboard
+LETTERS_MODE = "letters"
+SHIFT_MODE = "shift"
+CAPS_MODE = "caps"
+NUMBERS_MODE = "numbers"
+
+
+class KeyPress(NamedTuple):
+    """A key to click, with the keyboard mode showing it."""
+
+    mode: str
+    key: str
+    # The typed character, or None for a key switching the mode
+    char: Optional[str]
+
+
+class KeyboardModel:
+    """
+    The states of an on-screen keyboard: which characters each mode types and which keys switch modes.
+
+    Typing a character may switch the mode too, e.g. a shifted letter goes back to the letters mode.
+    """
+
+    def __init__(self, chars: Dict[str, Dict[str, Tuple[str, str]]], switches: Dict[str, Dict[str, str]]) -> None:
+        """
+        Initializes the keyboard model.
+
+        Args:
+            chars (Dict[str, Dict[str, Tuple[str, str]]]): By mode and character, the key typing the
+                character and the mode after typing it.
+            switches (Dict[str, Dict[str, str]]): By mode and key, the mode after clicking the key.
+        """
+        self.chars = chars
+        self.switches = switches
+
+    @classmethod
+    def from_screen_kb(cls, screen_kb: Dict[str, str]) -> "KeyboardModel":
+        """
+        Builds the model of the keyboard whose keys are listed in the SCREEN_KB resource.
+
+        Letters are `SML_<X>` and `BIG_<X>`, digits `NUM_<d>`, and `HASH`, `ENTER`, `SHIFT_LEFT`,
+        `123` and `ABC` are the special keys. An optional `CAPS_LOCK` key locks the uppercase letters.
+
+        Args:
+            screen_kb (Dict[str, str]): The icon files of the keys, by key name.
+
+        Returns:
+            KeyboardModel: The keyboard model.
+        """
+        modes = (LETTERS_MODE, SHIFT_MODE, CAPS_MODE, NUMBERS_MODE)
+        chars: Dict[str, Dict[str, Tuple[str, str]]] = {mode: {} for mode in modes}
+        switches: Dict[str, Dict[str, str]] = {mode: {} for mode in modes}
+
+        for key in screen_kb:
+            if key.startswith("SML_"):
+                chars[LETTERS_MODE][key[4:].lower()] = (key, LETTERS_MODE)
+            elif key.startswith("BIG_"):
+                chars[SHIFT_MODE][key[4:].upper()] = (key, LETTERS_MODE)
+                chars[CAPS_MODE][key[4:].upper()] = (key, CAPS_MODE)
+            elif key.startswith("NUM_"):
+                chars[NUMBERS_MODE][key[4:]] = (key, NUMBERS_MODE)
+        if "HASH" in screen_kb:
+            chars[NUMBERS_MODE]["#"] = ("HASH", NUMBERS_MODE)
+        # Caps lock is released before ENTER, so typing always ends in a mode the layout check tells apart
+        if "ENTER" in screen_kb:
+            for mode in (LETTERS_MODE, NUMBERS_MODE):
+                chars[mode]["\n"] = ("ENTER", mode)
+
+        if "123" in screen_kb:
+            switches[LETTERS_MODE]["123"] = NUMBERS_MODE
+        if "ABC" in screen_kb:
+            switches[NUMBERS_MODE]["ABC"] = LETTERS_MODE
+        if "SHIFT_LEFT" in screen_kb:
+            switches[LETTERS_MODE]["SHIFT_LEFT"] = SHIFT_MODE
+        if "CAPS_LOCK" in screen_kb:
+            switches[LETTERS_MODE]["CAPS_LOCK"] = CAPS_MODE
+            switches[CAPS_MODE]["CAPS_LOCK"] = LETTERS_MODE
+
+        return cls(chars, switches)
+
+
+def plan_keys(model: KeyboardModel, text: str, mode: str) -> List[KeyPress]:
+    """
+    Plans the fewest key clicks typing a text, including the mode switches.
+
+    E.g. several uppercase letters in a row are typed with one caps lock instead of a shift
+    before each, and a digit followed by a letter switches to numbers and back only once.
+
+    Args:
+        model (KeyboardModel): The keyboard model.
+        text (str): The text to type.
+        mode (str): The mode the keyboard is in.
+
+    Returns:
+        List[KeyPress]: The keys to click, in order.
+
+    Raises:
+        ValueError: If a character cannot be typed on the keyboard.
+    """
+    # Breadth first search over (typed characters, mode) states, every click costing the same
+    start = (0, mode)
+    came_from: Dict[Tuple[int, str], Tuple[Tuple[int, str], KeyPress]] = {}
+    queue = deque([start])
+    typed = 0
+
+    while queue:
+        state = queue.popleft()
+        typed, current = state
+        if typed == len(text):
+            presses = []
+            while state != start:
+                state, press = came_from[state]
+                presses.append(press)
+            return presses[::-1]
+
+        moves = [((typed, next_mode), KeyPress(current, key, None))
+                 for key, next_mode in model.switches[current].items()]
+        if text[typed] in model.chars[current]:
+            key, next_mode = model.chars[current][text[typed]]
+            moves.append(((typed + 1, next_mode), KeyPress(current, key, text[typed])))
+
+        for next_state, press in moves:
+            if next_state != start and next_state not in came_from:
+                came_from[next_state] = (state, press)
+                queue.append(next_state)
+
+    typed = max(state[0] for state in came_from) if came_from else 0
+    raise ValueError(f"Cannot type {text[typed]!r} on the screen keyboard")
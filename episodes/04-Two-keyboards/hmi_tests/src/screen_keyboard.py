@@ -13,12 +13,17 @@
 # limitations under the License.
 
 import json
-import time
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from aurora_tests.interfaces.idisplay import IDisplay
 from aurora_tests.interfaces.ikeyboard import IKeyboard
 from aurora_tests.interfaces.imouse import IMouse
 from aurora_tests.rectangle import Rectangle
+from clock import Clock, default_clock
+from input_queue import INPUT_MIN_GAP_KEY, InputQueue
+from key_planner import CAPS_MODE, LETTERS_MODE, NUMBERS_MODE, SHIFT_MODE, KeyboardModel, plan_keys
+from screen_states import ScreenStates
+from template_matcher import find_images, template_resolution
+from template_store import TemplateStore
 
 
 class ScreenKeyboard(IKeyboard):
@@ -27,9 +32,35 @@ class ScreenKeyboard(IKeyboard):
 
     This class implements the `IKeyboard` interface and uses the `IDisplay`, `IMouse`,
     and resources for interacting with the screen-based keyboard.
+
+    By default the keys of each keyboard mode (letters, shift, caps lock, numbers) are located once
+    and typing clicks the cached key positions. The cache is dropped when the mode switcher
+    key is no longer found at its cached position.
     """
 
-    def __init__(self, display: IDisplay, mouse: IMouse, resources: json) -> None:
+    _LETTERS_MODE: str = LETTERS_MODE
+    _SHIFT_MODE: str = SHIFT_MODE
+    _CAPS_MODE: str = CAPS_MODE
+    _NUMBERS_MODE: str = NUMBERS_MODE
+
+    # Prefixes of the SCREEN_KB keys shown in each keyboard mode
+    _MODE_KEYS: Dict[str, Tuple[str, ...]] = {
+        _LETTERS_MODE: ("SML_", "SHIFT_LEFT", "CAPS_LOCK", "123", "ENTER"),
+        _SHIFT_MODE: ("BIG_",),
+        _CAPS_MODE: ("BIG_", "CAPS_LOCK"),
+        _NUMBERS_MODE: ("NUM_", "HASH", "ABC", "ENTER"),
+    }
+
+    _LAYOUT_CHECK_MARGIN_PX: int = 20
+
+    # Screen states telling the mode by the mode switcher icon, "123" in letters mode and "ABC" in numbers mode
+    _SWITCHER_STATES: Dict[str, str] = {
+        "screen keyboard letters": _LETTERS_MODE,
+        "screen keyboard numbers": _NUMBERS_MODE,
+    }
+
+    def __init__(self, display: IDisplay, mouse: IMouse, resources: json, cache_layout: bool = True,
+                 clock: Optional[Clock] = None) -> None:
         """
         Initializes the ScreenKeyboard by locating and clicking the on-screen keyboard icon.
 
@@ -37,6 +68,8 @@ class ScreenKeyboard(IKeyboard):
             display (IDisplay): The display object to capture the screen.
             mouse (IMouse): The mouse object to simulate mouse clicks.
             resources (json): The configuration and resource data for the application, including icons.
+            cache_layout (bool, optional): Whether to type by clicking cached key positions. Defaults to True.
+            clock (Optional[Clock], optional): The clock to wait with. Defaults to the default clock.
 
         Raises:
             RuntimeError: If the screen keyboard icon is not found.
@@ -44,7 +77,15 @@ class ScreenKeyboard(IKeyboard):
         self._display = display
         self._mouse = mouse
         self._resources = resources
+        self._clock = clock or default_clock()
         self._TRANSITION_DELAY = resources["SCREEN_KB_TRANSITION_DELAY_S"]
+        self._cache_layout = cache_layout
+        self._layouts: Dict[str, Dict[str, Rectangle]] = {}
+        self._switcher_rec: Optional[Rectangle] = None
+        self._templates = TemplateStore.from_resources(resources) if cache_layout else None
+        self._model = KeyboardModel.from_screen_kb(resources["SCREEN_KB"])
+        self._resolution = template_resolution(resources["SCREEN_KB_OFF_ICON"])
+        self._screen_states = ScreenStates(resources)
 
         # Capture the screen and find the screen keyboard icon
         login_screen = display.grab()
@@ -53,7 +94,7 @@ class ScreenKeyboard(IKeyboard):
         if not screen_kb_icon:
             raise RuntimeError("Screen Keyboard icon not found")
         mouse.click(screen_kb_icon.center())
-        time.sleep(resources["SCREEN_TRANSITION_DELAY_S"])
+        self._clock.sleep(resources["SCREEN_TRANSITION_DELAY_S"])
 
     def type(self, text: str, char_delay_s: float = IKeyboard._CHAR_TYPE_DELAY_S) -> None:
         """
@@ -65,6 +106,10 @@ class ScreenKeyboard(IKeyboard):
         """
         self._screenshot = self._display.grab()
 
+        if self._cache_layout:
+            self._type_with_layout(text, char_delay_s)
+            return
+
         for char in text:
             if char in "#123456789":
                 mode_switcher_rec = self._is_letters_mode()
@@ -96,6 +141,119 @@ class ScreenKeyboard(IKeyboard):
 
         self._type_enter()
 
+    def _type_with_layout(self, text: str, char_delay_s: float) -> None:
+        """
+        Types a string of text by clicking key positions from the cached keyboard layout.
+
+        The whole text is planned first, with the fewest mode switches, shift and caps lock
+        clicks. The keys of a mode are located once, the first time the mode is used. Afterwards
+        the screen is only grabbed when a layout is missing or the layout check fails.
+
+        Args:
+            text (str): The text to type.
+            char_delay_s (float): The delay between typing each character.
+
+        Raises:
+            ValueError: If a character is not on the keyboard.
+            RuntimeError: If a needed key icon is not found.
+        """
+        mode = self._check_layout()
+
+        # The clicks are paced on a background thread, so a click takes no time of the gap after it
+        with InputQueue(self._resources.get(INPUT_MIN_GAP_KEY, 0.0), self._clock) as inputs:
+            # The ENTER key ends the text, typed like a newline in a mode showing it
+            for press in plan_keys(self._model, text + "\n", mode):
+                self._click_key(inputs, press.mode, press.key, char_delay_s if press.char else 0)
+            inputs.flush()
+
+    def _check_layout(self) -> str:
+        """
+        Detects the current keyboard mode and drops the cached layouts if the keyboard has moved.
+
+        The cheap check looks at the mode switcher only around its cached position: by its
+        fingerprint once it was seen in both modes, else by searching its icons there. A
+        full-screen search is done only when this check fails.
+
+        Returns:
+            str: The current keyboard mode, letters or numbers.
+        """
+        if self._switcher_rec:
+            region = self._around(self._switcher_rec)
+            state = self._screen_states.classify(self._screenshot, self._SWITCHER_STATES, region)
+            if state:
+                return self._SWITCHER_STATES[state]
+            for state, mode in self._SWITCHER_STATES.items():
+                icon = self._resources["SCREEN_KB"]["123" if mode == self._LETTERS_MODE else "ABC"]
+                rec = self._screenshot.find_image(icon, region)
+                if rec:
+                    self._screen_states.learn(state, self._screenshot, rec)
+                    return mode
+
+        # The keyboard is not where it was, so every cached mode layout is stale
+        self._layouts.clear()
+        self._switcher_rec = None
+
+        if self._is_numbers_mode():
+            return self._NUMBERS_MODE
+        return self._LETTERS_MODE
+
+    def _click_key(self, inputs: InputQueue, mode: str, key: str, char_delay_s: float = 0) -> None:
+        """
+        Queues a click on a key at its cached position, locating the mode layout first if needed.
+
+        Args:
+            inputs (InputQueue): The queue delivering the clicks.
+            mode (str): The keyboard mode the key belongs to.
+            key (str): The key name in `SCREEN_KB`.
+            char_delay_s (float, optional): The delay after clicking the key. Defaults to 0.
+
+        Raises:
+            RuntimeError: If the key icon is not found.
+        """
+        if mode not in self._layouts:
+            # The keys are located once the queued clicks switched to the mode
+            inputs.flush()
+            self._screenshot = self._display.grab()
+            self._layouts[mode] = self._locate_keys(mode)
+
+        rec = self._layouts[mode].get(key)
+        if not rec:
+            raise RuntimeError(f"{self._resources['SCREEN_KB'][key]} icon not found")
+        inputs.click(self._mouse, rec.center(), max(char_delay_s, self._TRANSITION_DELAY))
+
+    def _locate_keys(self, mode: str) -> Dict[str, Rectangle]:
+        """
+        Locates every key of a keyboard mode on the current screenshot in one batched search.
+
+        Keys whose icon file is not available are skipped.
+
+        Args:
+            mode (str): The keyboard mode to locate the keys for.
+
+        Returns:
+            Dict[str, Rectangle]: The rectangles bounding the found keys, by key name.
+        """
+        icons = {key: self._templates[icon] for key, icon in self._resources["SCREEN_KB"].items()
+                 if key.startswith(self._MODE_KEYS[mode]) and icon in self._templates}
+        layout = find_images(self._screenshot, icons, display=self._display, resolution=self._resolution)
+
+        if not self._switcher_rec:
+            self._switcher_rec = layout.get("123") or layout.get("ABC")
+        return layout
+
+    def _around(self, rec: Rectangle) -> Rectangle:
+        """
+        Returns the rectangle grown by the layout check margin on every side.
+
+        Args:
+            rec (Rectangle): The rectangle to grow.
+
+        Returns:
+            Rectangle: The grown rectangle.
+        """
+        margin = self._LAYOUT_CHECK_MARGIN_PX
+        return Rectangle([rec.p1.x - margin, rec.p1.y - margin, rec.p2.x + margin, rec.p2.y + margin])
+
     def _is_numbers_mode(self) -> Optional[Rectangle]:
         """
         Checks if the on-screen keyboard is in numbers mode.
@@ -126,7 +284,7 @@ class ScreenKeyboard(IKeyboard):
             mode_switcher_rec (Rectangle): The rectangle bounding the mode switcher icon.
         """
         self._mouse.click(mode_switcher_rec.center())
-        time.sleep(self._TRANSITION_DELAY)
+        self._clock.sleep(self._TRANSITION_DELAY)
 
     def _switch_to_shift(self) -> None:
         """
@@ -140,7 +298,7 @@ class ScreenKeyboard(IKeyboard):
         if not rec:
             raise RuntimeError("Left Shift icon not found")
         self._mouse.click(rec.center())
-        time.sleep(self._TRANSITION_DELAY)
+        self._clock.sleep(self._TRANSITION_DELAY)
 
     def _type_char(self, icon: str, char_delay_s: float) -> None:
         """
@@ -157,7 +315,7 @@ class ScreenKeyboard(IKeyboard):
         if not rec:
             raise RuntimeError(f"{icon} icon not found")
         self._mouse.click(rec.center())
-        time.sleep(max(char_delay_s, self._TRANSITION_DELAY))
+        self._clock.sleep(max(char_delay_s, self._TRANSITION_DELAY))
 
     def _type_enter(self) -> None:
         """
@@ -171,4 +329,4 @@ class ScreenKeyboard(IKeyboard):
         if not rec:
             raise RuntimeError("Enter icon not found")
         self._mouse.click(rec.center())
-        time.sleep(self._TRANSITION_DELAY)
+        self._clock.sleep(self._TRANSITION_DELAY)
@@ -0,0 +1,188 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+import cv2
+import numpy as np
+from aurora_tests.rectangle import Rectangle
+from screen_text import resource_folder, update_json_file
+from template_matcher import to_gray
+
+# Name of the learned screen states file written next to the resource images
+SCREEN_STATES_FILE_NAME = "screen_states.json"
+
+# Side of the grid a key region is shrunk to before hashing, giving a hash of this many squared bits
+HASH_SIZE = 16
+
+# Most differing hash bits of a key region still matching a learned state
+MAX_HASH_DISTANCE = 16
+
+# Pixels around a found target included in its key region
+_KEY_REGION_MARGIN_PX = 8
+
+# Most fingerprints kept per state, e.g. for a label over different backgrounds
+_MAX_SAMPLES = 4
+
+
+class ScreenStates:
+    """
+    Recognizes known screens by fingerprints of key regions, instead of searching them.
+
+    A state is learned from a screenshot it was identified on otherwise, e.g. by finding its
+    label with OCR: the fingerprint of the region around the found target is recorded with the
+    target position. Later screenshots are matched with one hash of that region. The states
+    are kept in a file next to the resource images, so per resource set and across test runs.
+    """
+
+    def __init__(self, resources: Dict, states_file: Optional[str] = None) -> None:
+        """
+        Initializes the screen states and loads the states learned in earlier runs.
+
+        Args:
+            resources (Dict): The resource values, used to locate the resource folder.
+            states_file (Optional[str], optional): The learned states file. Defaults to
+                SCREEN_STATES_FILE_NAME in the folder of the resource images.
+        """
+        self._states_file = states_file or os.path.join(resource_folder(resources), SCREEN_STATES_FILE_NAME)
+        try:
+            with open(self._states_file) as file:
+                self._states: Dict[str, List[Dict]] = json.load(file)
+        except (OSError, ValueError):
+            self._states = {}
+
+    def learn(self, state: str, screenshot: Any, rec: Rectangle) -> None:
+        """
+        Records the fingerprint of a state, unless the screenshot already matches it.
+
+        Args:
+            state (str): The state name, e.g. the text or image identifying the screen.
+            screenshot (Any): The screenshot the state was identified on.
+            rec (Rectangle): The rectangle bounding the found target identifying the state.
+        """
+        if self.locate(state, screenshot) is not None:
+            return
+        margin = _KEY_REGION_MARGIN_PX
+        region = [max(int(rec.p1.x) - margin, 0), max(int(rec.p1.y) - margin, 0),
+                  int(rec.p2.x) + margin, int(rec.p2.y) + margin]
+        fingerprint = region_hash(screenshot, region)
+        # A region with too little detail, e.g. a plain background, would match any other plain region
+        if fingerprint is None or bin(fingerprint).count("1") <= 2 * MAX_HASH_DISTANCE:
+            return
+
+        sample = {"region": region, "rect": [int(rec.p1.x), int(rec.p1.y), int(rec.p2.x), int(rec.p2.y)],
+                  "hash": f"{fingerprint:x}"}
+
+        def learn(states: Dict[str, List[Dict]]) -> None:
+            samples = states.setdefault(state, [])
+            if sample not in samples:
+                samples.append(sample)
+            del samples[:-_MAX_SAMPLES]
+
+        # Merged with the states other test processes learned meanwhile
+        self._states = update_json_file(self._states_file, learn)
+
+    def locate(self, state: str, screenshot: Any, region: Optional[Rectangle] = None) -> Optional[Rectangle]:
+        """
+        Checks whether a screenshot shows a state, and returns where its target is.
+
+        Args:
+            state (str): The state name.
+            screenshot (Any): The screenshot.
+            region (Optional[Rectangle], optional): The region the target must be in. Defaults to None.
+
+        Returns:
+            Optional[Rectangle]: The rectangle bounding the target of the state, or None if the
+                screenshot does not show the state.
+        """
+        sample = self._match(state, screenshot, region)
+        return Rectangle(sample["rect"]) if sample else None
+
+    def classify(self, screenshot: Any, states: Optional[Iterable[str]] = None,
+                 region: Optional[Rectangle] = None) -> Optional[str]:
+        """
+        Tells which state a screenshot shows.
+
+        Args:
+            screenshot (Any): The screenshot.
+            states (Optional[Iterable[str]], optional): The states to choose from. Defaults to all learned states.
+            region (Optional[Rectangle], optional): The region the targets of the states must be in. Defaults to None.
+
+        Returns:
+            Optional[str]: The closest matching state, or None if no state matches.
+        """
+        hashes: Dict[tuple, Optional[int]] = {}
+        best, best_distance = None, MAX_HASH_DISTANCE + 1
+        for state in (self._states if states is None else states):
+            sample = self._match(state, screenshot, region, hashes)
+            if sample and sample["distance"] < best_distance:
+                best, best_distance = state, sample["distance"]
+        return best
+
+    def _match(self, state: str, screenshot: Any, region: Optional[Rectangle],
+               hashes: Optional[Dict[tuple, Optional[int]]] = None) -> Optional[Dict]:
+        """
+        Finds the learned fingerprint of a state closest to a screenshot.
+
+        Args:
+            state (str): The state name.
+            screenshot (Any): The screenshot.
+            region (Optional[Rectangle]): The region the target must be in, or None.
+            hashes (Optional[Dict[tuple, Optional[int]]], optional): The hashes of the screenshot computed
+                so far, by key region, shared by the states of one classification. Defaults to None.
+
+        Returns:
+            Optional[Dict]: The matching sample with its hash distance, or None if no sample matches.
+        """
+        hashes = {} if hashes is None else hashes
+        best = None
+        for sample in self._states.get(state, []):
+            x1, y1, x2, y2 = sample["rect"]
+            if region and not (region.p1.x <= x1 and region.p1.y <= y1 and x2 <= region.p2.x and y2 <= region.p2.y):
+                continue
+            key = tuple(sample["region"])
+            if key not in hashes:
+                hashes[key] = region_hash(screenshot, sample["region"])
+            if hashes[key] is None:
+                continue
+            distance = bin(hashes[key] ^ int(sample["hash"], 16)).count("1")
+            if distance <= MAX_HASH_DISTANCE and (best is None or distance < best["distance"]):
+                best = dict(sample, distance=distance)
+        return best
+
+
+def region_hash(screenshot: Any, region: List[int]) -> Optional[int]:
+    """
+    Returns the difference hash of a region: whether each pixel of the shrunk region is brighter than its left neighbor.
+
+    Args:
+        screenshot (Any): A NumPy image array, or a screenshot keeping its captured frame in the `image` attribute.
+        region (List[int]): The (x1, y1, x2, y2) corners of the region.
+
+    Returns:
+        Optional[int]: The HASH_SIZE * HASH_SIZE bits of the hash, or None if the screenshot has no
+            frame or the region is outside of it.
+    """
+    image = screenshot if isinstance(screenshot, np.ndarray) else getattr(screenshot, "image", None)
+    if image is None:
+        return None
+    x1, y1, x2, y2 = region
+    crop = np.asarray(image)[max(y1, 0):y2, max(x1, 0):x2]
+    if crop.shape[0] < 2 or crop.shape[1] < 2:
+        return None
+
+    small = cv2.resize(to_gray(crop), (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
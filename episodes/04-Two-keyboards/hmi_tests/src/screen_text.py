@@ -0,0 +1,352 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import cv2
+import numpy as np
+from aurora_tests.rectangle import Rectangle
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Name of the learned text regions file written next to the resource images
+TEXT_REGIONS_FILE_NAME = "text_regions.json"
+
+_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+class TextRegions:
+    """
+    Learns where texts are found on the screen and searches there first.
+
+    Every text found by a full-screen search is recorded with its bounding rectangle in a
+    file next to the resource images, so the regions are kept per resource set and across
+    test runs. Later searches for the same text look in the learned region first and fall
+    back to the full screen when the text is not there.
+    """
+
+    _REGION_MARGIN_PX: int = 40
+
+    def __init__(self, resources: Dict, regions_file: Optional[str] = None) -> None:
+        """
+        Initializes the text regions and loads the regions learned in earlier runs.
+
+        Args:
+            resources (Dict): The resource values, used to locate the resource folder.
+            regions_file (Optional[str], optional): The learned regions file. Defaults to
+                TEXT_REGIONS_FILE_NAME in the folder of the resource images.
+        """
+        if regions_file is None:
+            regions_file = os.path.join(resource_folder(resources), TEXT_REGIONS_FILE_NAME)
+        self._regions_file = regions_file
+
+        try:
+            with open(regions_file) as file:
+                self._regions: Dict[str, List[int]] = json.load(file)
+        except (OSError, ValueError):
+            self._regions = {}
+
+    def find_text(self, screenshot: Any, text: str, region: Optional[Rectangle] = None) -> Optional[Rectangle]:
+        """
+        Finds a text on the screenshot, in its learned region first.
+
+        Args:
+            screenshot (Any): The screenshot to search.
+            text (str): The text to find.
+            region (Optional[Rectangle], optional): The region to search in. If given, only this
+                region is searched and nothing is learned. Defaults to None.
+
+        Returns:
+            Optional[Rectangle]: The rectangle bounding the found text, or None if not found.
+        """
+        if region:
+            return screenshot.find_text(text, region)
+
+        learned = self._regions.get(text)
+        if learned:
+            x1, y1, x2, y2 = learned
+            margin = self._REGION_MARGIN_PX
+            learned_region = Rectangle([max(x1 - margin, 0), max(y1 - margin, 0), x2 + margin, y2 + margin])
+            rec = screenshot.find_text(text, learned_region)
+            if rec:
+                return rec
+
+        rec = screenshot.find_text(text)
+        if rec:
+            self._learn(text, rec)
+        return rec
+
+    def _learn(self, text: str, rec: Rectangle) -> None:
+        """
+        Records the region of a found text and saves all learned regions.
+
+        Args:
+            text (str): The found text.
+            rec (Rectangle): The rectangle bounding the found text.
+        """
+        def learn(regions: Dict[str, List[int]]) -> None:
+            regions[text] = [int(rec.p1.x), int(rec.p1.y), int(rec.p2.x), int(rec.p2.y)]
+
+        self._regions = update_json_file(self._regions_file, learn)
+
+
+class OcrScreenshot:
+    """
+    A screenshot that runs OCR at most once and answers all text searches from the result.
+
+    The first text search recognizes all words on the screenshot with their bounding boxes.
+    Later searches, in any region, are in-memory lookups, and a text not among the recognized
+    words is not on the screenshot. Words the screenshot already knows, in its `recognized_lines`
+    attribute, e.g. those of a replayed frame, are used as they are.
+
+    Otherwise, without `pytesseract` or the Tesseract engine installed, every search uses the
+    wrapped screenshot's own `find_text` and its result is remembered. That one only finds
+    exact texts, so searches ignoring the case or for a substring find nothing.
+
+    All other attributes are those of the wrapped screenshot.
+    """
+
+    def __init__(self, screenshot: Any) -> None:
+        """
+        Wraps a screenshot.
+
+        Args:
+            screenshot (Any): The screenshot captured by the display.
+        """
+        self._screenshot = screenshot
+        self._lines: Optional[List[List[Tuple[str, Rectangle]]]] = None
+        self._found: Dict[tuple, Optional[Rectangle]] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._screenshot, name)
+
+    def find_text(self, text: str, region: Optional[Rectangle] = None,
+                  ignore_case: bool = False, substring: bool = False) -> Optional[Rectangle]:
+        """
+        Finds a text on the screenshot.
+
+        Args:
+            text (str): The text to find, one or more words.
+            region (Optional[Rectangle], optional): The region to search in. Defaults to the whole screenshot.
+            ignore_case (bool, optional): Whether to ignore the letter case. Defaults to False.
+            substring (bool, optional): Whether the text may be a part of a longer text on the screen,
+                e.g. "Connect" matching "Connected devices". Defaults to False.
+
+        Returns:
+            Optional[Rectangle]: The rectangle bounding the found text, or None if not found.
+        """
+        area = (region.p1.x, region.p1.y, region.p2.x, region.p2.y) if region else None
+        key = (text, area, ignore_case, substring)
+        if key not in self._found:
+            if self._lines is None and self._known_lines() is None and not ocr_available():
+                exact = not ignore_case and not substring
+                self._found[key] = self._screenshot.find_text(text, region) if exact else None
+            else:
+                self._found[key] = self._lookup(text, area, ignore_case, substring)
+        return self._found[key]
+
+    def _lookup(self, text: str, area: Optional[tuple], ignore_case: bool, substring: bool) -> Optional[Rectangle]:
+        """
+        Looks a text up among the recognized words, recognizing them on the first lookup.
+
+        Args:
+            text (str): The text to find.
+            area (Optional[tuple]): The (x1, y1, x2, y2) region to search in, or None for the whole screenshot.
+            ignore_case (bool): Whether to ignore the letter case.
+            substring (bool): Whether the text may be a part of a longer text.
+
+        Returns:
+            Optional[Rectangle]: The rectangle bounding the found words, or None if not found.
+        """
+        if self._lines is None:
+            known = self._known_lines()
+            self._lines = known if known is not None else recognize_lines(np.asarray(self._screenshot.image))
+        return find_in_lines(self._lines, text, area, ignore_case, substring)
+
+    def _known_lines(self) -> Optional[List[List[Tuple[str, Rectangle]]]]:
+        """Returns the words the wrapped screenshot already knows, or None if it knows none."""
+        return getattr(self._screenshot, "recognized_lines", None)
+
+
+@lru_cache(maxsize=None)
+def ocr_available() -> bool:
+    """
+    Tells whether texts can be recognized here.
+
+    Returns:
+        bool: True if `pytesseract` and the Tesseract engine are installed, False otherwise.
+    """
+    if pytesseract is None:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        return False
+    return True
+
+
+def recognize_lines(image: np.ndarray) -> List[List[Tuple[str, Rectangle]]]:
+    """
+    Recognizes all words on an image, grouped by text line.
+
+    Args:
+        image (np.ndarray): The BGR, BGRA or grayscale image.
+
+    Returns:
+        List[List[Tuple[str, Rectangle]]]: The words with their bounding boxes, line by line.
+            Empty if `pytesseract` or the Tesseract engine is not installed.
+    """
+    if pytesseract is None:
+        return []
+
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+
+    try:
+        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    except pytesseract.TesseractNotFoundError:
+        return []
+
+    lines: Dict[tuple, List[Tuple[str, Rectangle]]] = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        x, y, w, h = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
+        line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line, []).append((word.strip(), Rectangle([x, y, x + w, y + h])))
+    return list(lines.values())
+
+
+def find_in_lines(lines: List[List[Tuple[str, Rectangle]]], text: str, area: Optional[tuple] = None,
+                  ignore_case: bool = False, substring: bool = False) -> Optional[Rectangle]:
+    """
+    Finds a text among recognized words.
+
+    Args:
+        lines (List[List[Tuple[str, Rectangle]]]): The recognized words, line by line.
+        text (str): The text to find, one or more words.
+        area (Optional[tuple], optional): The (x1, y1, x2, y2) region to search in. Defaults to None,
+            meaning everywhere.
+        ignore_case (bool, optional): Whether to ignore the letter case. Defaults to False.
+        substring (bool, optional): Whether the text may be a part of a longer text. Defaults to False.
+
+    Returns:
+        Optional[Rectangle]: The rectangle bounding the found words, or None if not found.
+    """
+    query = text.split()
+    if ignore_case:
+        query = [word.lower() for word in query]
+
+    for line in lines:
+        words = [(word, rec) for word, rec in line
+                 if not area or (area[0] <= rec.p1.x and area[1] <= rec.p1.y and
+                                 rec.p2.x <= area[2] and rec.p2.y <= area[3])]
+        labels = [word.lower() if ignore_case else word for word, _ in words]
+
+        for start in range(len(labels) - len(query) + 1):
+            candidate = labels[start:start + len(query)]
+            if substring:
+                matched = " ".join(query) in " ".join(candidate)
+            else:
+                matched = candidate == query
+            if matched:
+                return _union([rec for _, rec in words[start:start + len(query)]])
+
+    return None
+
+
+def _union(recs: List[Rectangle]) -> Rectangle:
+    """Returns the rectangle bounding all given rectangles."""
+    return Rectangle([min(rec.p1.x for rec in recs), min(rec.p1.y for rec in recs),
+                      max(rec.p2.x for rec in recs), max(rec.p2.y for rec in recs)])
+
+
+def resource_folder(resources: Dict) -> str:
+    """
+    Returns the folder of the images referenced by the resources.
+
+    Args:
+        resources (Dict): The resource values.
+
+    Returns:
+        str: The common folder of the resource images, or the current folder if there are none.
+    """
+    folders = [os.path.dirname(value) for value in resources.values()
+               if isinstance(value, str) and value.lower().endswith(_IMAGE_EXTENSIONS)]
+    if not folders:
+        return "."
+    return os.path.commonpath(folders) or "."
+
+
+def update_json_file(json_file: str, update: Callable[[Dict], None]) -> Dict:
+    """
+    Updates a JSON file shared by test processes running at the same time, e.g. a learned file.
+
+    The file is read again and updated while holding an exclusive lock on `<json_file>.lock`, so
+    the changes written by other processes since it was loaded are kept. It is written next to
+    its final name and moved in place, so readers never see a partial file.
+
+    Args:
+        json_file (str): The file, holding a JSON object. It is created if missing or unreadable.
+        update (Callable[[Dict], None]): Changes the content read from the file in place.
+
+    Returns:
+        Dict: The content written, including the changes of other processes.
+    """
+    with _locked(json_file + ".lock"):
+        try:
+            with open(json_file) as file:
+                content = json.load(file)
+        except (OSError, ValueError):
+            content = {}
+        update(content)
+
+        folder = os.path.dirname(json_file) or "."
+        fd, temp_file = tempfile.mkstemp(dir=folder, prefix=os.path.basename(json_file))
+        with os.fdopen(fd, "w") as file:
+            json.dump(content, file, indent=4)
+        os.replace(temp_file, json_file)
+    return content
+
+
+@contextmanager
+def _locked(lock_file: str) -> Iterator[None]:
+    """Holds an exclusive lock on a lock file, waiting for other processes to release it."""
+    with open(lock_file, "a+") as file:
+        if fcntl:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(file, fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
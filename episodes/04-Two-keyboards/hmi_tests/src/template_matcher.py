@@ -0,0 +1,423 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple, Union
+import cv2
+import numpy as np
+from aurora_tests.rectangle import Rectangle
+
+# Minimal normalized correlation score for a template to count as found
+MATCH_THRESHOLD = 0.9
+
+# Templates smaller than this (in pixels, on either side) are not matched on the coarse pyramid level
+_MIN_COARSE_SIZE = 16
+
+# Coarse level hits scoring lower than this are not verified. Downscaling blurs thin
+# glyphs, so a true hit scores much lower on the coarse level than on the full resolution.
+_COARSE_MIN_SCORE = 0.4
+
+# Number of best coarse level hits verified on the full resolution level
+_COARSE_CANDIDATES = 16
+
+# Extra pixels around a coarse hit searched on the full resolution level
+_REFINE_MARGIN_PX = 4
+
+# Templates at least this large (in pixels, on both sides) are first matched on the quarter resolution level
+_MIN_FAST_SIZE = 32
+
+# Quarter level hits scoring lower than this are not refined
+_FAST_MIN_SCORE = 0.2
+
+# Number of best quarter level hits refined on the half resolution level
+_FAST_CANDIDATES = 4
+
+# Windows varying less than this share of the template's standard deviation cannot be a hit
+_FLAT_WINDOW_RATIO = 0.1
+
+# Resource folders are named after the display resolution their images were captured on, e.g. res_1920_1080
+_RESOLUTION_FOLDER = re.compile(r"res_(\d+)_(\d+)")
+
+# Factors of the expected scale searched, in order, while the scale of a display is not known
+_SCALE_STEPS = (1.0, 0.95, 1.05, 0.9, 1.1, 0.85, 1.15, 0.8, 1.25, 0.75, 1.33, 0.67, 1.5, 0.5, 2.0)
+
+# Resizing blurs thin glyphs, so templates matched at another scale may score this much lower than the
+# threshold. Different keyboard keys score up to 0.86 on each other (kb_i on kb_l), so the scaled
+# threshold is kept above that.
+_SCALED_THRESHOLD_MARGIN = 0.03
+
+# Scale of the templates found on each display, by display key
+_display_scales: Dict[Hashable, float] = {}
+
+
+class PreparedScreenshot:
+    """
+    A screenshot preprocessed once for matching many templates against it.
+
+    Holds the grayscale frame and its first two pyramid levels (half and quarter resolution).
+    """
+
+    def __init__(self, screenshot: Any) -> None:
+        """
+        Converts the screenshot to grayscale and builds the pyramid.
+
+        Args:
+            screenshot (Any): An AuroraTests screenshot or a NumPy image array.
+        """
+        self.gray = to_gray(screenshot_image(screenshot))
+        self.coarse = cv2.pyrDown(self.gray)
+        self.quarter = cv2.pyrDown(self.coarse)
+
+
+def screenshot_image(screenshot: Any) -> np.ndarray:
+    """
+    Returns the pixels of a screenshot as a NumPy array.
+
+    Args:
+        screenshot (Any): A NumPy image array, or an AuroraTests screenshot keeping its
+            captured frame in the `image` attribute.
+
+    Returns:
+        np.ndarray: The screenshot pixels.
+    """
+    if isinstance(screenshot, np.ndarray):
+        return screenshot
+    return np.asarray(screenshot.image)
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """
+    Converts a BGR, BGRA or grayscale image to grayscale.
+
+    Args:
+        image (np.ndarray): The image to convert.
+
+    Returns:
+        np.ndarray: The grayscale image.
+    """
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+@lru_cache(maxsize=None)
+def load_template(path: str) -> np.ndarray:
+    """
+    Reads and decodes a template image as grayscale. Each file is decoded only once.
+
+    Args:
+        path (str): The template image file.
+
+    Returns:
+        np.ndarray: The grayscale template.
+
+    Raises:
+        FileNotFoundError: If the template cannot be read.
+    """
+    template = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if template is None:
+        raise FileNotFoundError(f"Template {path} cannot be read")
+    return template
+
+
+def find_images(screenshot: Any, templates: Union[Dict[str, Union[str, np.ndarray]], Iterable[str]],
+                region: Optional[Rectangle] = None, threshold: float = MATCH_THRESHOLD,
+                display: Optional[Hashable] = None,
+                resolution: Optional[Tuple[int, int]] = None) -> Dict[str, Rectangle]:
+    """
+    Finds many templates on one screenshot, also when it has another resolution than the templates.
+
+    The screenshot is converted to grayscale and downscaled only once. Each template is
+    first matched on the downscaled frame and its best hits are then verified on the full
+    resolution frame in a small window around each of them. Large enough templates, e.g.
+    keyboard keys, are matched on the quarter resolution frame first.
+
+    Templates are scaled by the ratio of the screenshot size to the resolution they were
+    captured on. Until a template is found on a display, a pyramid of scales around that
+    ratio is searched, stopping at the first scale the template is found at. Once a template
+    also scores the full threshold at that scale, the scale is kept for the display, so later
+    searches on it match at that scale only. Templates captured on an unknown resolution are
+    matched at their own size only.
+
+    Args:
+        screenshot (Any): An AuroraTests screenshot, a NumPy image array or a PreparedScreenshot.
+        templates (Union[Dict[str, Union[str, np.ndarray]], Iterable[str]]): Template files or
+            grayscale templates by name, or template files used as their own names.
+        region (Optional[Rectangle], optional): The region to search in. Defaults to the whole screenshot.
+        threshold (float, optional): The minimal match score. Defaults to MATCH_THRESHOLD.
+        display (Optional[Hashable], optional): The display the screenshot was grabbed from, keeping
+            its template scale. Defaults to None, meaning the screenshot size.
+        resolution (Optional[Tuple[int, int]], optional): The width and height of the display the
+            templates were captured on. Defaults to None, meaning the resolution in the name of the
+            template folder, e.g. res_1920_1080, or the screenshot size if there is none.
+
+    Returns:
+        Dict[str, Rectangle]: The rectangles bounding the found templates, by name.
+            Templates that are not found are left out.
+    """
+    if not isinstance(templates, dict):
+        templates = {path: path for path in templates}
+
+    x0, y0 = (max(int(region.p1.x), 0), max(int(region.p1.y), 0)) if region else (0, 0)
+    if isinstance(screenshot, PreparedScreenshot):
+        frame_h, frame_w = screenshot.gray.shape
+        gray, coarse, quarter = screenshot.gray, screenshot.coarse, screenshot.quarter
+        if region:
+            gray = gray[y0:int(region.p2.y), x0:int(region.p2.x)]
+            coarse = coarse[y0 // 2:int(region.p2.y) // 2, x0 // 2:int(region.p2.x) // 2]
+            quarter = quarter[y0 // 4:int(region.p2.y) // 4, x0 // 4:int(region.p2.x) // 4]
+    else:
+        # Only the searched region is converted, from a view of the frame rather than a copy
+        image = screenshot_image(screenshot)
+        frame_h, frame_w = image.shape[:2]
+        gray = to_gray(image[y0:int(region.p2.y), x0:int(region.p2.x)] if region else image)
+        coarse = cv2.pyrDown(gray)
+        quarter = cv2.pyrDown(coarse)
+
+    if display is None:
+        display = (frame_w, frame_h)
+
+    found = {}
+    for name, template in templates.items():
+        captured_on = resolution
+        if not isinstance(template, np.ndarray):
+            captured_on = captured_on or template_resolution(template)
+            template = load_template(template)
+
+        scale = _display_scales.get(display)
+        if scale is not None:
+            scales: Iterable[float] = (scale,)
+        elif captured_on is None or captured_on == (frame_w, frame_h):
+            scales = (1.0,)
+        else:
+            expected = min(frame_w / captured_on[0], frame_h / captured_on[1])
+            scales = (expected * step for step in _SCALE_STEPS)
+
+        for scale in scales:
+            scaled = scale_template(template, scale)
+            hit = _match(gray, coarse, quarter, scaled,
+                         threshold if scaled is template else threshold - _SCALED_THRESHOLD_MARGIN)
+            if hit:
+                # A hit below the full threshold may be a similar looking template, so its scale is not kept
+                if scaled is template or _verify(gray, scaled, *hit, threshold):
+                    _display_scales[display] = scale
+                x, y = hit
+                h, w = scaled.shape
+                found[name] = Rectangle([x0 + x, y0 + y, x0 + x + w, y0 + y + h])
+                break
+
+    return found
+
+
+def template_resolution(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Returns the display resolution a template was captured on, from the name of its folder.
+
+    Args:
+        path (str): The template image file, e.g. "./res_1920_1080/kb_a.png".
+
+    Returns:
+        Optional[Tuple[int, int]]: The width and height, or None if the folder is not named after a resolution.
+    """
+    match = _RESOLUTION_FOLDER.search(os.path.dirname(path))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def scale_template(template: np.ndarray, scale: float) -> np.ndarray:
+    """
+    Resizes a template for matching on a display of another resolution.
+
+    Args:
+        template (np.ndarray): The grayscale template.
+        scale (float): The scale factor.
+
+    Returns:
+        np.ndarray: The resized template, or the template itself at scale 1.
+    """
+    if abs(scale - 1.0) < 1e-3:
+        return template
+    h, w = template.shape
+    size = (max(round(w * scale), 1), max(round(h * scale), 1))
+    return cv2.resize(template, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+
+def _match(gray: np.ndarray, coarse: np.ndarray, quarter: np.ndarray, template: np.ndarray,
+           threshold: float) -> Optional[Tuple[int, int]]:
+    """
+    Matches one template, coarse level first.
+
+    Large templates are first matched on the quarter level, see `_match_fast`. Otherwise, or
+    if that finds nothing, the best few hits on the coarse level are verified on the full
+    resolution frame. If none of them is verified, or the coarse level has no hit at all, the
+    whole full resolution frame is searched: thin glyphs and small icons may score low once
+    downscaled. Templates too small for the coarse level are matched on the full resolution frame only.
+
+    Args:
+        gray (np.ndarray): The grayscale frame.
+        coarse (np.ndarray): The frame at half resolution.
+        quarter (np.ndarray): The frame at quarter resolution.
+        template (np.ndarray): The grayscale template.
+        threshold (float): The minimal match score.
+
+    Returns:
+        Optional[Tuple[int, int]]: The top-left (x, y) of the match in the frame, or None if not found.
+    """
+    h, w = template.shape
+    if h > gray.shape[0] or w > gray.shape[1]:
+        return None
+    if min(h, w) < _MIN_COARSE_SIZE or h // 2 > coarse.shape[0] or w // 2 > coarse.shape[1]:
+        return _best(gray, template, threshold)
+
+    if min(h, w) >= _MIN_FAST_SIZE:
+        hit = _match_fast(gray, coarse, quarter, template, threshold)
+        if hit:
+            return hit
+
+    scores = cv2.matchTemplate(coarse, cv2.pyrDown(template), cv2.TM_CCOEFF_NORMED)
+    for _ in range(_COARSE_CANDIDATES):
+        _, score, _, (cx, cy) = cv2.minMaxLoc(scores)
+        if score < _COARSE_MIN_SCORE:
+            break
+
+        hit = _verify(gray, template, 2 * cx, 2 * cy, threshold)
+        if hit:
+            return hit
+
+        # Suppress this hit before looking at the next best one
+        scores[max(cy - h // 4, 0):cy + h // 4 + 1, max(cx - w // 4, 0):cx + w // 4 + 1] = -1
+
+    # No verified coarse hit, e.g. many similar looking keyboard keys or a template blurred
+    # beyond recognition by the downscaling, search the whole frame
+    return _best(gray, template, threshold)
+
+
+def _match_fast(gray: np.ndarray, coarse: np.ndarray, quarter: np.ndarray, template: np.ndarray,
+                threshold: float) -> Optional[Tuple[int, int]]:
+    """
+    Matches a large template on the quarter level, verifying only its best few hits.
+
+    Windows too flat to be a hit are left out using integral image sums. The best hits are
+    refined on the coarse level and verified on the full resolution frame in the order of
+    their coarse scores, as `_match` verifies its coarse hits. So a template shown once is
+    found at exactly the same position, at a fraction of the cost of a coarse level search.
+
+    Args:
+        gray (np.ndarray): The grayscale frame.
+        coarse (np.ndarray): The frame at half resolution.
+        quarter (np.ndarray): The frame at quarter resolution.
+        template (np.ndarray): The grayscale template.
+        threshold (float): The minimal match score.
+
+    Returns:
+        Optional[Tuple[int, int]]: The top-left (x, y) of the match in the frame, or None if none of
+            the best hits is verified.
+    """
+    half = cv2.pyrDown(template)
+    small = cv2.pyrDown(half)
+    h, w = small.shape
+    if h > quarter.shape[0] or w > quarter.shape[1]:
+        return None
+    scores = cv2.matchTemplate(quarter, small, cv2.TM_CCOEFF_NORMED)
+    scores[_flat_windows(quarter, small)] = -1
+
+    hits = []
+    for _ in range(_FAST_CANDIDATES):
+        _, score, _, (qx, qy) = cv2.minMaxLoc(scores)
+        if score < _FAST_MIN_SCORE:
+            break
+        scores[max(qy - h // 2, 0):qy + h // 2 + 1, max(qx - w // 2, 0):qx + w // 2 + 1] = -1
+
+        # Refine the hit on the coarse level, one quarter level pixel around it
+        left, top = max(2 * qx - 2, 0), max(2 * qy - 2, 0)
+        window = coarse[top:top + half.shape[0] + 4, left:left + half.shape[1] + 4]
+        if window.shape[0] >= half.shape[0] and window.shape[1] >= half.shape[1]:
+            _, score, _, (cx, cy) = cv2.minMaxLoc(cv2.matchTemplate(window, half, cv2.TM_CCOEFF_NORMED))
+            if score >= _COARSE_MIN_SCORE:
+                hits.append((score, left + cx, top + cy))
+
+    for _, cx, cy in sorted(hits, reverse=True):
+        hit = _verify(gray, template, 2 * cx, 2 * cy, threshold)
+        if hit:
+            return hit
+    return None
+
+
+def _flat_windows(image: np.ndarray, template: np.ndarray) -> np.ndarray:
+    """
+    Tells which windows of an image vary too little to match a template, from its integral images.
+
+    Args:
+        image (np.ndarray): The grayscale image.
+        template (np.ndarray): The grayscale template.
+
+    Returns:
+        np.ndarray: True for each too flat window, by its top-left position, shaped like the match scores.
+    """
+    h, w = template.shape
+    sums, squares = cv2.integral2(image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+    def window_sums(integral: np.ndarray) -> np.ndarray:
+        return integral[h:, w:] - integral[:-h, w:] - integral[h:, :-w] + integral[:-h, :-w]
+
+    # Both sides are scaled by the squared window size, so no division is needed
+    size = h * w
+    variances = window_sums(squares) * size - window_sums(sums) ** 2
+    return variances < (_FLAT_WINDOW_RATIO * template.std() * size) ** 2
+
+
+def _verify(gray: np.ndarray, template: np.ndarray, x: int, y: int, threshold: float) -> Optional[Tuple[int, int]]:
+    """
+    Verifies a coarse hit on the full resolution frame, in a small window around it.
+
+    Args:
+        gray (np.ndarray): The grayscale frame.
+        template (np.ndarray): The grayscale template.
+        x (int): The left of the hit on the full resolution frame.
+        y (int): The top of the hit on the full resolution frame.
+        threshold (float): The minimal match score.
+
+    Returns:
+        Optional[Tuple[int, int]]: The top-left (x, y) of the match in the frame, or None if not verified.
+    """
+    h, w = template.shape
+    left = max(x - _REFINE_MARGIN_PX, 0)
+    top = max(y - _REFINE_MARGIN_PX, 0)
+    window = gray[top:top + h + 2 * _REFINE_MARGIN_PX, left:left + w + 2 * _REFINE_MARGIN_PX]
+    if window.shape[0] < h or window.shape[1] < w:
+        return None
+    hit = _best(window, template, threshold)
+    return (left + hit[0], top + hit[1]) if hit else None
+
+
+def _best(image: np.ndarray, template: np.ndarray, threshold: float) -> Optional[Tuple[int, int]]:
+    """
+    Returns the top-left (x, y) of the best template match if it reaches the threshold.
+
+    Args:
+        image (np.ndarray): The grayscale image to search in.
+        template (np.ndarray): The grayscale template.
+        threshold (float): The minimal match score.
+
+    Returns:
+        Optional[Tuple[int, int]]: The match position, or None if the best score is below the threshold.
+    """
+    scores = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, loc = cv2.minMaxLoc(scores)
+    if score < threshold:
+        return None
+    return loc
@@ -0,0 +1,236 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import struct
+import tempfile
+from typing import Any, Dict, Iterator, Optional
+import cv2
+import numpy as np
+
+# Name of the decoded templates file written next to the resource images
+CACHE_FILE_NAME = ".templates.bin"
+
+_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# Offset of every template in the cache file is aligned to this many bytes
+_ALIGNMENT = 64
+
+# Stores already opened in this process, by cache file
+_opened: Dict[str, "TemplateStore"] = {}
+
+
+class TemplateStore:
+    """
+    Grayscale templates for all images referenced by a resource file, decoded only once.
+
+    The templates can be persisted in a single file that later sessions memory-map instead
+    of decoding the images again. Processes mapping the same file, e.g. pytest-xdist workers,
+    share its pages.
+    """
+
+    def __init__(self, templates: Dict[str, np.ndarray], sources: Optional[Dict[str, tuple]] = None) -> None:
+        """
+        Initializes the store.
+
+        Args:
+            templates (Dict[str, np.ndarray]): Grayscale templates by image path as written in the resources.
+            sources (Optional[Dict[str, tuple]], optional): Size and modification time of the image files
+                the templates were decoded from. Defaults to None, meaning unknown.
+        """
+        self._templates = templates
+        self._sources = sources
+
+    def __getitem__(self, path: str) -> np.ndarray:
+        return self._templates[path]
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._templates
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._templates)
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    @classmethod
+    def from_resources(cls, resources: Dict, cache_file: Optional[str] = None) -> "TemplateStore":
+        """
+        Returns the templates of all images referenced by the resources, including nested ones.
+
+        The cache file is used when it is up to date with the images, and is rewritten otherwise.
+        Images that do not exist are skipped.
+
+        Args:
+            resources (Dict): The resource values, e.g. the loaded res.json.
+            cache_file (Optional[str], optional): The cache file. Defaults to CACHE_FILE_NAME in the
+                folder of the resource images.
+
+        Returns:
+            TemplateStore: The template store.
+        """
+        paths = sorted({path for path in image_paths(resources) if os.path.isfile(path)})
+        if cache_file is None:
+            cache_file = default_cache_file(paths)
+
+        store = _opened.get(cache_file)
+        if store is not None and store._is_current(paths):
+            return store
+
+        store = cls.load(cache_file)
+        if store is None or not store._is_current(paths):
+            store = cls({path: _decode(path) for path in paths})
+            store.save(cache_file)
+
+        _opened[cache_file] = store
+        return store
+
+    @classmethod
+    def load(cls, cache_file: str) -> Optional["TemplateStore"]:
+        """
+        Memory-maps the templates from a cache file.
+
+        Args:
+            cache_file (str): The cache file.
+
+        Returns:
+            Optional[TemplateStore]: The template store, or None if the file does not exist or cannot be read.
+        """
+        try:
+            with open(cache_file, "rb") as file:
+                header_size, = struct.unpack("<Q", file.read(8))
+                header = json.loads(file.read(header_size))
+            blob = np.memmap(cache_file, dtype=np.uint8, mode="r")
+        except (OSError, ValueError, struct.error):
+            return None
+
+        data_start = _aligned(8 + header_size)
+        templates = {}
+        for path, entry in header.items():
+            shape = tuple(entry["shape"])
+            start = data_start + entry["offset"]
+            templates[path] = blob[start:start + int(np.prod(shape))].reshape(shape)
+
+        sources = {path: tuple(entry["source"]) for path, entry in header.items()}
+        return cls(templates, sources)
+
+    def save(self, cache_file: str) -> None:
+        """
+        Writes the templates into a single cache file.
+
+        The file is written next to its final name first and then moved in place, so readers
+        never see a partially written file.
+
+        Args:
+            cache_file (str): The cache file.
+        """
+        self._sources = {path: _source_stamp(path) for path in self._templates}
+
+        # Offsets are relative to the aligned end of the header
+        header = {}
+        offset = 0
+        for path, template in self._templates.items():
+            header[path] = {"shape": template.shape, "offset": offset, "source": self._sources[path]}
+            offset += _aligned(template.nbytes)
+        header_bytes = json.dumps(header).encode()
+        data_start = _aligned(8 + len(header_bytes))
+
+        folder = os.path.dirname(cache_file) or "."
+        fd, temp_file = tempfile.mkstemp(dir=folder, prefix=os.path.basename(cache_file))
+        with os.fdopen(fd, "wb") as file:
+            file.write(struct.pack("<Q", len(header_bytes)))
+            file.write(header_bytes)
+            for path, template in self._templates.items():
+                file.seek(data_start + header[path]["offset"])
+                file.write(np.ascontiguousarray(template).tobytes())
+        os.replace(temp_file, cache_file)
+
+    def _is_current(self, paths: list) -> bool:
+        """
+        Checks that the store holds exactly the given images, unchanged since they were decoded.
+
+        Args:
+            paths (list): The image paths.
+
+        Returns:
+            bool: True if the store is up to date, False otherwise.
+        """
+        if self._sources is None or sorted(self._sources) != paths:
+            return False
+        return all(self._sources[path] == _source_stamp(path) for path in paths)
+
+
+def image_paths(resources: Any) -> Iterator[str]:
+    """
+    Yields all image paths referenced by the resources, walking nested dicts and lists.
+
+    Args:
+        resources (Any): The resource values.
+
+    Yields:
+        str: An image path.
+    """
+    if isinstance(resources, dict):
+        for value in resources.values():
+            yield from image_paths(value)
+    elif isinstance(resources, list):
+        for value in resources:
+            yield from image_paths(value)
+    elif isinstance(resources, str) and resources.lower().endswith(_IMAGE_EXTENSIONS):
+        yield resources
+
+
+def default_cache_file(paths: list) -> str:
+    """
+    Returns the cache file in the folder of the resource images.
+
+    Args:
+        paths (list): The image paths.
+
+    Returns:
+        str: The cache file.
+    """
+    folder = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else "."
+    return os.path.join(folder or ".", CACHE_FILE_NAME)
+
+
+def _decode(path: str) -> np.ndarray:
+    """
+    Decodes an image as a contiguous grayscale array.
+
+    Args:
+        path (str): The image file.
+
+    Returns:
+        np.ndarray: The grayscale image.
+
+    Raises:
+        FileNotFoundError: If the image cannot be read.
+    """
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise FileNotFoundError(f"Image {path} cannot be read")
+    return np.ascontiguousarray(image)
+
+
+def _source_stamp(path: str) -> tuple:
+    """Returns the size and modification time of an image file."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _aligned(size: int) -> int:
+    """Rounds a size up to the cache file alignment."""
+    return -(-size // _ALIGNMENT) * _ALIGNMENT
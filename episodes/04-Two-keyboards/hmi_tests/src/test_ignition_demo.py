@@ -13,139 +13,113 @@
 # limitations under the License.
 
 import subprocess
-import time
-from typing import Optional
-from aurora_tests.point import Point
-from aurora_tests.rectangle import Rectangle
+from typing import Iterator, Optional
+import pytest
 from aurora_tests.pytest.fixtures import display, mouse, keyboard, resources
+from clock import clock
+from flow import Click, Expect, Find, FlowEngine, Sleep, Type
+from ignition_app import IgnitionApp, is_last_test_using
+from replay import record_session
 from screen_keyboard import ScreenKeyboard
+from screen_text import TextRegions
+from screen_waits import wait_for_text
+from step_profiler import step_profile
 
 
 # Function that handles the logic for interacting with the login screen
 def login_logic(display, mouse, keyboard, resources):
-    # Capture the current screen display
-    login_screen = display.grab()
-
-    # Find the "Username" field on the login screen
-    username_rect = login_screen.find_text("Username")
-    assert username_rect, "Username input text box not found"
-    # Click below the username text to place the cursor in the input box
-    mouse.click(username_rect.p2 + Point(0, 30))
-
-    # Wait for the screen to update after the click
-    time.sleep(resources["SCREEN_TRANSITION_DELAY_S"])
-
-    # Type the username using the provided keyboard
-    keyboard.type(resources["LOGIN_USER"])
-
-    # Find the "Password" field on the login screen
-    password_rect = login_screen.find_text("Password")
-    assert password_rect, "Password input text box not found"
-    # Click below the password text to place the cursor in the input box
-    mouse.click(password_rect.p2 + Point(0, 30))
-
-    # Wait for the screen to update
-    time.sleep(resources["SCREEN_TRANSITION_DELAY_S"])
-
-    # Type the password using the provided keyboard
-    keyboard.type(resources["LOGIN_PASSWORD"])
-
-    # Find the login button image
-    login_screen = display.grab()
-    login_rect = login_screen.find_image(resources["LOGIN_BTN_ICON"])
-    assert login_rect, "Login button not found"
-    # Click the center of the login button to submit the login form
-    mouse.click(login_rect.center())
-
-    # Wait for the login process to complete
-    time.sleep(resources["LOGIN_DELAY_S"])
+    FlowEngine(display, resources, click=mouse.click, keyboard=keyboard).run([
+        # Find the "Username" field, and click below it to place the cursor in the input box
+        Find(text="Username", name="login_screen", message="Username input text box not found"),
+        Click(offset=(0, 30)),
+        # Wait for the input box to take the focus, then type the username
+        Sleep(resources["SCREEN_TRANSITION_DELAY_S"]),
+        Type(resources["LOGIN_USER"]),
+        # Find the "Password" field on the same screen, OCR-ing it only once for both fields
+        Find(text="Password", on="login_screen", message="Password input text box not found"),
+        Click(offset=(0, 30)),
+        Sleep(resources["SCREEN_TRANSITION_DELAY_S"]),
+        Type(resources["LOGIN_PASSWORD"]),
+        # Click the login button to submit the login form
+        Find(image=resources["LOGIN_BTN_ICON"], message="Login button not found"),
+        Click(),
+        # Wait for the login process to complete, until the main screen shows its "Empty" tab
+        Expect(text="Empty", timeout_s=resources["LOGIN_DELAY_S"], message="Main screen not shown after login"),
+    ])
 
 
 # Function that handles the logic for the Hello World feature
 def hello_world(display, mouse, resources):
-    # Capture the current screen display
-    main_screen = display.grab()
-
-    # Find and click the "Empty" tab
-    empty_tab = main_screen.find_text("Empty")
-    assert empty_tab, "Empty tab not found"
-    mouse.click(empty_tab.center())
-
-    # Wait for the screen transition to complete
-    time.sleep(resources["SCREEN_TRANSITION_DELAY_S"])
-    main_screen = display.grab()  # Refresh the screen capture
-
-    # Find and click the "Say Hello" button
-    hello_btn = main_screen.find_text("Say Hello")
-    assert hello_btn, "Hello button not found"
-    mouse.click(hello_btn.center())
-
-    # Wait for the screen transition to complete
-    time.sleep(resources["SCREEN_TRANSITION_DELAY_S"])
-    main_screen = display.grab()  # Refresh the screen capture
-
-    # Verify that the "Hello World" text appears on the screen
-    hello_hmi = main_screen.find_text("Hello World")
-    assert hello_hmi, "Hello World text not found"
+    FlowEngine(display, resources, click=mouse.click).run([
+        # Find and click the "Empty" tab
+        Find(text="Empty", message="Empty tab not found"),
+        Click(),
+        # Wait for the screen transition to complete and click the "Say Hello" button
+        Expect(text="Say Hello", message="Hello button not found"),
+        Click(),
+        # Verify that the "Hello World" text appears on the screen once the transition completes
+        Expect(text="Hello World", message="Hello World text not found"),
+    ])
 
 
 # Function that handles the application exit logic
 def exit_logic(display, mouse, resources):
-    # Capture the current screen display
-    main_screen = display.grab()
+    FlowEngine(display, resources, click=mouse.click).run([
+        # Navigate to the Command menu to exit the application
+        Find(text="Command", message="Command menu not found"),
+        Click(),
+        # Find and click the "Exit" command to close the application
+        Expect(text="Exit", region="COMMAND_MENU_RECTANGLE", message="Exit command not found"),
+        Click(),
+        # Wait for the application to fully exit
+        Sleep(resources["APP_EXIT_DELAY_S"]),
+    ])
 
-    # Navigate to the Command menu to exit the application
-    command_menu = main_screen.find_text("Command")
-    assert command_menu, "Command menu not found"
-    mouse.click(command_menu.center())
 
-    # Wait for the screen transition to complete
-    time.sleep(resources["SCREEN_TRANSITION_DELAY_S"])
-    main_screen = display.grab()  # Refresh the screen capture
+# Start the Ignition HMI application
+def start_hmi_app(display, resources):
+    app_start_args = resources["APP_START_ARGS"]
+    subprocess.run(app_start_args)
+    # Wait for the application to fully start, until its login screen is shown
+    login_screen_shown = wait_for_text(display, "Username", resources["APP_START_DELAY_S"],
+                                       text_regions=TextRegions(resources))
+    assert login_screen_shown, "Login screen not shown after the application start"
 
-    # Find and click the "Exit" command to close the application
-    try:
-        command_menu_rectangle = Rectangle(resources["COMMAND_MENU_RECTANGLE"])
-    except:
-        command_menu_rectangle = None
 
-    exit_command = main_screen.find_text("Exit", command_menu_rectangle)
-    assert exit_command, "Exit command not found"
-    mouse.click(exit_command.center())
+# Kill the Ignition HMI application wherever it was launched from, e.g. when it is stuck on a dialog
+def kill_hmi_app(resources):
+    application = next(arg for arg in resources["APP_START_ARGS"] if arg.startswith("application="))
+    subprocess.run(["pkill", "-f", application])
 
-    # Wait for the application to fully exit
-    time.sleep(resources["APP_EXIT_DELAY_S"])
 
-
-# Start the Ignition HMI application
-def start_hmi_app(resources):
-    app_start_args = resources["APP_START_ARGS"]
-    subprocess.run(app_start_args)
-    # Wait for the application to fully start
-    time.sleep(resources["APP_START_DELAY_S"])
+# The Ignition HMI application on its login screen, launched by the first test using it
+@pytest.fixture
+def ignition_app(request, display, mouse, resources) -> Iterator[IgnitionApp]:
+    app = IgnitionApp(display, mouse, resources,
+                      start=lambda: start_hmi_app(display, resources),
+                      exit=lambda: exit_logic(display, mouse, resources),
+                      kill=lambda: kill_hmi_app(resources))
+    # Reuse the running application, logged out, instead of launching it again
+    app.show_login_screen()
+    yield app
+    # Exit the application after the last test of the session using it
+    if is_last_test_using(request, "ignition_app"):
+        app.exit()
 
 
 # Test scenario using a physical keyboard for login and main screen actions
-def test_hello_world_physical_keyboard(display, mouse, keyboard, resources):
-    # Start the Ignition HMI application
-    start_hmi_app(resources)
-
+def test_hello_world_physical_keyboard(display, mouse, keyboard, resources, ignition_app):
     # Use the provided physical keyboard for this test
     used_keyboard = keyboard
 
     login_logic(display, mouse, used_keyboard, resources)
     hello_world(display, mouse, resources)
-    exit_logic(display, mouse, resources)
 
 
 # Test scenario using a screen keyboard for login and main screen actions
-def test_hello_world_screen_keyboard(display, mouse, resources):
-    # Start the Ignition HMI application
-    start_hmi_app(resources)
-
+def test_hello_world_screen_keyboard(display, mouse, resources, ignition_app):
     # Use a ScreenKeyboard instance for this test
     used_keyboard = ScreenKeyboard(display, mouse, resources)
 
     login_logic(display, mouse, used_keyboard, resources)
     hello_world(display, mouse, resources)
-    exit_logic(display, mouse, resources)
@@ -0,0 +1,77 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from bt_connectiviy_tester import BtConnectivityTester
+from replay import Replay, ReplayButton, ReplayDisplay, ReplayTouches
+
+# Device constants for easy reference
+DEV_HU = "HeadUnit"  # Represents the Head Unit device
+DEV_PH = "Phone"     # Represents the Phone device
+
+# Button names of the devices, as in the config file
+BUTTONS = ("HOME", "BACK", "POWER", "ENTER", *"0123456789")
+
+
+def tester(replay: Replay, resources: dict, device: str) -> BtConnectivityTester:
+    """Returns a BtConnectivityTester on a replay of a device."""
+    return BtConnectivityTester(
+        display=ReplayDisplay(replay),
+        touches=ReplayTouches(replay),
+        buttons={name: ReplayButton(replay, name) for name in BUTTONS},
+        resources=resources,
+        device=device
+    )
+
+
+@pytest.mark.parametrize("device", [DEV_HU, DEV_PH])
+def bench_open_connected_devices(replay_of, run_replayed, device_resources, device):
+    replay = replay_of("test_pair_new_device", device)
+    device_tester = tester(replay, device_resources[device], device)
+
+    run_replayed(replay, "BtConnectivityTester.open_app",
+                 lambda: device_tester.open_app("Settings") and device_tester.open_settings_menu("Connected devices"))
+
+
+def bench_unlock(replay_of, run_replayed, device_resources):
+    replay = replay_of("test_pair_new_device", DEV_PH)
+    phone = tester(replay, device_resources[DEV_PH], DEV_PH)
+
+    run_replayed(replay, "BtConnectivityTester.unlock", lambda: phone.unlock("2211"))
+
+
+def bench_request_to_pair(replay_of, run_replayed, device_resources):
+    replay = replay_of("test_pair_new_device", DEV_PH)
+    phone = tester(replay, device_resources[DEV_PH], DEV_PH)
+
+    run_replayed(replay, "BtConnectivityTester.request_to_pair", lambda: phone.request_to_pair("Head Unit"))
+
+
+@pytest.mark.parametrize("device", [DEV_HU, DEV_PH])
+def bench_accept_to_pair(replay_of, run_replayed, device_resources, device):
+    replay = replay_of("test_pair_new_device", device)
+    device_tester = tester(replay, device_resources[device], device)
+
+    run_replayed(replay, "BtConnectivityTester.accept_to_pair", device_tester.accept_to_pair)
+
+
+@pytest.mark.parametrize("device, test", [(DEV_HU, "test_forget_device_hu"), (DEV_PH, "test_forget_device_phone")])
+def bench_forget_device(replay_of, run_replayed, device_resources, device, test):
+    replay = replay_of(test, device)
+    device_tester = tester(replay, device_resources[device], device)
+
+    run_replayed(replay, "BtConnectivityTester.forget_device", device_tester.forget_device)
@@ -0,0 +1,73 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from typing import Dict, List, Optional, Tuple
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import numpy as np
+from template_matcher import (MATCH_THRESHOLD, PreparedScreenshot, _MIN_FAST_SIZE, _best, _match_fast,
+                              load_template)
+
+# Device constants for easy reference
+DEV_HU = "HeadUnit"  # Represents the Head Unit device
+DEV_PH = "Phone"     # Represents the Phone device
+
+# Timed runs of every benchmark
+ROUNDS = 5
+
+
+def fast_templates(resources: Dict) -> Dict[str, np.ndarray]:
+    """Returns the resource images large enough to be matched on the quarter level, by file."""
+    files = [value for value in resources.values() if isinstance(value, str) and value.endswith(".png")]
+    templates = {file: load_template(file) for file in files if os.path.isfile(file)}
+    return {file: template for file, template in templates.items() if min(template.shape) >= _MIN_FAST_SIZE}
+
+
+def hit_rectangle(hit: Optional[Tuple[int, int]], template: np.ndarray) -> Tuple[int, ...]:
+    """Returns the (x1, y1, x2, y2) rectangle of a hit, or an empty tuple for no hit."""
+    if hit is None:
+        return ()
+    h, w = template.shape
+    return hit[0], hit[1], hit[0] + w, hit[1] + h
+
+
+@pytest.mark.parametrize("matcher", ["_match_fast", "_best"])
+@pytest.mark.parametrize("device, test", [(DEV_HU, "test_forget_device_hu"), (DEV_PH, "test_forget_device_phone")])
+def bench_match_templates(replay_of, device_resources, benchmark, device, test, matcher):
+    replay = replay_of(test, device)
+    screens = [PreparedScreenshot(image) for image in replay.images().values()]
+    templates = fast_templates(device_resources[device])
+
+    def fast() -> List[Tuple[int, ...]]:
+        return [hit_rectangle(_match_fast(screen.gray, screen.coarse, screen.quarter, template, MATCH_THRESHOLD),
+                              template) for screen in screens for template in templates.values()]
+
+    def full() -> List[Tuple[int, ...]]:
+        return [hit_rectangle(_best(screen.gray, template, MATCH_THRESHOLD), template)
+                for screen in screens for template in templates.values()]
+
+    if matcher == "_best":
+        benchmark.pedantic(full, rounds=ROUNDS)
+        return
+
+    # A hit of the quarter level search is the hit of the full resolution search. Without one,
+    # `_match` goes on with the coarse level, so a miss is allowed but counted
+    fast_hits, full_hits = benchmark.pedantic(fast, rounds=ROUNDS), full()
+    for fast_hit, full_hit in zip(fast_hits, full_hits):
+        assert not fast_hit or fast_hit == full_hit
+    benchmark.extra_info["fast_hits"] = sum(1 for hit in fast_hits if hit)
+    benchmark.extra_info["full_hits"] = sum(1 for hit in full_hits if hit)
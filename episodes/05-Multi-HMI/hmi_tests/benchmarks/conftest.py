@@ -0,0 +1,120 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import statistics
+import sys
+from typing import Any, Callable, Dict, Iterator, Optional
+
+HMI_TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HMI_TESTS_DIR, "src"))
+
+import pytest
+from clock import VirtualClock, set_default_clock
+from replay import Replay
+
+# Folder of the recordings, as written with HMI_RECORD_DIR=benchmarks/recordings from the hmi_tests folder
+RECORDINGS_DIR = os.path.join(HMI_TESTS_DIR, "benchmarks", "recordings")
+
+# Folder of the synthetic recordings drawn from the resource images, replayed when a test is not recorded
+SYNTHETIC_DIR = os.path.join(HMI_TESTS_DIR, "benchmarks", "synthetic")
+
+# Resource files the recordings were made with, by device name
+RES_FILES = {
+    "HeadUnit": "res_hu/res.json",
+    "Phone": "res_phone/res.json",
+}
+
+# Timed runs of every benchmark, after one warm-up run
+ROUNDS = 5
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch) -> Iterator[VirtualClock]:
+    """
+    Virtual time also running with the real time, set as the default clock of the helpers.
+
+    The resource paths are resolved from the hmi_tests folder as in the tests.
+    """
+    monkeypatch.chdir(HMI_TESTS_DIR)
+    clock = VirtualClock(real_time=True)
+    previous = set_default_clock(clock)
+    yield clock
+    set_default_clock(previous)
+
+
+@pytest.fixture
+def device_resources() -> Dict[str, Dict]:
+    """The resources the recordings were made with, by device name."""
+    resources = {}
+    for device, res_file in RES_FILES.items():
+        with open(os.path.join(HMI_TESTS_DIR, res_file)) as file:
+            resources[device] = json.load(file)
+    return resources
+
+
+@pytest.fixture
+def replay_of(clock) -> Callable[..., Replay]:
+    """
+    Returns the replay of a recorded test, skipping the benchmark if the test is not recorded.
+
+    A recording of a real test run is replayed in place of the synthetic one.
+    """
+    def replay_of(test: str, device: str) -> Replay:
+        for recordings in (RECORDINGS_DIR, SYNTHETIC_DIR):
+            folder = os.path.join(recordings, test, device)
+            if os.path.isdir(folder):
+                return Replay(folder, clock)
+        pytest.skip(f"{test} is not recorded for {device}")
+
+    return replay_of
+
+
+@pytest.fixture
+def run_replayed(benchmark, clock) -> Callable[..., None]:
+    """
+    Returns a function benchmarking a helper on a replay, starting every round where the helper was recorded.
+
+    The function takes the replay, the helper name as in the recorded stacks, the helper call,
+    and optionally a call preparing what the helper call takes. Besides the computing time
+    measured by pytest-benchmark, the mean time slept and the mean time the helper would take on the device
+    are stored in the extra info of the benchmark.
+    """
+    def run_replayed(replay: Replay, step: str, helper: Callable[..., Any],
+                     prepare: Optional[Callable[[], Any]] = None) -> None:
+        try:
+            replay.rewind(step)
+        except ValueError as error:
+            pytest.skip(str(error))
+
+        prepared, slept, device = [], [], []
+
+        def setup() -> None:
+            prepared[:] = [prepare()] if prepare else []
+            replay.rewind(step)
+
+        def round_() -> None:
+            slept_s, start_s = clock.slept_s, clock.monotonic()
+            helper(*prepared)
+            slept.append(clock.slept_s - slept_s)
+            device.append(clock.monotonic() - start_s)
+
+        benchmark.pedantic(round_, setup=setup, rounds=ROUNDS, warmup_rounds=1)
+        assert not replay.divergences, f"Replay of {step} diverged: {replay.divergences}"
+
+        benchmark.extra_info["slept_s"] = statistics.mean(slept)
+        benchmark.extra_info["device_s"] = statistics.mean(device)
+
+    return run_replayed
@@ -0,0 +1,453 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Writes the synthetic recordings replayed by the benchmarks when a test is not recorded.
+
+The tests are run against a simulated Head Unit and Phone drawn from the resource images, and
+recorded as with HMI_RECORD_DIR. The words drawn on every screen are stored with the recording,
+so the benchmarks run without devices and without Tesseract: texts are looked up among the
+stored words, and the time OCR takes is not part of the results. Run it with the packages of
+the tests installed:
+    python benchmarks/make_synthetic_recordings.py
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+
+HMI_TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(HMI_TESTS_DIR, "src")
+sys.path.insert(0, SRC_DIR)
+
+import test_pair_new_device
+from aurora_tests.rectangle import Rectangle
+from clock import VirtualClock, set_default_clock
+from frame_screenshot import FrameScreenshot
+from replay import Recorder
+from step_profiler import helper_stack
+from test_forget_device import test_forget_device_hu, test_forget_device_phone
+
+# Folder of the synthetic recordings, next to the recordings of real test runs
+SYNTHETIC_DIR = os.path.join(HMI_TESTS_DIR, "benchmarks", "synthetic")
+
+# Device constants, as in the tests
+DEV_HU = "HeadUnit"
+DEV_PH = "Phone"
+
+# Resource folders, screen sizes and Bluetooth names of the simulated devices
+RES_FOLDERS = {DEV_HU: "res_hu", DEV_PH: "res_phone"}
+SCREEN_SIZES = {DEV_HU: (1920, 1080), DEV_PH: (720, 1600)}
+BT_NAMES = {DEV_HU: "Head Unit", DEV_PH: "moto e13"}
+
+# Button names of the devices, as in the config file
+BUTTONS = ("HOME", "BACK", "POWER", "ENTER", *"0123456789")
+
+# Apps on the pages of the home screen, and the items of the Settings app
+HOME_PAGES = (("Phone", "Messages", "Camera", "Photos"), ("Clock", "Files", "Settings"))
+SETTINGS_ITEMS = ("Network & internet", "Connected devices", "Apps", "Notifications", "Battery", "Display")
+
+# Time a simulated device takes to show the next screen after an input, in seconds
+TRANSITION_S = 0.4
+
+# Time a simulated device takes to scroll a list by one swipe, in seconds
+SCROLL_S = 0.2
+
+# Time the Phone takes to show the Home screen after the PIN was entered, in seconds
+UNLOCK_TIME_S = 0.8
+
+# Time a simulated device takes to find the devices available for pairing, in seconds
+SCAN_TIME_S = 1.0
+
+# Colors of the drawn screens, in BGR
+BACKGROUND_COLOR = (250, 250, 251)
+LOCKED_COLOR = (0, 0, 0)
+FOOTER_COLOR = (240, 240, 240)
+POPUP_COLOR = (225, 220, 215)
+TEXT_COLOR = (40, 40, 40)
+LOCKED_TEXT_COLOR = (230, 230, 230)
+
+# Font of the drawn texts
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 1.0
+FONT_THICKNESS = 2
+
+# Left edge, top and spacing of the drawn list items, in pixels
+LIST_X = 80
+LIST_Y = 200
+LIST_STEP_PX = 120
+
+
+class Screen:
+    """A drawn screen, with the words drawn on it and the rectangles of its clickable parts."""
+
+    def __init__(self, size: Tuple[int, int], color: Tuple[int, int, int] = BACKGROUND_COLOR) -> None:
+        width, height = size
+        self.image = np.full((height, width, 3), color, dtype=np.uint8)
+        self.lines: List[List[Tuple[str, Rectangle]]] = []
+        self.targets: Dict[str, Rectangle] = {}
+
+    def fill(self, x1: int, y1: int, x2: int, y2: int, color: Tuple[int, int, int]) -> None:
+        """Fills a rectangle with a color."""
+        self.image[y1:y2, x1:x2] = color
+
+    def text(self, text: str, x: int, y: int, color: Tuple[int, int, int] = TEXT_COLOR) -> Rectangle:
+        """
+        Draws a text on one line, keeping the bounding box of every word, and makes it clickable.
+
+        Args:
+            text (str): The text, one or more words.
+            x (int): The left edge of the text.
+            y (int): The baseline of the text.
+            color (Tuple[int, int, int], optional): The text color. Defaults to TEXT_COLOR.
+
+        Returns:
+            Rectangle: The rectangle bounding the text.
+        """
+        space = cv2.getTextSize(" ", FONT, FONT_SCALE, FONT_THICKNESS)[0][0]
+        line = []
+        for word in text.split():
+            (width, height), baseline = cv2.getTextSize(word, FONT, FONT_SCALE, FONT_THICKNESS)
+            cv2.putText(self.image, word, (x, y), FONT, FONT_SCALE, color, FONT_THICKNESS, cv2.LINE_AA)
+            line.append((word, Rectangle([x, y - height, x + width, y + baseline])))
+            x += width + space
+        self.lines.append(line)
+        rec = Rectangle([line[0][1].p1.x, line[0][1].p1.y, line[-1][1].p2.x, line[-1][1].p2.y])
+        self.targets[text] = rec
+        return rec
+
+    def paste(self, image_file: str, x: int, y: int, name: str) -> Rectangle:
+        """
+        Draws a resource image and makes it clickable.
+
+        Args:
+            image_file (str): The resource image, relative to the working folder.
+            x (int): The left edge of the image on the screen.
+            y (int): The top edge of the image on the screen.
+            name (str): The name of the clicked target.
+
+        Returns:
+            Rectangle: The rectangle bounding the image.
+        """
+        image = cv2.imread(image_file, cv2.IMREAD_COLOR)
+        height, width = image.shape[:2]
+        self.image[y:y + height, x:x + width] = image
+        self.targets[name] = Rectangle([x, y, x + width, y + height])
+        return self.targets[name]
+
+
+class SimulatedDevice:
+    """
+    An Android device with the Settings app, drawn from the resource images.
+
+    An input changes the screen once the device took its time for it on the clock, as a real
+    device takes its time for the screen transitions. A pairing request started on one device
+    shows the pairing popup on its peer too.
+    """
+
+    def __init__(self, device: str, resources: Dict, clock: VirtualClock, paired: Sequence[str] = (),
+                 locked: bool = False) -> None:
+        """
+        Initializes the device, showing its Home screen or switched off if locked.
+
+        Args:
+            device (str): The device name, as in the tests.
+            resources (Dict): The resource values of the device.
+            clock (VirtualClock): The clock the device takes its time on.
+            paired (Sequence[str], optional): The Bluetooth names of the paired devices. Defaults to none.
+            locked (bool, optional): Whether the device is locked with its screen off. Defaults to False.
+        """
+        self.name = BT_NAMES[device]
+        self.peer: Optional["SimulatedDevice"] = None
+        self._device = device
+        self._resources = resources
+        self._clock = clock
+        self._size = SCREEN_SIZES[device]
+        self._paired = list(paired)
+        self._screen = "off" if locked else "home"
+        self._page = 0
+        self._popup: Optional[str] = None
+        self._scanned_at: Optional[float] = None
+        self._pending: Optional[Tuple[float, Callable[[], None]]] = None
+        self._drawn: Dict[tuple, Screen] = {}
+
+    def grab(self) -> FrameScreenshot:
+        """Returns the screen shown now, knowing the words drawn on it."""
+        screen = self._show()
+        return FrameScreenshot(screen.image.copy(), lines=screen.lines)
+
+    def press(self, button: str) -> None:
+        """Presses a button of the device."""
+        self._show()
+        if button == "POWER" and self._screen == "off":
+            self._go("lock")
+        elif button == "ENTER" and self._screen == "pin":
+            self._later(UNLOCK_TIME_S, lambda: self._go("home"))
+        elif button == "HOME" and self._screen not in ("off", "lock", "pin"):
+            self._later(TRANSITION_S, lambda: self._go("home"))
+
+    def swipe(self, swipe: Sequence[int]) -> None:
+        """Swipes on the screen, scrolling the list shown down for an upward swipe and up otherwise."""
+        self._show()
+        if self._screen == "lock":
+            self._later(TRANSITION_S, lambda: self._go("pin"))
+            return
+        pages = len(HOME_PAGES) if self._screen == "home" else 1
+        page = min(self._page + 1, pages - 1) if swipe[3] < swipe[1] else max(self._page - 1, 0)
+        self._later(SCROLL_S, lambda: setattr(self, "_page", page))
+
+    def tap(self, point: Any) -> None:
+        """Taps a point of the screen shown now."""
+        screen = self._show()
+        target = next((name for name, rec in screen.targets.items()
+                       if rec.p1.x <= point.x <= rec.p2.x and rec.p1.y <= point.y <= rec.p2.y), None)
+
+        if self._popup == "pair" and target in ("PAIR", "Cancel"):
+            if target == "PAIR":
+                self._paired.append(self.peer.name)
+            self._later(TRANSITION_S, lambda: self._go("connected"))
+        elif self._popup == "forget" and target in ("FORGET DEVICE", "Cancel"):
+            if target == "FORGET DEVICE":
+                self._paired.pop(0)
+            self._later(TRANSITION_S, lambda: self._go("connected"))
+        elif self._screen == "home" and target == "Settings":
+            self._later(TRANSITION_S, lambda: self._go("settings"))
+        elif self._screen == "settings" and target == "Connected devices":
+            self._later(TRANSITION_S, lambda: self._go("connected"))
+        elif self._screen == "connected" and target == "Pair new device":
+            self._later(TRANSITION_S, self._start_scan)
+        elif self._screen == "connected" and target == "details":
+            self._later(TRANSITION_S, lambda: self._go("details"))
+        elif self._screen == "details" and target == "FORGET":
+            self._later(TRANSITION_S, lambda: self._show_popup("forget"))
+        elif self._screen == "pairing" and self.peer and target == self.peer.name:
+            self._later(TRANSITION_S, lambda: self._show_popup("pair"))
+            self.peer._later(TRANSITION_S, lambda: self.peer._show_popup("pair"))
+
+    def _later(self, delay_s: float, change: Callable[[], None]) -> None:
+        """Changes the screen after a while."""
+        self._pending = (self._clock.monotonic() + delay_s, change)
+
+    def _go(self, screen: str) -> None:
+        """Shows another screen, at its top and without a popup."""
+        self._screen, self._page, self._popup = screen, 0, None
+
+    def _show_popup(self, popup: str) -> None:
+        """Shows a popup over the screen shown."""
+        self._popup = popup
+
+    def _start_scan(self) -> None:
+        """Shows the pairing screen, listing the peer once it was found."""
+        self._go("pairing")
+        self._scanned_at = self._clock.monotonic() + SCAN_TIME_S
+
+    def _show(self) -> Screen:
+        """Returns the screen shown now, drawing it the first time it is shown."""
+        if self._pending and self._clock.monotonic() >= self._pending[0]:
+            change, self._pending = self._pending[1], None
+            change()
+        scanned = self._screen == "pairing" and self._clock.monotonic() >= self._scanned_at
+        key = (self._screen, self._page, self._popup, tuple(self._paired), scanned)
+        if key not in self._drawn:
+            self._drawn[key] = self._draw(scanned)
+        return self._drawn[key]
+
+    def _draw(self, scanned: bool) -> Screen:
+        """Draws the screen shown now."""
+        width, height = self._size
+        if self._screen in ("off", "lock", "pin"):
+            screen = Screen(self._size, LOCKED_COLOR)
+            if self._screen != "off":
+                screen.text("Enter PIN" if self._screen == "pin" else "Swipe up to unlock",
+                            LIST_X, height // 2, LOCKED_TEXT_COLOR)
+            return screen
+
+        screen = Screen(self._size)
+        if self._popup:
+            self._draw_popup(screen)
+        elif self._screen == "home":
+            self._draw_list(screen, HOME_PAGES[self._page])
+        elif self._screen == "settings":
+            screen.text("Settings", LIST_X, 100)
+            self._draw_list(screen, SETTINGS_ITEMS)
+        elif self._screen == "connected":
+            screen.text("Connected devices", LIST_X, 100)
+            screen.text("Pair new device", LIST_X, LIST_Y)
+            if self._paired:
+                screen.text("Previously connected devices", LIST_X, LIST_Y + LIST_STEP_PX)
+                name = screen.text(self._paired[0], LIST_X, LIST_Y + 2 * LIST_STEP_PX)
+                icon = self._resources["DEVICE_DETAILS_ICON"]
+                icon_h = cv2.imread(icon).shape[0]
+                screen.paste(icon, width - 2 * LIST_X, int(name.center().y) - icon_h // 2, "details")
+        elif self._screen == "pairing":
+            screen.text("Pair new device", LIST_X, 100)
+            screen.text("Available devices", LIST_X, LIST_Y)
+            if scanned and self.peer:
+                screen.text(self.peer.name, LIST_X, LIST_Y + LIST_STEP_PX)
+        elif self._screen == "details":
+            screen.text("Device details", LIST_X, 100)
+            screen.text(self._paired[0], LIST_X, LIST_Y)
+            screen.text("FORGET", LIST_X, LIST_Y + LIST_STEP_PX)
+            screen.text("CONNECT", LIST_X + 300, LIST_Y + LIST_STEP_PX)
+
+        if "FOOTER_BAR_RECTANGLE" in self._resources:
+            x1, y1, x2, y2 = self._resources["FOOTER_BAR_RECTANGLE"]
+            screen.fill(x1, y1, x2, y2, FOOTER_COLOR)
+            screen.paste(self._resources["RECENT_APPS_ICON"], (x1 + x2) // 2 + 180, (y1 + y2) // 2 - 12, "recent_apps")
+        return screen
+
+    def _draw_list(self, screen: Screen, items: Sequence[str]) -> None:
+        """Draws the items of a list, one below the other."""
+        for row, item in enumerate(items):
+            screen.text(item, LIST_X, LIST_Y + row * LIST_STEP_PX)
+
+    def _draw_popup(self, screen: Screen) -> None:
+        """Draws the popup shown, with its button in the popup rectangle of the resources if there is one."""
+        width, height = self._size
+        if self._popup == "pair":
+            title, button, rec = f"Pair with {self.peer.name}?", "PAIR", self._resources["PAIR_POPUP_RECTANGLE"]
+        else:
+            title, button = "Forget device?", "FORGET DEVICE"
+            rec = self._resources.get("FORGET_POPUP_RECTANGLE", [width - 300, height // 2, width - 40, height // 2 + 40])
+        x1, y1, x2, y2 = rec
+        screen.fill(40, y1 - 300, width - 40, y2 + 20, POPUP_COLOR)
+        screen.text(title, 80, y1 - 200)
+        screen.text("Cancel", 80, y2 - 12)
+        screen.text(button, x1 + 20, y2 - 12)
+
+
+class RecordedDisplay:
+    """The display of a simulated device, recording the grabbed frames as the record_session fixture does."""
+
+    def __init__(self, device: SimulatedDevice, recorder: Recorder, test: str) -> None:
+        self._device = device
+        self._recorder = recorder
+        self._test = test
+
+    def grab(self) -> FrameScreenshot:
+        """Grabs the screen of the device."""
+        screenshot = self._device.grab()
+        self._recorder.frame(screenshot, helper_stack(sys._getframe(1), SRC_DIR, self._test))
+        return screenshot
+
+
+class RecordedTouches:
+    """The touches of a simulated device, recording the taps and swipes as the record_session fixture does."""
+
+    def __init__(self, device: SimulatedDevice, recorder: Recorder, test: str) -> None:
+        self._device = device
+        self._recorder = recorder
+        self._test = test
+
+    def tap(self, point: Any) -> None:
+        """Taps a point."""
+        self._device.tap(point)
+        self._recorder.input("tap", [int(point.x), int(point.y)], helper_stack(sys._getframe(1), SRC_DIR, self._test))
+
+    def swipe(self, swipe: Sequence[int]) -> None:
+        """Swipes from a point to another."""
+        self._device.swipe(swipe)
+        self._recorder.input("swipe", [int(value) for value in swipe],
+                             helper_stack(sys._getframe(1), SRC_DIR, self._test))
+
+
+class RecordedButton:
+    """A button of a simulated device, recording the presses as the record_session fixture does."""
+
+    def __init__(self, device: SimulatedDevice, name: str, recorder: Recorder, test: str) -> None:
+        self._device = device
+        self._name = name
+        self._recorder = recorder
+        self._test = test
+
+    def press(self) -> None:
+        """Presses the button."""
+        self._device.press(self._name)
+        self._recorder.input("press", self._name, helper_stack(sys._getframe(1), SRC_DIR, self._test))
+
+
+def run_in_turn(*chains: Callable[[], Any]) -> List[Any]:
+    """
+    Runs the step chains one after another, in place of `run_parallel`.
+
+    The simulated devices share one virtual clock, which the sleeps of chains running at the
+    same time would move for both devices, so every device is recorded waiting only its own time.
+    """
+    return [chain() for chain in chains]
+
+
+def record(test: Callable[..., None], devices: Dict[str, SimulatedDevice], resources: Dict[str, Dict],
+           clock: VirtualClock) -> None:
+    """
+    Runs a test on simulated devices and writes its recording for every device.
+
+    Args:
+        test (Callable[..., None]): The test function, taking the device fixtures.
+        devices (Dict[str, SimulatedDevice]): The simulated devices by device name.
+        resources (Dict[str, Dict]): The resource values by device name.
+        clock (VirtualClock): The clock of the test.
+    """
+    name = test.__name__
+    recorders = {}
+    for device in devices:
+        folder = os.path.join(SYNTHETIC_DIR, name, device)
+        shutil.rmtree(folder, ignore_errors=True)
+        recorders[device] = Recorder(folder, clock)
+
+    test(
+        {device: RecordedDisplay(simulated, recorders[device], name) for device, simulated in devices.items()},
+        {device: RecordedTouches(simulated, recorders[device], name) for device, simulated in devices.items()},
+        {device: {button: RecordedButton(simulated, button, recorders[device], name) for button in BUTTONS}
+         for device, simulated in devices.items()},
+        resources,
+    )
+    for recorder in recorders.values():
+        recorder.save()
+
+
+def main() -> None:
+    clock = VirtualClock()
+    set_default_clock(clock)
+    test_pair_new_device.run_parallel = run_in_turn
+    with tempfile.TemporaryDirectory() as work:
+        # The helpers learn text regions, screen states and swipes next to the resources, so they run on a copy
+        resources = {}
+        for device, folder in RES_FOLDERS.items():
+            shutil.copytree(os.path.join(HMI_TESTS_DIR, folder), os.path.join(work, folder))
+            with open(os.path.join(HMI_TESTS_DIR, folder, "res.json")) as file:
+                resources[device] = json.load(file)
+        cwd = os.getcwd()
+        os.chdir(work)
+        try:
+            head_unit = SimulatedDevice(DEV_HU, resources[DEV_HU], clock)
+            phone = SimulatedDevice(DEV_PH, resources[DEV_PH], clock, locked=True)
+            head_unit.peer, phone.peer = phone, head_unit
+            record(test_pair_new_device.test_pair_new_device, {DEV_HU: head_unit, DEV_PH: phone}, resources, clock)
+
+            head_unit = SimulatedDevice(DEV_HU, resources[DEV_HU], clock, paired=[BT_NAMES[DEV_PH]])
+            record(test_forget_device_hu, {DEV_HU: head_unit}, resources, clock)
+
+            phone = SimulatedDevice(DEV_PH, resources[DEV_PH], clock, paired=[BT_NAMES[DEV_HU]], locked=True)
+            record(test_forget_device_phone, {DEV_PH: phone}, resources, clock)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
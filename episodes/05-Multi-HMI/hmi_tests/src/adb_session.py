@@ -0,0 +1,326 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import json
+import struct
+import subprocess
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Raw `screencap` pixel formats with 4 bytes per pixel in RGBA order: RGBA_8888 and RGBX_8888
+_RGBA_FORMATS = (1, 2)
+
+# First Android SDK whose `screencap` writes the color space after width, height and format
+_COLOR_SPACE_HEADER_SDK = 28
+
+# Prefix of the line echoed by the device when all commands sent before it are done
+_DONE_MARKER = "__adb_session_done_"
+
+# Sessions already opened in this process, by adb executable and device serial number
+_opened: Dict[Tuple[str, str], "AdbSession"] = {}
+_opened_lock = threading.Lock()
+
+
+class AdbSession:
+    """
+    A long-lived shell channel to an Android device, shared by input and capture commands.
+
+    One `adb exec-out sh` session is kept open per device, so a tap, a key press or a screen
+    capture costs a write and a read on an open pipe instead of starting a new adb client and
+    device shell. Commands sent inside `batch()` are sent together in a single round trip.
+
+    The adb executable can be replaced by any program that speaks the same protocol on its
+    standard input and output, e.g. a local fake device for trying helpers without hardware.
+    """
+
+    def __init__(self, serial: str, adb: str = "adb") -> None:
+        """
+        Initializes the session. The channel is opened by the first command.
+
+        Args:
+            serial (str): The serial number of the device, as the `id` in the config file.
+            adb (str, optional): The adb executable. Defaults to "adb".
+        """
+        self.serial = serial
+        self._adb = adb
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.RLock()
+        self._header_size = 12
+        self._raw = bytearray()
+        self._batch: Optional["InputBatch"] = None
+        self._round_trips = 0
+
+    @property
+    def round_trips(self) -> int:
+        """The number of round trips to the device so far."""
+        return self._round_trips
+
+    def run(self, *commands: str) -> str:
+        """
+        Runs shell commands on the device and waits until they are done.
+
+        Inside `batch()` the commands are only queued, and an empty output is returned.
+
+        Args:
+            *commands (str): The shell commands, e.g. "input tap 100 200".
+
+        Returns:
+            str: The output of the commands.
+
+        Raises:
+            RuntimeError: If the device cannot be reached.
+        """
+        with self._lock:
+            if self._batch is not None:
+                self._batch.commands.extend(commands)
+                return ""
+            return self._exchange(commands)
+
+    def batch(self) -> "InputBatch":
+        """
+        Returns a context in which commands are queued and sent in one round trip when it exits.
+
+        Example:
+            with session.batch() as batch:
+                buttons["POWER"].press()
+                batch.pause(0.5)
+                touches.swipe((360, 1550, 360, 1000))
+
+        Returns:
+            InputBatch: The batch context.
+        """
+        return InputBatch(self)
+
+    def screencap(self) -> np.ndarray:
+        """
+        Captures the screen.
+
+        Returns:
+            np.ndarray: The RGBA frame. It is a view of a reused buffer, valid until the next capture.
+
+        Raises:
+            RuntimeError: If the device cannot be reached or the pixel format is not supported.
+        """
+        with self._lock:
+            self._ensure_open()
+            self._send(b"screencap\n")
+
+            header = bytearray(self._header_size)
+            self._read_into(memoryview(header))
+            width, height, pixel_format = struct.unpack_from("<III", header)
+            if pixel_format not in _RGBA_FORMATS:
+                self.close()
+                raise RuntimeError(f"Unsupported screencap pixel format {pixel_format}")
+
+            size = width * height * 4
+            if len(self._raw) != size:
+                self._raw = bytearray(size)
+            self._read_into(memoryview(self._raw))
+            self._round_trips += 1
+            return np.frombuffer(self._raw, dtype=np.uint8).reshape(height, width, 4)
+
+    def close(self) -> None:
+        """Closes the channel. The next command opens a new one."""
+        with self._lock:
+            if self._process is not None:
+                self._process.kill()
+                self._process.wait()
+                self._process = None
+
+    def _ensure_open(self) -> None:
+        """
+        Starts the adb shell session if not running, and reads the screencap header layout of the device.
+
+        Raises:
+            RuntimeError: If the device cannot be reached.
+        """
+        if self._process is not None:
+            return
+
+        try:
+            self._process = subprocess.Popen([self._adb, "-s", self.serial, "exec-out", "sh"],
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL)
+        except OSError as error:
+            raise RuntimeError(f"Cannot start {self._adb}: {error}") from error
+
+        sdk = self._exchange(("getprop ro.build.version.sdk",)).strip()
+        if not sdk.isdigit():
+            self.close()
+            raise RuntimeError(f"Device {self.serial} is not reachable")
+        self._header_size = 16 if int(sdk) >= _COLOR_SPACE_HEADER_SDK else 12
+
+    def _exchange(self, commands: Tuple[str, ...]) -> str:
+        """
+        Sends commands followed by a marker echo, and reads their output up to the marker.
+
+        Args:
+            commands (Tuple[str, ...]): The shell commands.
+
+        Returns:
+            str: The output of the commands.
+
+        Raises:
+            RuntimeError: If the channel is closed before the marker is read.
+        """
+        self._ensure_open()
+        self._round_trips += 1
+        marker = f"{_DONE_MARKER}{self._round_trips}"
+        self._send("".join(f"{command}\n" for command in commands).encode() + f"echo {marker}\n".encode())
+
+        output = []
+        while True:
+            line = self._process.stdout.readline()
+            if not line:
+                self.close()
+                raise RuntimeError(f"Channel to device {self.serial} closed")
+            if line.rstrip(b"\r\n") == marker.encode():
+                return b"".join(output).decode(errors="replace")
+            output.append(line)
+
+    def _send(self, data: bytes) -> None:
+        """
+        Writes to the channel.
+
+        Args:
+            data (bytes): The data to write.
+
+        Raises:
+            RuntimeError: If the channel is closed.
+        """
+        try:
+            self._process.stdin.write(data)
+            self._process.stdin.flush()
+        except OSError as error:
+            self.close()
+            raise RuntimeError(f"Channel to device {self.serial} closed") from error
+
+    def _read_into(self, view: memoryview) -> None:
+        """
+        Fills a buffer from the channel.
+
+        Args:
+            view (memoryview): The buffer to fill.
+
+        Raises:
+            RuntimeError: If the channel is closed before the buffer is full.
+        """
+        while view:
+            count = self._process.stdout.readinto(view)
+            if not count:
+                self.close()
+                raise RuntimeError(f"Channel to device {self.serial} closed")
+            view = view[count:]
+
+
+class InputBatch:
+    """Commands queued on an AdbSession and sent in one round trip when the batch exits."""
+
+    def __init__(self, session: AdbSession) -> None:
+        """
+        Initializes the batch.
+
+        Args:
+            session (AdbSession): The session to send the commands over.
+        """
+        self.commands: List[str] = []
+        self._session = session
+
+    def pause(self, seconds: float) -> None:
+        """
+        Queues a pause, which the device waits out between the commands before and after it.
+
+        Args:
+            seconds (float): The pause duration.
+        """
+        self.commands.append(f"sleep {seconds:g}")
+
+    def __enter__(self) -> "InputBatch":
+        self._session._lock.acquire()
+        if self._session._batch is not None:
+            self._session._lock.release()
+            raise RuntimeError("Batches cannot be nested")
+        self._session._batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            self._session._batch = None
+            if exc_type is None and self.commands:
+                self._session.run(*_coalesce_key_events(self.commands))
+        finally:
+            self._session._lock.release()
+
+
+def session_for(serial: str, adb: str = "adb") -> AdbSession:
+    """
+    Returns the session to a device shared by all users in this process, e.g. its display, touches and buttons.
+
+    Args:
+        serial (str): The serial number of the device, as the `id` in the config file.
+        adb (str, optional): The adb executable. Defaults to "adb".
+
+    Returns:
+        AdbSession: The session to the device.
+    """
+    with _opened_lock:
+        key = (adb, serial)
+        if key not in _opened:
+            _opened[key] = AdbSession(serial, adb)
+        return _opened[key]
+
+
+def android_devices(config_file: str) -> List[Dict]:
+    """
+    Returns the Android devices of a config file, i.e. those with an `AndroidDisplay`.
+
+    Args:
+        config_file (str): The config file, e.g. from the `--config_file` pytest option.
+
+    Returns:
+        List[Dict]: The configs of the Android devices.
+    """
+    with open(config_file) as file:
+        config = json.load(file)
+    return [device for device in config["Devices"] if device["Display"]["implementation"] == "AndroidDisplay"]
+
+
+@atexit.register
+def close_sessions() -> None:
+    """Closes all sessions opened in this process."""
+    with _opened_lock:
+        for session in _opened.values():
+            session.close()
+        _opened.clear()
+
+
+def _coalesce_key_events(commands: List[str]) -> List[str]:
+    """
+    Merges consecutive key events into one `input keyevent` command, which starts the input tool once.
+
+    Args:
+        commands (List[str]): The shell commands.
+
+    Returns:
+        List[str]: The shell commands with merged key events.
+    """
+    merged: List[str] = []
+    for command in commands:
+        if command.startswith("input keyevent ") and merged and merged[-1].startswith("input keyevent "):
+            merged[-1] += command[len("input keyevent"):]
+        else:
+            merged.append(command)
+    return merged
@@ -0,0 +1,108 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Dict, Sequence
+import pytest
+from aurora_tests.point import Point
+from adb_session import AdbSession, android_devices, session_for
+
+# Android key codes of the AuroraTests Android button implementations
+KEY_CODES = {
+    "AndroidButtonHome": 3,
+    "AndroidButtonBack": 4,
+    "AndroidButtonPower": 26,
+    "AndroidButtonEnter": 66,
+    **{f"AndroidButton{digit}": 7 + digit for digit in range(10)},
+}
+
+
+class SessionTouches:
+    """
+    Touches on an Android device, sent over the long-lived session to the device.
+
+    It offers the same `tap` and `swipe` as the AuroraTests `AndroidTouches`.
+    """
+
+    def __init__(self, session: AdbSession) -> None:
+        """
+        Initializes the touches.
+
+        Args:
+            session (AdbSession): The session to the device.
+        """
+        self.session = session
+
+    def tap(self, point: Point) -> None:
+        """
+        Taps the screen.
+
+        Args:
+            point (Point): The point to tap.
+        """
+        self.session.run(f"input tap {int(point.x)} {int(point.y)}")
+
+    def swipe(self, swipe: Sequence[int]) -> None:
+        """
+        Swipes the screen.
+
+        Args:
+            swipe (Sequence[int]): The start and end point of the swipe as x1, y1, x2, y2.
+        """
+        self.session.run("input swipe " + " ".join(str(int(value)) for value in swipe))
+
+
+class SessionButton:
+    """
+    A button of an Android device, pressed over the long-lived session to the device.
+
+    It offers the same `press` as the AuroraTests Android buttons.
+    """
+
+    def __init__(self, session: AdbSession, key_code: int) -> None:
+        """
+        Initializes the button.
+
+        Args:
+            session (AdbSession): The session to the device.
+            key_code (int): The Android key code of the button.
+        """
+        self.session = session
+        self._key_code = key_code
+
+    def press(self) -> None:
+        """Presses the button."""
+        self.session.run(f"input keyevent {self._key_code}")
+
+
+@pytest.fixture
+def device_session_touches(request) -> Dict[str, SessionTouches]:
+    """
+    Touches of all Android devices in the config file, by device name.
+
+    It can be used in place of the `device_touches` fixture.
+    """
+    return {device["name"]: SessionTouches(session_for(device["id"]))
+            for device in android_devices(request.config.getoption("config_file"))}
+
+
+@pytest.fixture
+def device_session_buttons(request) -> Dict[str, Dict[str, SessionButton]]:
+    """
+    Buttons of all Android devices in the config file, by device name and button name.
+
+    It can be used in place of the `device_buttons` fixture.
+    """
+    return {device["name"]: {button["name"]: SessionButton(session_for(device["id"]), KEY_CODES[button["implementation"]])
+                             for button in device.get("Buttons", [])}
+            for device in android_devices(request.config.getoption("config_file"))}
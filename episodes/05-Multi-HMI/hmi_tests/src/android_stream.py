@@ -0,0 +1,67 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Dict, Optional
+import cv2
+import pytest
+from adb_session import AdbSession, android_devices, session_for
+from frame_pool import FramePool
+from frame_screenshot import FrameScreenshot
+
+
+class StreamingAndroidDisplay:
+    """
+    A display grabbing Android screens over the long-lived session to the device.
+
+    It offers the same `grab` as the AuroraTests `AndroidDisplay`. Grabbed frames are written
+    into a pool of reused buffers. A screenshot stays valid as long as it, or a crop of it, is
+    referenced, and its buffer is reused for a later grab afterwards.
+    """
+
+    def __init__(self, session: AdbSession) -> None:
+        """
+        Initializes the display.
+
+        Args:
+            session (AdbSession): The session to the device.
+        """
+        self._session = session
+        self._frames = FramePool()
+
+    def grab(self) -> Optional[FrameScreenshot]:
+        """
+        Grabs the screen.
+
+        Returns:
+            Optional[FrameScreenshot]: The screenshot, or None if the device cannot be captured.
+        """
+        try:
+            raw = self._session.screencap()
+        except RuntimeError:
+            return None
+
+        frame = self._frames.acquire(raw.shape[:2] + (3,))
+        cv2.cvtColor(raw, cv2.COLOR_RGBA2BGR, dst=frame)
+        return FrameScreenshot(frame, display=self._session.serial)
+
+
+@pytest.fixture
+def device_stream_display(request) -> Dict[str, StreamingAndroidDisplay]:
+    """
+    Streaming displays of all Android devices in the config file, by device name.
+
+    It can be used in place of the `device_display` fixture.
+    """
+    return {device["name"]: StreamingAndroidDisplay(session_for(device["id"]))
+           for device in android_devices(request.config.getoption("config_file"))}
@@ -13,22 +13,27 @@
 # limitations under the License.
 
 import json
-import time
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
 from aurora_tests.interfaces.idisplay import IDisplay
 from aurora_tests.interfaces.itouches import ITouches
 from aurora_tests.interfaces.ibutton import IButton
 from aurora_tests.rectangle import Rectangle
+from clock import Clock, default_clock
+from flow import Click, Expect, Find, FlowEngine, FlowError
+from input_queue import INPUT_MIN_GAP_KEY, InputQueue
+from navigation_map import DEFAULT_DEVICE, NavigationMap, find_text_in_region
+from screen_text import TextRegions
+from screen_waits import wait_for_change, wait_for_text
 
 
 class BtConnectivityTester:
     """Helper class for testing Bluetooth connectivity between HMI devices."""
 
     _SCROLLING_TRIES: int = 4
-    _POPUP_CHECK_TRIES: int = 10
-    _POPUP_CHECK_SLEEP_S: float = 0.2
+    _POPUP_TIMEOUT_S: float = 2.0
 
-    def __init__(self, display: IDisplay, touches: ITouches, buttons: Dict[str, IButton], resources: Dict):
+    def __init__(self, display: IDisplay, touches: ITouches, buttons: Dict[str, IButton], resources: Dict,
+                 clock: Optional[Clock] = None, device: Optional[str] = None):
         """
         Initializes the Bluetooth connectivity tester.
 
@@ -37,17 +42,27 @@ class BtConnectivityTester:
             touches (ITouches): The touch interface instance.
             buttons (Dict[str, IButton]): A dictionary of button instances.
             resources (Dict): A dictionary of configuration and resource values.
+            clock (Optional[Clock], optional): The clock to wait with. Defaults to the default clock.
+            device (Optional[str], optional): The device the navigation map is kept for, e.g. its name in the
+                config file. Defaults to None, meaning the serial of the session the touches are sent over, or
+                DEFAULT_DEVICE without a session.
         """
         self._display = display
         self._touches = touches
         self._buttons = buttons
         self._resources = resources
+        self._clock = clock or default_clock()
+        self._text_regions = TextRegions(resources)
+        session = getattr(touches, "session", None)
+        self._flow = FlowEngine(display, resources, click=lambda point: self._touches.tap(point),
+                                text_regions=self._text_regions, clock=self._clock)
+        self._navigation = NavigationMap(resources, device or getattr(session, "serial", None) or DEFAULT_DEVICE)
 
         # Load frequently used resources
         self._SCREEN_TRANSITION_DELAY_S = self._resources["SCREEN_TRANSITION_DELAY_S"]
         self._BOTTOM_SWIPE = tuple(self._resources["BOTTOM_SWIPE"])
 
-    def unlock(self, pin: str) -> None:
+    def unlock(self, pin: str) -> bool:
         """
         Unlocks the device using a PIN.
 
@@ -57,29 +72,21 @@ class BtConnectivityTester:
         Returns:
             bool: True if successfully unlocked, False otherwise.
         """
-        self._buttons["POWER"].press()
-        time.sleep(self._SCREEN_TRANSITION_DELAY_S)
-
-        self._touches.swipe(self._BOTTOM_SWIPE)
-        time.sleep(self._SCREEN_TRANSITION_DELAY_S)
-
-        for digit in pin:
-            self._buttons[digit].press()
-            time.sleep(self._SCREEN_TRANSITION_DELAY_S)
-
-        self._buttons["ENTER"].press()
-        time.sleep(self._resources["UNLOCK_DELAY_S"])
-
-        screenshot = self._display.grab()
-        if screenshot:
-            find_region = Rectangle(self._resources["FOOTER_BAR_RECTANGLE"])
-            recent_apps_icon_img = self._resources["RECENT_APPS_ICON"]
-            recent_apps_icon = screenshot.find_image(
-                recent_apps_icon_img, find_region)
-            if recent_apps_icon:
-                return True
-
-        return False
+        # Over a session to the device, the whole PIN entry is sent in one round trip, where the
+        # device types the key events one after another without pauses
+        digit_gap_s = 0.0 if getattr(self._buttons["ENTER"], "session", None) else self._SCREEN_TRANSITION_DELAY_S
+        with self._input_queue() as inputs:
+            inputs.press(self._buttons["POWER"], self._SCREEN_TRANSITION_DELAY_S)
+            inputs.swipe(self._touches, self._BOTTOM_SWIPE, self._SCREEN_TRANSITION_DELAY_S)
+            for digit in pin:
+                inputs.press(self._buttons[digit], digit_gap_s)
+            inputs.press(self._buttons["ENTER"])
+
+        # Wait until the unlocked screen shows the recent apps icon in the footer bar
+        return self._run_flow([
+            Find(image=self._resources["RECENT_APPS_ICON"], region="FOOTER_BAR_RECTANGLE",
+                 timeout_s=self._resources["UNLOCK_DELAY_S"]),
+        ])
 
     def open_app(self, app_name: str) -> bool:
         """
@@ -92,22 +99,17 @@ class BtConnectivityTester:
             bool: True if the application was successfully opened, False otherwise.
         """
         self._buttons["HOME"].press()
-        time.sleep(self._SCREEN_TRANSITION_DELAY_S)
 
-        for _ in range(self._SCROLLING_TRIES):
-            app_icon = self._display.grab().find_text(app_name)
-            if app_icon:
-                self._touches.tap(app_icon.center())
-                time.sleep(self._SCREEN_TRANSITION_DELAY_S)
-                return True
-            self._touches.swipe(self._BOTTOM_SWIPE)
-            time.sleep(self._SCREEN_TRANSITION_DELAY_S)
+        app_icon = self._scroll_to_text(app_name, self._SCREEN_TRANSITION_DELAY_S)
+        if app_icon:
+            self._touches.tap(app_icon.center())
+            return True
 
         return False
 
     def open_settings_menu(self, menu: str) -> bool:
         """
-        Opens a settings menu by its name.
+        Opens a settings menu by its name, right after the settings app was opened.
 
         Args:
             menu (str): The name of the settings menu to open.
@@ -115,14 +117,10 @@ class BtConnectivityTester:
         Returns:
             bool: True if the menu was successfully opened, False otherwise.
         """
-        for _ in range(self._SCROLLING_TRIES):
-            menu_icon = self._display.grab().find_text(menu)
-            if menu_icon:
-                self._touches.tap(menu_icon.center())
-                time.sleep(self._SCREEN_TRANSITION_DELAY_S)
-                return True
-            self._touches.swipe(self._BOTTOM_SWIPE)
-            time.sleep(self._SCREEN_TRANSITION_DELAY_S)
+        menu_icon = self._scroll_to_text(menu, self._SCREEN_TRANSITION_DELAY_S)
+        if menu_icon:
+            self._touches.tap(menu_icon.center())
+            return True
 
         return False
 
@@ -136,19 +134,12 @@ class BtConnectivityTester:
         Returns:
             bool: True if pairing was initiated successfully, False otherwise.
         """
-        pair_new_device_menu = self._display.grab().find_text("Pair new device")
-        if pair_new_device_menu:
-            self._touches.tap(pair_new_device_menu.center())
-            time.sleep(self._SCREEN_TRANSITION_DELAY_S)
-
-            for _ in range(self._POPUP_CHECK_TRIES):
-                device_icon = self._display.grab().find_text(device)
-                if device_icon:
-                    self._touches.tap(device_icon.center())
-                    return True
-                time.sleep(self._POPUP_CHECK_SLEEP_S)
-
-        return False
+        return self._run_flow([
+            Find(text="Pair new device", stable=True),
+            Click(),
+            Expect(text=device, timeout_s=self._SCREEN_TRANSITION_DELAY_S + self._POPUP_TIMEOUT_S, stable=True),
+            Click(),
+        ])
 
     def accept_to_pair(self) -> bool:
         """
@@ -157,20 +148,10 @@ class BtConnectivityTester:
         Returns:
             bool: True if the pairing request was accepted, False otherwise.
         """
-        for _ in range(self._POPUP_CHECK_TRIES):
-            if "PAIR_POPUP_RECTANGLE" in self._resources:
-                popup_region = Rectangle(
-                    self._resources["PAIR_POPUP_RECTANGLE"])
-            else:
-                popup_region = None
-
-            popup_pair_btn = self._display.grab().find_text("PAIR", popup_region)
-            if popup_pair_btn:
-                self._touches.tap(popup_pair_btn.center())
-                return True
-            time.sleep(self._POPUP_CHECK_SLEEP_S)
-
-        return False
+        return self._run_flow([
+            Find(text="PAIR", region="PAIR_POPUP_RECTANGLE", timeout_s=self._POPUP_TIMEOUT_S, stable=True),
+            Click(),
+        ])
 
     def is_paired_to_device(self, device: str) -> bool:
         """
@@ -182,13 +163,9 @@ class BtConnectivityTester:
         Returns:
             bool: True if the device is paired, False otherwise.
         """
-        for _ in range(self._POPUP_CHECK_TRIES):
-            device_icon = self._display.grab().find_text(device)
-            if device_icon:
-                return True
-            time.sleep(self._POPUP_CHECK_SLEEP_S)
-
-        return False
+        return self._run_flow([
+            Find(text=device, timeout_s=self._POPUP_TIMEOUT_S, stable=True),
+        ])
 
     def forget_device(self) -> bool:
         """
@@ -197,27 +174,119 @@ class BtConnectivityTester:
         Returns:
             bool: True if the device was successfully forgotten, False otherwise.
         """
-        device_details_icon = self._display.grab().find_image(
-            self._resources["DEVICE_DETAILS_ICON"])
-        if device_details_icon:
-            self._touches.tap(device_details_icon.center())
-            time.sleep(self._SCREEN_TRANSITION_DELAY_S)
-
-            forget_btn_text = self._display.grab().find_text("FORGET")
-            if forget_btn_text:
-                self._touches.tap(forget_btn_text.center())
-                time.sleep(self._SCREEN_TRANSITION_DELAY_S)
-
-                if "FORGET_POPUP_RECTANGLE" in self._resources:
-                    popup_region = Rectangle(
-                        self._resources["FORGET_POPUP_RECTANGLE"])
-                else:
-                    popup_region = None
-
-                popup_forget_device_btn_text = self._display.grab(
-                ).find_text("FORGET DEVICE", popup_region)
-                if popup_forget_device_btn_text:
-                    self._touches.tap(popup_forget_device_btn_text.center())
-                    return True
+        return self._run_flow([
+            Find(image=self._resources["DEVICE_DETAILS_ICON"], stable=True),
+            Click(),
+            Expect(text="FORGET", stable=True),
+            Click(),
+            Expect(text="FORGET DEVICE", region="FORGET_POPUP_RECTANGLE", stable=True),
+            Click(),
+        ])
+
+    def _scroll_to_text(self, text: str, lead_s: float = 0.0) -> Optional[Rectangle]:
+        """
+        Scrolls down until a text is shown.
 
-        return False
+        A text found before is jumped to with the recorded number of swipes and verified in the
+        region it was found in. If it is not there, it is forgotten, the list is scrolled back to
+        the top and the text is searched for as usual, so the swipes recorded for it count from the top.
+
+        Scrolling stops early when a swipe does not change the screen, as the end of the list is reached.
+
+        Args:
+            text (str): The text to scroll to.
+            lead_s (float, optional): The time the screen still changes from an input sent right
+                before, e.g. opening the list, waited out before the first swipe. Defaults to 0.0.
+
+        Returns:
+            Optional[Rectangle]: The rectangle bounding the found text, or None if not found.
+        """
+        swipes = 0
+        mapped = self._navigation.lookup(text)
+        if mapped:
+            swipes, region = mapped
+            found = self._jump_to_text(text, swipes, region, lead_s)
+            if found:
+                return found
+            self._navigation.forget(text)
+            self._scroll_to_top(swipes)
+            swipes = 0
+
+        for _ in range(self._SCROLLING_TRIES):
+            result = wait_for_text(self._display, text, self._SCREEN_TRANSITION_DELAY_S,
+                                   text_regions=self._text_regions, stable=True, clock=self._clock)
+            if result:
+                self._navigation.record(text, swipes, result.found)
+                return result.found
+
+            self._touches.swipe(self._BOTTOM_SWIPE)
+            swipes += 1
+            if not wait_for_change(self._display, self._SCREEN_TRANSITION_DELAY_S, result.screenshot, self._clock):
+                break
+
+        return None
+
+    def _jump_to_text(self, text: str, swipes: int, region: Rectangle, lead_s: float) -> Optional[Rectangle]:
+        """
+        Swipes down as often as recorded for a text, without searching in between, and verifies it is shown.
+
+        Args:
+            text (str): The text to jump to.
+            swipes (int): The number of swipes from the top the text was found after.
+            region (Rectangle): The region the text was found in.
+            lead_s (float): The time to wait before the first swipe, while the screen still changes.
+
+        Returns:
+            Optional[Rectangle]: The rectangle bounding the text, or None if it is not in the region.
+        """
+        # Over a session to the device, all swipes are sent in one round trip
+        with self._input_queue() as inputs:
+            if swipes and lead_s > 0:
+                inputs.pause(lead_s)
+            for swipe in range(swipes):
+                inputs.swipe(self._touches, self._BOTTOM_SWIPE,
+                             self._SCREEN_TRANSITION_DELAY_S if swipe < swipes - 1 else 0.0)
+            return inputs.confirm(self._display, lambda screenshot: find_text_in_region(screenshot, text, region),
+                                  self._SCREEN_TRANSITION_DELAY_S, stable=True).found
+
+    def _scroll_to_top(self, swipes: int) -> None:
+        """
+        Swipes up as often as swiped down, back to the top of the list, and waits out the screen
+        transition delay after the last swipe.
+
+        Args:
+            swipes (int): The number of swipes down from the top.
+        """
+        x1, y1, x2, y2 = self._BOTTOM_SWIPE
+        with self._input_queue() as inputs:
+            for _ in range(swipes):
+                inputs.swipe(self._touches, (x2, y2, x1, y1), self._SCREEN_TRANSITION_DELAY_S)
+            inputs.flush()
+
+    def _input_queue(self) -> InputQueue:
+        """
+        Returns a queue delivering touches and button presses paced for the device.
+
+        Returns:
+            InputQueue: The queue, keeping the `INPUT_MIN_GAP_S` resource value between inputs if set.
+        """
+        return InputQueue(self._resources.get(INPUT_MIN_GAP_KEY, 0.0), self._clock)
+
+    def _run_flow(self, steps: List[Any]) -> bool:
+        """
+        Runs the steps of a flow on the device.
+
+        Texts must be found at the same place on two screenshots in a row, so they are not tapped
+        while the screen still scrolls or animates.
+
+        Args:
+            steps (List[Any]): The steps, see flow.py.
+
+        Returns:
+            bool: True if every step found its target, False otherwise.
+        """
+        try:
+            self._flow.run(steps)
+        except FlowError:
+            return False
+        return True
@@ -0,0 +1,304 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs the tests in parallel on a pool of rigs, each described by its own config file.
+
+Every test runs in its own pytest process. A test asking for `device_*` fixtures leases a
+whole rig for as long as it runs, so no two tests drive the same devices at the same time.
+Run it from the hmi_tests folder, with the pytest arguments after `--`:
+    python src/device_scheduler.py --rigs rig_a.json rig_b.json -- src --res_file ...
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Set
+import pytest
+
+# Environment variable with the trace file of the step profiler, made unique per test process
+_TRACE_ENV = "HMI_PROFILE_TRACE"
+
+# Environment variable with the node id of the one test a test process runs
+_TEST_ENV = "HMI_SCHEDULED_TEST"
+
+# Seconds between checks of the running test processes
+_POLL_S = 0.1
+
+
+class Rig:
+    """A group of devices tested together, as listed in one config file."""
+
+    def __init__(self, config_file: str) -> None:
+        """
+        Loads the rig from its config file.
+
+        Args:
+            config_file (str): The config file listing the devices of the rig.
+        """
+        self.config_file = config_file
+        with open(config_file) as file:
+            self.devices: List[Dict] = json.load(file).get("Devices", [])
+
+    @property
+    def ids(self) -> Set[str]:
+        """The ids of the devices of the rig, e.g. Android serials."""
+        return {device["id"] for device in self.devices if "id" in device}
+
+
+class ScheduledTest:
+    """A collected test and whether it needs devices."""
+
+    def __init__(self, nodeid: str, needs_devices: bool) -> None:
+        """
+        Initializes the test.
+
+        Args:
+            nodeid (str): The pytest node id of the test.
+            needs_devices (bool): Whether the test asks for `device_*` fixtures.
+        """
+        self.nodeid = nodeid
+        self.needs_devices = needs_devices
+
+
+class DeviceLeases:
+    """
+    Exclusive leases of rigs.
+
+    Devices are leased by id, so rigs sharing a device, e.g. one phone paired with two head
+    units, are never leased at the same time.
+    """
+
+    def __init__(self, rigs: Sequence[Rig]) -> None:
+        """
+        Initializes the leases, with every rig free.
+
+        Args:
+            rigs (Sequence[Rig]): The rigs to lease.
+        """
+        self._rigs = rigs
+        self._leased: Set[str] = set()
+
+    def acquire(self) -> Optional[Rig]:
+        """
+        Leases a rig whose devices are all free.
+
+        Returns:
+            Optional[Rig]: The leased rig, or None if every rig has a leased device.
+        """
+        for rig in self._rigs:
+            if not rig.ids & self._leased:
+                self._leased |= rig.ids
+                return rig
+        return None
+
+    def release(self, rig: Rig) -> None:
+        """
+        Frees the devices of a leased rig.
+
+        Args:
+            rig (Rig): The rig to release.
+        """
+        self._leased -= rig.ids
+
+
+class _Collector:
+    """A pytest plugin keeping the collected tests."""
+
+    def __init__(self) -> None:
+        self.tests: List[ScheduledTest] = []
+
+    def pytest_collection_modifyitems(self, items) -> None:
+        for item in items:
+            fixtures = getattr(item, "fixturenames", ())
+            self.tests.append(ScheduledTest(item.nodeid, any(name.startswith("device_") for name in fixtures)))
+
+
+def collect_tests(pytest_args: Sequence[str], config_file: str) -> List[ScheduledTest]:
+    """
+    Collects the tests without running them.
+
+    Args:
+        pytest_args (Sequence[str]): The pytest arguments selecting the tests.
+        config_file (str): A config file to collect with.
+
+    Returns:
+        List[ScheduledTest]: The collected tests, in collection order.
+
+    Raises:
+        RuntimeError: If the tests cannot be collected.
+    """
+    collector = _Collector()
+    exit_code = pytest.main(["--collect-only", "-q", "-p", "no:cacheprovider", "--config_file", config_file,
+                             *pytest_args], plugins=[collector])
+    if exit_code not in (pytest.ExitCode.OK, pytest.ExitCode.NO_TESTS_COLLECTED):
+        raise RuntimeError(f"Collecting the tests failed with exit code {exit_code}")
+    return collector.tests
+
+
+def check_rigs(rigs: Sequence[Rig]) -> None:
+    """
+    Checks that the rigs can be tested at the same time.
+
+    Args:
+        rigs (Sequence[Rig]): The rigs.
+
+    Raises:
+        ValueError: If different devices write their screenshots to the same file.
+    """
+    writers: Dict[str, str] = {}
+    for rig in rigs:
+        for device in rig.devices:
+            screenshot_file = device.get("Display", {}).get("screenshot_file")
+            if not screenshot_file:
+                continue
+            writer = writers.setdefault(os.path.abspath(screenshot_file), device["id"])
+            if writer != device["id"]:
+                raise ValueError(f"Devices {writer} and {device['id']} both write screenshots to {screenshot_file}")
+
+
+def run_tests(tests: Sequence[ScheduledTest], rigs: Sequence[Rig], pytest_args: Sequence[str],
+              workers: int) -> Dict[str, int]:
+    """
+    Runs every test in its own pytest process, as many at a time as there are free rigs and workers.
+
+    Tests are started in collection order. A test waiting for a rig does not hold back later
+    tests that need no devices.
+
+    Args:
+        tests (Sequence[ScheduledTest]): The tests to run.
+        rigs (Sequence[Rig]): The rigs to run them on.
+        pytest_args (Sequence[str]): The pytest arguments the tests were collected with.
+        workers (int): The most test processes running at a time.
+
+    Returns:
+        Dict[str, int]: The pytest exit codes, by test node id.
+    """
+    leases = DeviceLeases(rigs)
+    pending = list(tests)
+    running: Dict[subprocess.Popen, tuple] = {}
+    exit_codes: Dict[str, int] = {}
+
+    while pending or running:
+        for test in list(pending):
+            if len(running) >= workers:
+                break
+            rig = leases.acquire() if test.needs_devices else None
+            if test.needs_devices and rig is None:
+                continue
+            pending.remove(test)
+            output = tempfile.TemporaryFile("w+")
+            process = subprocess.Popen(
+                [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-p", "device_scheduler",
+                 "--config_file", (rig or rigs[0]).config_file, *pytest_args],
+                stdout=output, stderr=subprocess.STDOUT,
+                env=_test_env(test, len(exit_codes) + len(running)))
+            running[process] = (test, rig, output, time.monotonic())
+
+        time.sleep(_POLL_S)
+        for process in [process for process in running if process.poll() is not None]:
+            test, rig, output, start_s = running.pop(process)
+            if rig is not None:
+                leases.release(rig)
+            exit_codes[test.nodeid] = process.returncode
+            _report(test, rig, process.returncode, output, time.monotonic() - start_s)
+
+    return exit_codes
+
+
+def pytest_collection_modifyitems(config, items) -> None:
+    """Keeps only the scheduled test, in a test process started by the scheduler."""
+    nodeid = os.environ.get(_TEST_ENV)
+    if nodeid:
+        config.hook.pytest_deselected(items=[item for item in items if item.nodeid != nodeid])
+        items[:] = [item for item in items if item.nodeid == nodeid]
+
+
+def _test_env(test: ScheduledTest, index: int) -> Dict[str, str]:
+    """
+    Returns the environment of a test process, loading the scheduler as a plugin to run only the test.
+
+    Args:
+        test (ScheduledTest): The test to run.
+        index (int): The number of the test process, making its profiler trace file unique.
+
+    Returns:
+        Dict[str, str]: The environment variables.
+    """
+    env = dict(os.environ)
+    env[_TEST_ENV] = test.nodeid
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                      env.get("PYTHONPATH")]))
+    if env.get(_TRACE_ENV):
+        stem, extension = os.path.splitext(env[_TRACE_ENV])
+        env[_TRACE_ENV] = f"{stem}.{index}{extension}"
+    return env
+
+
+def _report(test: ScheduledTest, rig: Optional[Rig], exit_code: int, output, duration_s: float) -> None:
+    """
+    Prints the result of a finished test, with its output if it did not pass.
+
+    Args:
+        test (ScheduledTest): The test.
+        rig (Optional[Rig]): The rig the test ran on, or None if it needed no devices.
+        exit_code (int): The pytest exit code of the test process.
+        output: The file the test process wrote its output to, closed afterwards.
+        duration_s (float): The run time of the test.
+    """
+    with output:
+        output.seek(0)
+        result = "PASSED" if exit_code == pytest.ExitCode.OK else "FAILED"
+        print(f"{result} {test.nodeid} on {rig.config_file if rig else 'no devices'} in {duration_s:.1f}s", flush=True)
+        if exit_code != pytest.ExitCode.OK:
+            print(output.read(), flush=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Collects and runs the tests on the rigs given on the command line.
+
+    Args:
+        argv (Optional[Sequence[str]], optional): The command line arguments. Defaults to None,
+            meaning the arguments of the script.
+
+    Returns:
+        int: 0 if every test passed, 1 otherwise.
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    pytest_args = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(description="Runs the tests in parallel on a pool of rigs.")
+    parser.add_argument("--rigs", nargs="+", required=True, help="the config files of the rigs")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="the most tests running at a time, by default one per rig")
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+    rigs = [Rig(config_file) for config_file in args.rigs]
+    check_rigs(rigs)
+    tests = collect_tests(pytest_args, rigs[0].config_file)
+
+    start_s = time.monotonic()
+    exit_codes = run_tests(tests, rigs, pytest_args, args.workers or len(rigs))
+    failed = [nodeid for nodeid, exit_code in exit_codes.items() if exit_code != pytest.ExitCode.OK]
+    print(f"{len(exit_codes) - len(failed)} passed, {len(failed)} failed on {len(rigs)} rigs "
+          f"in {time.monotonic() - start_s:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
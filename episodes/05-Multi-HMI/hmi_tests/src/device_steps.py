@@ -0,0 +1,48 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List
+
+
+def run_parallel(*chains: Callable[[], Any]) -> List[Any]:
+    """
+    Runs independent step chains, e.g. one per device, at the same time and waits for all of them.
+
+    Each call is a sync point: it returns only when every chain has finished. Chains must not
+    share a device, as its display, touches and buttons are not meant to be used from two
+    threads at once.
+
+    Example:
+        hu_ready, phone_ready = run_parallel(
+            lambda: head_unit.open_app("Settings"),
+            lambda: phone.unlock("2211") and phone.open_app("Settings"),
+        )
+
+    Args:
+        *chains (Callable[[], Any]): The step chains to run.
+
+    Returns:
+        List[Any]: The result of every chain, in the order the chains were given.
+
+    Raises:
+        Exception: The exception raised by a chain, after all chains have finished. If several
+            chains fail, the one given first wins.
+    """
+    if len(chains) <= 1:
+        return [chain() for chain in chains]
+
+    with ThreadPoolExecutor(max_workers=len(chains), thread_name_prefix="device_steps") as executor:
+        futures = [executor.submit(chain) for chain in chains]
+    return [future.result() for future in futures]
@@ -0,0 +1,348 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Helper steps described as data and run by one engine.
+
+A flow is a list of steps: `Find` and `Expect` wait for a text or an image, `Click`, `Type`,
+`Press` and `Swipe` act on the device, and `Sleep` waits for what the screen does not show.
+For example, opening a menu entry:
+    engine.run([
+        Find(text="Command", message="Command menu not found"),
+        Click(),
+        Expect(text="Exit", region="COMMAND_MENU_RECTANGLE"),
+        Click(),
+    ])
+Timeouts, retries and the regions to search in are resolved by the engine, and the screen is
+grabbed in the background while the previous screenshot is searched.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from aurora_tests.interfaces.idisplay import IDisplay
+from aurora_tests.point import Point
+from aurora_tests.rectangle import Rectangle
+from clock import Clock, default_clock
+from screen_states import ScreenStates
+from screen_text import OcrScreenshot, TextRegions
+from screen_waits import FramePrefetcher, wait_for
+
+
+class FlowError(AssertionError):
+    """Raised when a step of a flow does not find what it waits for."""
+
+
+class Find:
+    """Waits until a text or an image is shown, and remembers where it was found."""
+
+    def __init__(self, text: Optional[str] = None, image: Optional[str] = None, region: Any = None,
+                 name: Optional[str] = None, on: Optional[str] = None, timeout_s: Optional[float] = None,
+                 stable: bool = False, message: Optional[str] = None) -> None:
+        """
+        Initializes the step.
+
+        Args:
+            text (Optional[str], optional): The text to find. Defaults to None.
+            image (Optional[str], optional): The image file to find, if no text is given. Defaults to None.
+            region (Any, optional): The region to search in: a Rectangle, its corners, or the name of a
+                resource holding them. A resource that is not set means the whole screen. Defaults to None,
+                meaning the region the text was found in earlier runs first, then the whole screen.
+            name (Optional[str], optional): The name later steps refer to the found target by. Defaults to None.
+            on (Optional[str], optional): The name of an earlier step to search the screenshot of, instead of
+                grabbing the screen, e.g. for another field of the same form. Defaults to None.
+            timeout_s (Optional[float], optional): The longest time to wait. Defaults to the engine timeout.
+            stable (bool, optional): Whether the target must be found at the same place on two screenshots
+                in a row, e.g. in a scrolling list. Defaults to False.
+            message (Optional[str], optional): The error message if the target is not found. Defaults to
+                one naming the target.
+        """
+        self.text = text
+        self.image = image
+        self.region = region
+        self.name = name
+        self.on = on
+        self.timeout_s = timeout_s
+        self.stable = stable
+        self.message = message or f"{text or image} not found"
+
+
+class Expect(Find):
+    """
+    Waits for the outcome of the click right before it, e.g. the screen it opens.
+
+    If the outcome is not shown in time while the clicked target is still at the same place,
+    the click got lost, e.g. while the screen was busy, and is repeated as often as the engine retries.
+    """
+
+
+class Click:
+    """Clicks or taps a found target."""
+
+    def __init__(self, target: Optional[str] = None, offset: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Initializes the step.
+
+        Args:
+            target (Optional[str], optional): The name of the target to click. Defaults to None,
+                meaning the target found last.
+            offset (Optional[Tuple[int, int]], optional): The distance of the clicked point from the bottom
+                right corner of the target, e.g. (0, 30) for an input box below its label. Defaults to None,
+                meaning the center of the target.
+        """
+        self.target = target
+        self.offset = offset
+
+
+class Type:
+    """Types a text with the keyboard."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+class Press:
+    """Presses a button of the device, e.g. "HOME"."""
+
+    def __init__(self, button: str) -> None:
+        self.button = button
+
+
+class Swipe:
+    """Swipes over the screen."""
+
+    def __init__(self, swipe: Any) -> None:
+        self.swipe = swipe
+
+
+class Sleep:
+    """Waits for something the screen does not show, e.g. the focus of an input box."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+
+
+class FlowEngine:
+    """Runs flows of steps on a device."""
+
+    def __init__(self, display: IDisplay, resources: Dict, click: Optional[Callable[[Point], Any]] = None,
+                 keyboard: Any = None, buttons: Optional[Dict[str, Any]] = None,
+                 swipe: Optional[Callable[[Any], Any]] = None, timeout_s: Optional[float] = None,
+                 retries: int = 1, text_regions: Optional[TextRegions] = None,
+                 screen_states: Optional[ScreenStates] = None, clock: Optional[Clock] = None) -> None:
+        """
+        Initializes the engine.
+
+        Args:
+            display (IDisplay): The display to grab.
+            resources (Dict): The resource values, also resolving the regions given by name.
+            click (Optional[Callable[[Point], Any]], optional): Clicks a point, e.g. `mouse.click` or
+                `touches.tap`. Defaults to None.
+            keyboard (Any, optional): The keyboard typing the `Type` steps. Defaults to None.
+            buttons (Optional[Dict[str, Any]], optional): The buttons pressed by the `Press` steps. Defaults to None.
+            swipe (Optional[Callable[[Any], Any]], optional): Swipes, e.g. `touches.swipe`. Defaults to None.
+            timeout_s (Optional[float], optional): The timeout of the steps not giving one. Defaults to the
+                SCREEN_TRANSITION_DELAY_S resource.
+            retries (int, optional): How often a click is repeated when its `Expect` is not met. Defaults to 1.
+            text_regions (Optional[TextRegions], optional): The TextRegions to search texts with. Defaults to
+                new TextRegions of the resources.
+            screen_states (Optional[ScreenStates], optional): The screen states recognizing targets found
+                before without searching them. Defaults to new ScreenStates of the resources.
+            clock (Optional[Clock], optional): The clock to wait with. Defaults to the default clock.
+        """
+        self._display = display
+        self._resources = resources
+        self._click = click
+        self._keyboard = keyboard
+        self._buttons = buttons or {}
+        self._swipe = swipe
+        self._timeout_s = resources["SCREEN_TRANSITION_DELAY_S"] if timeout_s is None else timeout_s
+        self._retries = retries
+        self._text_regions = text_regions or TextRegions(resources)
+        self._screen_states = screen_states or ScreenStates(resources)
+        self._clock = clock or default_clock()
+
+    def run(self, steps: Sequence[Any]) -> Dict[str, Rectangle]:
+        """
+        Runs the steps of a flow in order.
+
+        Args:
+            steps (Sequence[Any]): The steps.
+
+        Returns:
+            Dict[str, Rectangle]: The found targets, by step name.
+
+        Raises:
+            FlowError: If a `Find` or `Expect` step does not find its target in time.
+        """
+        # Screenshots searched again by later steps are recognized once, for the first search and all later ones
+        reused: Set[str] = {step.on for step in steps if isinstance(step, Find) and step.on}
+        finds: Dict[str, Find] = {}
+        found: Dict[str, Rectangle] = {}
+        screenshots: Dict[str, Any] = {}
+        last: Optional[Tuple[Find, Rectangle]] = None
+        clicked: Optional[Tuple[Click, Find, Rectangle]] = None
+        prefetcher = FramePrefetcher(self._display)
+        try:
+            for step in steps:
+                if isinstance(step, Find):
+                    rec, screenshot = self._find(step, screenshots, prefetcher, step.name in reused)
+                    retries = self._retries if isinstance(step, Expect) and clicked else 0
+                    for _ in range(retries):
+                        if rec or not self._unchanged(clicked[1], clicked[2], screenshot):
+                            break
+                        self._act(clicked[0], clicked[2], prefetcher)
+                        rec, screenshot = self._find(step, screenshots, prefetcher, step.name in reused)
+                    if not rec:
+                        raise FlowError(step.message)
+                    last, clicked = (step, rec), None
+                    if step.name:
+                        finds[step.name], found[step.name] = step, rec
+                        screenshots[step.name] = screenshot
+                elif isinstance(step, Click):
+                    target = (finds[step.target], found[step.target]) if step.target else last
+                    self._act(step, target[1], prefetcher)
+                    clicked = (step, *target)
+                else:
+                    self._act(step, None, prefetcher)
+                    clicked = None
+        finally:
+            prefetcher.close()
+        return found
+
+    def _probe(self, step: Find) -> Callable[[Any], Optional[Rectangle]]:
+        """
+        Returns the search of the target of a step on a screenshot.
+
+        A screenshot showing the target the way it was found before is recognized by the fingerprint
+        of the region around it. Otherwise the target is searched, and learned when it is found.
+
+        Args:
+            step (Find): The step.
+
+        Returns:
+            Callable[[Any], Optional[Rectangle]]: Finds the target on a screenshot.
+        """
+        region = self._region(step.region)
+        state = step.text or step.image
+        if step.text:
+            search = lambda screenshot: self._text_regions.find_text(screenshot, step.text, region)
+        else:
+            search = lambda screenshot: screenshot.find_image(step.image, region)
+
+        def probe(screenshot: Any) -> Optional[Rectangle]:
+            rec = self._screen_states.locate(state, screenshot, region)
+            if rec is None:
+                rec = search(screenshot)
+                if rec:
+                    self._screen_states.learn(state, screenshot, rec)
+            return rec
+
+        return probe
+
+    def _find(self, step: Find, screenshots: Dict[str, Any], prefetcher: FramePrefetcher,
+              reused: bool = False) -> Tuple[Optional[Rectangle], Any]:
+        """
+        Searches the target of a step, on the screenshot of an earlier step or by waiting for it.
+
+        Args:
+            step (Find): The step.
+            screenshots (Dict[str, Any]): The screenshots of the earlier steps, by step name.
+            prefetcher (FramePrefetcher): The prefetcher to grab the screen with.
+            reused (bool, optional): Whether later steps search the screenshot again, so it is wrapped in an
+                OcrScreenshot before its first search. Defaults to False.
+
+        Returns:
+            Tuple[Optional[Rectangle], Any]: The rectangle bounding the found target, or None if not found,
+                and the screenshot it was searched on last.
+        """
+        probe = self._probe(step)
+        if step.on:
+            screenshot = screenshots[step.on]
+            return probe(screenshot), screenshot
+
+        # The last grabbed screenshot and its wrapper, so the searches of later steps reuse its recognized words
+        wrapped: List[Any] = [None, None]
+        if reused:
+            search = probe
+
+            def probe(screenshot: Any) -> Optional[Rectangle]:
+                if screenshot is not wrapped[0]:
+                    wrapped[:] = [screenshot, OcrScreenshot(screenshot)]
+                return search(wrapped[1])
+
+        timeout_s = self._timeout_s if step.timeout_s is None else step.timeout_s
+        result = wait_for(self._display, probe, timeout_s, step.stable, self._clock, prefetcher)
+        if reused and result.screenshot is not None:
+            return result.found, wrapped[1] if result.screenshot is wrapped[0] else OcrScreenshot(result.screenshot)
+        return result.found, result.screenshot
+
+    def _unchanged(self, step: Find, rec: Rectangle, screenshot: Any) -> bool:
+        """
+        Tells whether a clicked target is still shown where it was clicked, so the click had no effect.
+
+        Args:
+            step (Find): The step that found the target.
+            rec (Rectangle): The rectangle bounding the target when it was clicked.
+            screenshot (Any): The latest screenshot.
+
+        Returns:
+            bool: True if the target is at the same place, False if it is not or nothing is shown.
+        """
+        shown = self._probe(step)(screenshot) if screenshot is not None else None
+        return shown is not None and ((shown.p1.x, shown.p1.y, shown.p2.x, shown.p2.y) ==
+                                      (rec.p1.x, rec.p1.y, rec.p2.x, rec.p2.y))
+
+    def _act(self, step: Any, target: Optional[Rectangle], prefetcher: FramePrefetcher) -> None:
+        """
+        Performs an action step.
+
+        Args:
+            step (Any): The step.
+            target (Optional[Rectangle]): The target to click, for a `Click` step.
+            prefetcher (FramePrefetcher): The prefetcher of the display, whose grab in progress is outdated
+                by the action.
+
+        Raises:
+            ValueError: If the step is not an action step.
+        """
+        # The device is not used from two threads at once, and a frame grabbed before the action is outdated
+        prefetcher.discard()
+
+        if isinstance(step, Click):
+            self._click(target.center() if step.offset is None else target.p2 + Point(*step.offset))
+        elif isinstance(step, Type):
+            self._keyboard.type(step.text)
+        elif isinstance(step, Press):
+            self._buttons[step.button].press()
+        elif isinstance(step, Swipe):
+            self._swipe(step.swipe)
+        elif isinstance(step, Sleep):
+            self._clock.sleep(step.seconds)
+        else:
+            raise ValueError(f"Unknown flow step {step!r}")
+
+    def _region(self, region: Any) -> Optional[Rectangle]:
+        """
+        Resolves the region of a step.
+
+        Args:
+            region (Any): A Rectangle, its corners, the name of a resource holding them, or None.
+
+        Returns:
+            Optional[Rectangle]: The region, or None for the whole screen.
+        """
+        if isinstance(region, str):
+            region = self._resources.get(region)
+        if region is None or isinstance(region, Rectangle):
+            return region
+        return Rectangle(region)
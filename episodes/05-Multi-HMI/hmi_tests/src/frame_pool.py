@@ -0,0 +1,86 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+from typing import List, Tuple
+import numpy as np
+
+# Most frame buffers a pool keeps for reuse
+MAX_POOLED_FRAMES = 8
+
+# References to a pooled buffer held by the pool list, and by the argument of sys.getrefcount
+_POOL_REFERENCES = 2
+
+
+class FramePool:
+    """
+    Preallocated frame buffers, handed out as views and reused once nothing references them.
+
+    A frame stays valid as long as the screenshot holding it, or any crop of it, is referenced.
+    Crops of a frame are NumPy views sharing its memory, so they keep the whole buffer in use.
+    When every pooled buffer is in use, a frame is allocated outside of the pool and freed as
+    usual, so the memory held by the pool never grows beyond MAX_POOLED_FRAMES buffers.
+    """
+
+    def __init__(self, max_frames: int = MAX_POOLED_FRAMES) -> None:
+        """
+        Initializes an empty pool.
+
+        Args:
+            max_frames (int, optional): The most buffers to keep for reuse. Defaults to MAX_POOLED_FRAMES.
+        """
+        self.max_frames = max_frames
+        self._buffers: List[np.ndarray] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: Tuple[int, ...], dtype: type = np.uint8) -> np.ndarray:
+        """
+        Returns a frame buffer that nothing else references.
+
+        The buffer content is undefined, it is meant to be overwritten completely.
+
+        Args:
+            shape (Tuple[int, ...]): The frame shape, e.g. (height, width, 3).
+            dtype (type, optional): The pixel type. Defaults to np.uint8.
+
+        Returns:
+            np.ndarray: A view of a pooled buffer, or a new array if all pooled buffers are in use.
+        """
+        with self._lock:
+            if self._buffers and (self._buffers[0].shape != shape or self._buffers[0].dtype != dtype):
+                # The screen was rotated or resized, frames of the old size are not reused
+                self._buffers = []
+
+            for index in range(len(self._buffers)):
+                if not self._referenced(index):
+                    return self._buffers[index][...]
+
+            if len(self._buffers) < self.max_frames:
+                self._buffers.append(np.empty(shape, dtype=dtype))
+                return self._buffers[-1][...]
+        return np.empty(shape, dtype=dtype)
+
+    @property
+    def in_use(self) -> int:
+        """The number of pooled buffers referenced by frames or their crops."""
+        with self._lock:
+            return sum(self._referenced(index) for index in range(len(self._buffers)))
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def _referenced(self, index: int) -> bool:
+        """Tells whether a pooled buffer is referenced outside of the pool, by views of it or views of those."""
+        return sys.getrefcount(self._buffers[index]) > _POOL_REFERENCES
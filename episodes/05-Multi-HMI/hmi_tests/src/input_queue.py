@@ -0,0 +1,270 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import sys
+import threading
+from typing import Any, Callable, Deque, List, Optional
+from aurora_tests.interfaces.idisplay import IDisplay
+from clock import Clock, default_clock
+from screen_waits import WaitResult, wait_for
+
+# Resource value with the least time between two inputs the device takes, in seconds, optional
+INPUT_MIN_GAP_KEY = "INPUT_MIN_GAP_S"
+
+# Real time the delivery waits for more inputs to send over a session in the same round trip
+_COALESCE_WINDOW_S = 0.01
+
+
+class _Input:
+    """An input waiting for delivery."""
+
+    def __init__(self, action: Callable[[], Any], target: Any, gap_s: float, caller: Any) -> None:
+        self.action = action
+        self.session = getattr(target, "session", None)
+        self.gap_s = gap_s
+        self.caller = caller
+
+
+class InputQueue:
+    """
+    Delivers mouse clicks, touches and button presses on a background thread, in order and paced.
+
+    Queuing an input returns at once, so the caller can go on, e.g. analysing screenshots, while
+    the inputs are delivered. Each input is followed by a gap before the next input starts, at
+    least the minimum gap the device needs. Inputs to a device with a session, e.g. from the
+    `device_session_touches` fixture, queued in a row are coalesced into one round trip with the
+    gaps waited out on the device. `flush` waits until all inputs are delivered, and `confirm`
+    checks the screen once they are.
+
+    A delivery error drops the inputs queued after it, and is raised by the next `flush`.
+    """
+
+    def __init__(self, min_gap_s: float = 0.0, clock: Optional[Clock] = None) -> None:
+        """
+        Initializes an empty queue.
+
+        Args:
+            min_gap_s (float, optional): The least time between the starts of two inputs, e.g. the
+                `INPUT_MIN_GAP_S` resource value of the device. Defaults to 0.0.
+            clock (Optional[Clock], optional): The clock to pace the inputs with. Defaults to the default clock.
+        """
+        self.min_gap_s = min_gap_s
+        self._clock = clock or default_clock()
+        self._inputs: Deque[_Input] = collections.deque()
+        self._condition = threading.Condition()
+        self._delivering = False
+        self._error: Optional[BaseException] = None
+        self._next_start = 0.0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def click(self, mouse: Any, point: Any, gap_s: float = 0.0) -> None:
+        """
+        Queues a mouse click.
+
+        Args:
+            mouse (Any): The IMouse to click with.
+            point (Any): The point to click.
+            gap_s (float, optional): The time from the start of the click to the next input. Defaults to 0.0.
+        """
+        self._put(lambda: mouse.click(point), mouse, gap_s)
+
+    def tap(self, touches: Any, point: Any, gap_s: float = 0.0) -> None:
+        """
+        Queues a tap.
+
+        Args:
+            touches (Any): The ITouches to tap with.
+            point (Any): The point to tap.
+            gap_s (float, optional): The time from the start of the tap to the next input. Defaults to 0.0.
+        """
+        self._put(lambda: touches.tap(point), touches, gap_s)
+
+    def swipe(self, touches: Any, swipe: Any, gap_s: float = 0.0) -> None:
+        """
+        Queues a swipe.
+
+        Args:
+            touches (Any): The ITouches to swipe with.
+            swipe (Any): The swipe, e.g. a `Swipe` with its start and end points.
+            gap_s (float, optional): The time from the start of the swipe to the next input. Defaults to 0.0.
+        """
+        self._put(lambda: touches.swipe(swipe), touches, gap_s)
+
+    def press(self, button: Any, gap_s: float = 0.0) -> None:
+        """
+        Queues a button press.
+
+        Args:
+            button (Any): The IButton to press.
+            gap_s (float, optional): The time from the start of the press to the next input. Defaults to 0.0.
+        """
+        self._put(button.press, button, gap_s)
+
+    def pause(self, gap_s: float) -> None:
+        """
+        Queues a pause before the next input, e.g. while the screen still changes from an input sent before.
+
+        Args:
+            gap_s (float): The time to wait before the next input.
+        """
+        self._put(lambda: None, None, gap_s)
+
+    @property
+    def pending(self) -> int:
+        """The number of inputs queued or being delivered."""
+        with self._condition:
+            return len(self._inputs) + self._delivering
+
+    def flush(self, settle: bool = True) -> None:
+        """
+        Waits until all queued inputs are delivered.
+
+        Args:
+            settle (bool, optional): Whether to wait out the gap after the last input too, e.g. before
+                grabbing the screen it changes. Defaults to True.
+
+        Raises:
+            Exception: The error delivering an input, if any.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._inputs and not self._delivering)
+            error, self._error = self._error, None
+            next_start = self._next_start
+        if error:
+            raise error
+        if settle:
+            wait = next_start - self._clock.monotonic()
+            if wait > 0:
+                self._clock.sleep(wait)
+
+    def confirm(self, display: IDisplay, probe: Callable[[Any], Any], timeout_s: float = 0.0,
+                stable: bool = False) -> WaitResult:
+        """
+        Waits until all queued inputs are delivered, then checks their effect on the screen.
+
+        Args:
+            display (IDisplay): The display to grab.
+            probe (Callable[[Any], Any]): Called with each screenshot, returns a truthy value when found.
+            timeout_s (float, optional): The time to wait for the probe to find something. Defaults to
+                0.0, a single check.
+            stable (bool, optional): Whether to wait until the screen stops changing as in `wait_for`.
+                Defaults to False.
+
+        Returns:
+            WaitResult: The result of the wait.
+
+        Raises:
+            Exception: The error delivering an input, if any.
+        """
+        self.flush(settle=False)
+        return wait_for(display, probe, timeout_s, stable=stable, clock=self._clock)
+
+    def close(self) -> None:
+        """Waits until all queued inputs are delivered and stops the background thread."""
+        try:
+            self.flush(settle=False)
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            if self._thread:
+                self._thread.join()
+                self._thread = None
+
+    def __enter__(self) -> "InputQueue":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            # The caller failed, the inputs it queued are no longer wanted
+            with self._condition:
+                self._inputs.clear()
+        self.close()
+
+    def _put(self, action: Callable[[], Any], target: Any, gap_s: float) -> None:
+        """Queues an input and starts the delivery thread if needed."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The input queue is closed")
+            self._inputs.append(_Input(action, target, max(gap_s, self.min_gap_s), sys._getframe(2)))
+            self._condition.notify_all()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._deliver_all, name="input-queue", daemon=True)
+                self._thread.start()
+
+    def _deliver_all(self) -> None:
+        """Delivers the queued inputs until the queue is closed."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._inputs or self._closed)
+                if not self._inputs:
+                    return
+                self._delivering = True
+                group = self._take_group()
+
+            try:
+                self._deliver(group)
+            except Exception as error:
+                with self._condition:
+                    self._error = self._error or error
+                    self._inputs.clear()
+            finally:
+                with self._condition:
+                    self._delivering = False
+                    self._condition.notify_all()
+
+    def _take_group(self) -> List[_Input]:
+        """
+        Takes the next inputs to deliver in one go, called with the condition held.
+
+        Returns:
+            List[_Input]: The first queued input, and the inputs over the same session queued right after it.
+        """
+        group = [self._inputs.popleft()]
+        session = group[0].session
+        while session is not None:
+            if not self._inputs and not self._closed:
+                # The caller is likely still queuing, e.g. the digits of a PIN
+                self._condition.wait(_COALESCE_WINDOW_S)
+            if not self._inputs or self._inputs[0].session is not session:
+                break
+            group.append(self._inputs.popleft())
+        return group
+
+    def _deliver(self, group: List[_Input]) -> None:
+        """Delivers a group of inputs, after the gap of the input before."""
+        wait = self._next_start - self._clock.monotonic()
+        if wait > 0:
+            self._clock.sleep(wait)
+
+        thread = threading.current_thread()
+        try:
+            if group[0].session is None:
+                thread.caller_frame = group[0].caller
+                self._next_start = self._clock.monotonic() + group[0].gap_s
+                group[0].action()
+                return
+
+            with group[0].session.batch() as batch:
+                for index, queued in enumerate(group):
+                    if index and group[index - 1].gap_s > 0:
+                        batch.pause(group[index - 1].gap_s)
+                    thread.caller_frame = queued.caller
+                    queued.action()
+            # The device waited out the gaps inside the batch, the last one is waited out here
+            self._next_start = self._clock.monotonic() + group[-1].gap_s
+        finally:
+            thread.caller_frame = None
@@ -0,0 +1,137 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+from aurora_tests.rectangle import Rectangle
+from screen_text import find_in_lines, ocr_available, recognize_lines, resource_folder, update_json_file
+
+# Name of the navigation map file written next to the resource images
+NAVIGATION_MAP_FILE_NAME = "navigation_map.json"
+
+# Device key of the maps of devices that are not told apart
+DEFAULT_DEVICE = "default"
+
+
+class NavigationMap:
+    """
+    Remembers how far down scrolled screens show their texts, e.g. app names and settings menus.
+
+    For every device, a found text is recorded with the number of swipes from the top it took
+    and where the text was on the screen. The map is kept in a file next to the resource
+    images, so it is per resource set and lasts across test runs.
+    """
+
+    _VERIFY_MARGIN_PX: int = 40
+
+    def __init__(self, resources: Dict, device: str = DEFAULT_DEVICE, map_file: Optional[str] = None) -> None:
+        """
+        Initializes the map and loads the positions recorded in earlier runs.
+
+        Args:
+            resources (Dict): The resource values, used to locate the resource folder.
+            device (str, optional): The device the positions are recorded for, e.g. its serial.
+                Defaults to DEFAULT_DEVICE.
+            map_file (Optional[str], optional): The map file. Defaults to NAVIGATION_MAP_FILE_NAME in
+                the folder of the resource images.
+        """
+        self._map_file = map_file or os.path.join(resource_folder(resources), NAVIGATION_MAP_FILE_NAME)
+        self._device = device
+        self._positions: Dict[str, Dict] = self._load().get(device, {})
+
+    def lookup(self, text: str) -> Optional[Tuple[int, Rectangle]]:
+        """
+        Returns where a text was found.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            Optional[Tuple[int, Rectangle]]: The number of swipes from the top and the region to verify
+                the text in, or None if the text is not mapped.
+        """
+        position = self._positions.get(text)
+        if not position:
+            return None
+        x1, y1, x2, y2 = position["rect"]
+        margin = self._VERIFY_MARGIN_PX
+        return position["swipes"], Rectangle([max(x1 - margin, 0), max(y1 - margin, 0), x2 + margin, y2 + margin])
+
+    def record(self, text: str, swipes: int, rec: Rectangle) -> None:
+        """
+        Records where a text was found and saves the map.
+
+        Args:
+            text (str): The found text.
+            swipes (int): The number of swipes from the top it took.
+            rec (Rectangle): The rectangle bounding the found text.
+        """
+        position = {"swipes": swipes, "rect": [int(rec.p1.x), int(rec.p1.y), int(rec.p2.x), int(rec.p2.y)]}
+        if self._positions.get(text) != position:
+            self._save(lambda positions: positions.__setitem__(text, position))
+
+    def forget(self, text: str) -> None:
+        """
+        Removes a text from the map, e.g. when it is no longer where it was recorded.
+
+        Args:
+            text (str): The text.
+        """
+        if text in self._positions:
+            self._save(lambda positions: positions.pop(text, None))
+
+    def _load(self) -> Dict[str, Dict]:
+        """Reads the maps of all devices from the file."""
+        try:
+            with open(self._map_file) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, change: Callable[[Dict[str, Dict]], Any]) -> None:
+        """
+        Changes the map of the device in the file, keeping the changes other test processes made meanwhile.
+
+        Args:
+            change (Callable[[Dict[str, Dict]], Any]): Changes the positions of the device in place.
+        """
+        def update(maps: Dict[str, Dict]) -> None:
+            change(maps.setdefault(self._device, {}))
+
+        self._positions = update_json_file(self._map_file, update)[self._device]
+
+
+def find_text_in_region(screenshot: Any, text: str, region: Rectangle) -> Optional[Rectangle]:
+    """
+    Finds a text in a small region, recognizing only the pixels of that region.
+
+    Args:
+        screenshot (Any): The screenshot, keeping its captured frame in the `image` attribute.
+        text (str): The text to find.
+        region (Rectangle): The region to search in.
+
+    Returns:
+        Optional[Rectangle]: The rectangle bounding the found text on the screenshot, or None if not found.
+    """
+    if not ocr_available() or getattr(screenshot, "image", None) is None:
+        return screenshot.find_text(text, region)
+
+    x0, y0 = max(int(region.p1.x), 0), max(int(region.p1.y), 0)
+    lines = recognize_lines(np.asarray(screenshot.image)[y0:int(region.p2.y), x0:int(region.p2.x)])
+    rec = find_in_lines(lines, text)
+    if rec is None:
+        return None
+    return Rectangle([rec.p1.x + x0, rec.p1.y + y0, rec.p2.x + x0, rec.p2.y + y0])
@@ -0,0 +1,372 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+import cv2
+import numpy as np
+import pytest
+from aurora_tests.rectangle import Rectangle
+from clock import Clock, default_clock
+from frame_diff import ChangeDetector
+from frame_screenshot import FrameScreenshot
+from step_profiler import helper_stack
+
+# Environment variable with the folder to record the tests into. Recording is off when it is not set.
+RECORD_ENV = "HMI_RECORD_DIR"
+
+# Index file of a recording, next to its frame images
+RECORDING_FILE = "recording.json"
+
+# Device name of the single device tests, using the `display`, `mouse` and `keyboard` fixtures
+DEFAULT_DEVICE = "default"
+
+# Fixtures of single device tests and of multi device tests, by device name
+_SINGLE_DEVICE_FIXTURES = ("display", "mouse", "keyboard")
+_MULTI_DEVICE_FIXTURES = ("device_display", "device_touches", "device_buttons",
+                          "device_stream_display", "device_session_touches", "device_session_buttons")
+
+# Input methods recorded and replayed
+_INPUT_METHODS = ("click", "tap", "swipe", "press", "type")
+
+# Largest distance between a replayed and a recorded input position that still counts as the same input
+_INPUT_TOLERANCE_PX = 20
+
+
+class Recorder:
+    """
+    Records the frames grabbed from a device and the inputs sent to it during a test.
+
+    Every frame is stored with the number of inputs sent before it and its delay after the last
+    of them, and every frame and input with the helper stack it was called from. Frames showing
+    the same as the previous one are stored only once. The words of a frame are stored with it
+    if the screenshot already knows them, e.g. one drawn by a simulated device.
+    """
+
+    def __init__(self, folder: str, clock: Optional[Clock] = None) -> None:
+        """
+        Initializes the recorder.
+
+        Args:
+            folder (str): The folder to write the recording to.
+            clock (Optional[Clock], optional): The clock telling the delays of the frames, e.g. the
+                VirtualClock of a simulated device. Defaults to the default clock.
+        """
+        self.folder = folder
+        self.frames: List[Dict] = []
+        self.inputs: List[Dict] = []
+        self.lines: Dict[str, List] = {}
+        self._clock = clock or default_clock()
+        self._detector = ChangeDetector()
+        self._file: Optional[str] = None
+        self._input_at = self._clock.monotonic()
+        os.makedirs(folder, exist_ok=True)
+
+    def frame(self, screenshot: Any, stack: List[str]) -> None:
+        """
+        Records a grabbed frame.
+
+        Args:
+            screenshot (Any): The grabbed screenshot, keeping its captured frame in the `image` attribute.
+            stack (List[str]): The helper stack the frame was grabbed from.
+        """
+        if screenshot is None:
+            return
+        if self._detector.changed(screenshot):
+            self._file = f"{len(self.frames):04d}.png"
+            cv2.imwrite(os.path.join(self.folder, self._file), np.asarray(screenshot.image))
+            lines = getattr(screenshot, "recognized_lines", None)
+            if lines is not None:
+                self.lines[self._file] = [[[word, [int(rec.p1.x), int(rec.p1.y), int(rec.p2.x), int(rec.p2.y)]]
+                                           for word, rec in line] for line in lines]
+        self.frames.append({"file": self._file, "input": len(self.inputs),
+                            "delay_s": round(self._clock.monotonic() - self._input_at, 4), "stack": stack})
+
+    def input(self, kind: str, args: Any, stack: List[str]) -> None:
+        """
+        Records a sent input.
+
+        Args:
+            kind (str): The input method, e.g. "click".
+            args (Any): The input position, swipe, button name or typed text.
+            stack (List[str]): The helper stack the input was sent from.
+        """
+        self.inputs.append({"kind": kind, "args": args, "stack": stack})
+        self._input_at = self._clock.monotonic()
+
+    def save(self) -> None:
+        """Writes the recording index."""
+        recording = {"frames": self.frames, "inputs": self.inputs}
+        if self.lines:
+            recording["lines"] = self.lines
+        with open(os.path.join(self.folder, RECORDING_FILE), "w") as file:
+            json.dump(recording, file, indent=1)
+
+
+class Replay:
+    """
+    Plays back a recording of a device.
+
+    A grab returns the last recorded frame the device showed at that point: after as many
+    inputs as were sent so far, and no later after the last input than the time passed on the
+    clock. Inputs that differ from the recorded ones are collected as divergences. Frames whose
+    words were recorded are searched for texts among them, without OCR.
+    """
+
+    def __init__(self, folder: str, clock: Clock) -> None:
+        """
+        Initializes the replay and loads all frames of the recording.
+
+        Args:
+            folder (str): The folder of the recording.
+            clock (Clock): The clock telling the time passed, e.g. a VirtualClock.
+
+        Raises:
+            FileNotFoundError: If the recording does not exist.
+        """
+        with open(os.path.join(folder, RECORDING_FILE)) as file:
+            recording = json.load(file)
+        self.frames: List[Dict] = recording["frames"]
+        self.inputs: List[Dict] = recording["inputs"]
+        self.divergences: List[str] = []
+        self._clock = clock
+        self._images = {file: cv2.imread(os.path.join(folder, file), cv2.IMREAD_COLOR)
+                        for file in {frame["file"] for frame in self.frames}}
+        self._lines = {file: [[(word, Rectangle(corners)) for word, corners in line] for line in lines]
+                       for file, lines in recording.get("lines", {}).items()}
+        self._keys = [(frame["input"], frame["delay_s"]) for frame in self.frames]
+        self.rewind()
+
+    def rewind(self, step: Optional[str] = None) -> None:
+        """
+        Starts the replay over, at the beginning or where a helper was first called.
+
+        Args:
+            step (Optional[str], optional): The helper to start at, as in the recorded stacks, e.g.
+                "login_logic" or "BtConnectivityTester.open_app". Defaults to None, meaning the beginning.
+
+        Raises:
+            ValueError: If the helper was not called in the recording.
+        """
+        self.divergences.clear()
+        self._sent = 0
+        self._input_at = self._clock.monotonic()
+        if step is None:
+            return
+
+        first_frame = next((frame for frame in self.frames if step in frame["stack"]), None)
+        first_input = next((index for index, sent in enumerate(self.inputs) if step in sent["stack"]), None)
+        if first_frame is None and first_input is None:
+            raise ValueError(f"{step} was not called in the recording")
+
+        if first_frame is not None and (first_input is None or first_frame["input"] <= first_input):
+            self._sent = first_frame["input"]
+            self._input_at -= first_frame["delay_s"]
+        else:
+            # The helper starts with an input, on the screen shown by the last frame before it
+            self._sent = first_input
+            self._input_at -= max((frame["delay_s"] for frame in self.frames if frame["input"] == first_input),
+                                  default=0.0)
+
+    def images(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the distinct frames of the recording.
+
+        Returns:
+            Dict[str, np.ndarray]: The BGR frames by file name.
+        """
+        return dict(self._images)
+
+    def grab(self) -> FrameScreenshot:
+        """
+        Returns the frame the device showed at this point of the recording.
+
+        Returns:
+            FrameScreenshot: The frame.
+        """
+        index = bisect.bisect_right(self._keys, (self._sent, self._clock.monotonic() - self._input_at))
+        file = self.frames[max(index - 1, 0)]["file"]
+        return FrameScreenshot(self._images[file], lines=self._lines.get(file))
+
+    def send(self, kind: str, args: Any) -> None:
+        """
+        Sends an input, comparing it with the recorded one.
+
+        Args:
+            kind (str): The input method, e.g. "click".
+            args (Any): The input position, swipe, button name or typed text.
+        """
+        if self._sent >= len(self.inputs):
+            self.divergences.append(f"{kind} {args} after the last recorded input")
+        elif not _same_input(self.inputs[self._sent], kind, args):
+            self.divergences.append(f"{kind} {args} instead of {self.inputs[self._sent]['kind']} "
+                                    f"{self.inputs[self._sent]['args']}")
+        self._sent += 1
+        self._input_at = self._clock.monotonic()
+
+
+class ReplayDisplay:
+    """A display grabbing the frames of a replay, in place of an IDisplay."""
+
+    def __init__(self, replay: Replay) -> None:
+        self._replay = replay
+
+    def grab(self) -> FrameScreenshot:
+        """Grabs the frame the device showed at this point of the recording."""
+        return self._replay.grab()
+
+
+class ReplayMouse:
+    """A mouse sending clicks to a replay, in place of an IMouse."""
+
+    def __init__(self, replay: Replay) -> None:
+        self._replay = replay
+
+    def click(self, point: Any) -> None:
+        """Clicks at a point."""
+        self._replay.send("click", _input_args(point))
+
+
+class ReplayKeyboard:
+    """A keyboard sending typed texts to a replay, in place of an IKeyboard."""
+
+    def __init__(self, replay: Replay) -> None:
+        self._replay = replay
+
+    def type(self, text: str) -> None:
+        """Types a text."""
+        self._replay.send("type", text)
+
+
+class ReplayTouches:
+    """Touches sending taps and swipes to a replay, in place of an ITouches."""
+
+    def __init__(self, replay: Replay) -> None:
+        self._replay = replay
+
+    def tap(self, point: Any) -> None:
+        """Taps at a point."""
+        self._replay.send("tap", _input_args(point))
+
+    def swipe(self, swipe: Any) -> None:
+        """Swipes from x1, y1 to x2, y2."""
+        self._replay.send("swipe", _input_args(swipe))
+
+
+class ReplayButton:
+    """A button sending presses to a replay, in place of an IButton."""
+
+    def __init__(self, replay: Replay, name: str) -> None:
+        self._replay = replay
+        self._name = name
+
+    def press(self) -> None:
+        """Presses the button."""
+        self._replay.send("press", self._name)
+
+
+@pytest.fixture(autouse=True)
+def record_session(request, monkeypatch) -> Iterator[Optional[Dict[str, Recorder]]]:
+    """
+    Records the test if the HMI_RECORD_DIR environment variable names a folder.
+
+    The frames and inputs of every device are written to `<folder>/<test>/<device>`, for
+    replaying them in the benchmarks. It is used by importing it into a test module:
+        from replay import record_session
+    """
+    folder = os.environ.get(RECORD_ENV)
+    if not folder:
+        yield None
+        return
+
+    sources = os.path.dirname(str(request.fspath))
+    test = request.function.__name__
+    recorders: Dict[str, Recorder] = {}
+
+    def hook(value: Any, device: str, button: Optional[str] = None) -> None:
+        recorder = recorders.get(device) or recorders.setdefault(device, Recorder(os.path.join(folder, test, device)))
+        grab = getattr(value, "grab", None)
+        if callable(grab):
+            def recorded_grab(grab=grab):
+                screenshot = grab()
+                recorder.frame(screenshot, helper_stack(sys._getframe(1), sources, test))
+                return screenshot
+            monkeypatch.setattr(value, "grab", recorded_grab)
+        for method in _INPUT_METHODS:
+            function = getattr(value, method, None)
+            if callable(function):
+                def recorded_input(*args, method=method, function=function):
+                    result = function(*args)
+                    recorder.input(method, button if method == "press" else _input_args(*args),
+                                   helper_stack(sys._getframe(1), sources, test))
+                    return result
+                monkeypatch.setattr(value, method, recorded_input)
+
+    for name in _SINGLE_DEVICE_FIXTURES:
+        if name in request.fixturenames:
+            hook(request.getfixturevalue(name), DEFAULT_DEVICE)
+    for name in _MULTI_DEVICE_FIXTURES:
+        if name in request.fixturenames:
+            for device, value in request.getfixturevalue(name).items():
+                if isinstance(value, dict):
+                    for button, item in value.items():
+                        hook(item, device, button)
+                else:
+                    hook(value, device)
+
+    yield recorders
+    for recorder in recorders.values():
+        recorder.save()
+
+
+def _input_args(*args: Any) -> Any:
+    """
+    Returns the arguments of an input call in a JSON form.
+
+    Args:
+        *args (Any): The arguments, e.g. a point, a swipe or a text.
+
+    Returns:
+        Any: A point as [x, y], a sequence as a list, or the single argument as is.
+    """
+    if len(args) != 1:
+        return [_input_args(arg) for arg in args]
+    value = args[0]
+    if hasattr(value, "x") and hasattr(value, "y"):
+        return [int(value.x), int(value.y)]
+    if isinstance(value, (tuple, list)):
+        return [int(item) for item in value]
+    return value
+
+
+def _same_input(recorded: Dict, kind: str, args: Any) -> bool:
+    """
+    Checks whether an input is the recorded one, allowing positions to differ a little.
+
+    Args:
+        recorded (Dict): The recorded input.
+        kind (str): The input method.
+        args (Any): The input arguments in the JSON form.
+
+    Returns:
+        bool: True if the input is the recorded one, False otherwise.
+    """
+    if recorded["kind"] != kind:
+        return False
+    if isinstance(args, list) and isinstance(recorded["args"], list) and len(args) == len(recorded["args"]):
+        return all(abs(a - b) <= _INPUT_TOLERANCE_PX for a, b in zip(args, recorded["args"]))
+    return recorded["args"] == args
@@ -0,0 +1,264 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from aurora_tests.interfaces.idisplay import IDisplay
+from aurora_tests.rectangle import Rectangle
+from clock import Clock, default_clock
+from frame_diff import ChangeDetector, frame_sample, samples_differ
+
+# First and longest pause between two screen grabs while waiting
+MIN_POLL_INTERVAL_S = 0.05
+MAX_POLL_INTERVAL_S = 0.5
+
+# Factor the pause grows by after every grab without the expected content
+_POLL_BACKOFF = 1.5
+
+# Screenshots in a row counted as unchanged after which the next one is probed anyway, in
+# case the change detection missed a change
+REPROBE_POLLS = 5
+
+
+class WaitResult:
+    """The outcome of waiting for screen content."""
+
+    def __init__(self, found: Any, screenshot: Any, elapsed_s: float) -> None:
+        """
+        Initializes the wait result.
+
+        Args:
+            found (Any): What was found, e.g. the rectangle bounding the found text, or None on timeout.
+            screenshot (Any): The last grabbed screenshot.
+            elapsed_s (float): How long the wait took.
+        """
+        self.found = found
+        self.screenshot = screenshot
+        self.elapsed_s = elapsed_s
+
+    def __bool__(self) -> bool:
+        return self.found is not None
+
+    def __repr__(self) -> str:
+        return f"WaitResult(found={self.found!r}, elapsed_s={self.elapsed_s:.3f})"
+
+
+class FramePrefetcher:
+    """
+    Grabs the next screenshot in the background while the current one is searched.
+
+    Grabs run one at a time on a single thread, so the display is never grabbed twice at once.
+    Before the device is used otherwise, e.g. tapped, the grab in progress must be discarded.
+    """
+
+    def __init__(self, display: IDisplay) -> None:
+        """
+        Initializes the prefetcher.
+
+        Args:
+            display (IDisplay): The display to grab.
+        """
+        self._display = display
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame_prefetch")
+        self._pending: Optional[Future] = None
+
+    def grab(self) -> Any:
+        """
+        Returns the prefetched screenshot, or grabs one if none is prefetched.
+
+        Returns:
+            Any: The screenshot, or None if the display shows nothing.
+        """
+        pending, self._pending = self._pending, None
+        return pending.result() if pending else self._display.grab()
+
+    def prefetch(self) -> None:
+        """Starts grabbing the next screenshot, unless a grab is in progress already."""
+        if self._pending is None:
+            self._pending = self._executor.submit(self._grab_for, sys._getframe(1))
+
+    def discard(self) -> None:
+        """Waits until the grab in progress completes and drops its screenshot, as it is outdated."""
+        pending, self._pending = self._pending, None
+        if pending:
+            pending.exception()
+
+    def close(self) -> None:
+        """Discards the grab in progress and stops the background thread."""
+        self.discard()
+        self._executor.shutdown()
+
+    def _grab_for(self, caller: Any) -> Any:
+        """Grabs the display on behalf of a caller, which profilers and recorders attribute the grab to."""
+        thread = threading.current_thread()
+        thread.caller_frame = caller
+        try:
+            return self._display.grab()
+        finally:
+            thread.caller_frame = None
+
+
+def wait_for(display: IDisplay, probe: Callable[[Any], Any], timeout_s: float, stable: bool = False,
+             clock: Optional[Clock] = None, prefetcher: Optional[FramePrefetcher] = None) -> WaitResult:
+    """
+    Grabs the screen until the probe finds something on it or the timeout expires.
+
+    Screens are grabbed quickly at first and less often the longer the wait takes. A screenshot
+    showing the same as the previous one is not probed again, except after REPROBE_POLLS such
+    screenshots in a row. With a prefetcher, while the screen changes, the next screenshot is
+    grabbed during the search of the current one, without pausing.
+
+    Args:
+        display (IDisplay): The display to grab.
+        probe (Callable[[Any], Any]): Called with every grabbed screenshot, returns what was found or None.
+        timeout_s (float): The longest time to wait.
+        stable (bool, optional): Whether the probe must find the same on two screenshots in a row,
+            e.g. to not tap a text while it still moves with a scrolling list. Defaults to False.
+        clock (Optional[Clock], optional): The clock to wait with. Defaults to the default clock.
+        prefetcher (Optional[FramePrefetcher], optional): The prefetcher of the display to grab with.
+            Defaults to None, meaning every screenshot is grabbed when it is needed.
+
+    Returns:
+        WaitResult: What the probe found with the screenshot it was found on, and how long the wait took.
+    """
+    clock = clock or default_clock()
+    start = clock.monotonic()
+    interval = MIN_POLL_INTERVAL_S
+    previous = None
+    detector = ChangeDetector()
+    unchanged = 0
+
+    while True:
+        screenshot = prefetcher.grab() if prefetcher else display.grab()
+        prefetched = False
+        if screenshot is None:
+            found = None
+        elif detector.changed(screenshot):
+            if prefetcher:
+                # The screen is in transition, so its next state is grabbed while this one is searched
+                prefetcher.prefetch()
+                prefetched = True
+            found = probe(screenshot)
+            unchanged = 0
+        elif unchanged >= REPROBE_POLLS:
+            found = probe(screenshot)
+            unchanged = 0
+        else:
+            found = previous
+            unchanged += 1
+        elapsed = clock.monotonic() - start
+        if found and (not stable or _same(found, previous)):
+            return WaitResult(found, screenshot, elapsed)
+        if elapsed >= timeout_s:
+            return WaitResult(None, screenshot, elapsed)
+        previous = found
+
+        if prefetched:
+            interval = MIN_POLL_INTERVAL_S
+            continue
+        clock.sleep(min(interval, timeout_s - elapsed))
+        interval = min(interval * _POLL_BACKOFF, MAX_POLL_INTERVAL_S)
+
+
+def wait_for_text(display: IDisplay, text: str, timeout_s: float, region: Optional[Rectangle] = None,
+                  text_regions: Optional[Any] = None, stable: bool = False,
+                  clock: Optional[Clock] = None) -> WaitResult:
+    """
+    Waits until a text appears on the screen.
+
+    Args:
+        display (IDisplay): The display to grab.
+        text (str): The text to wait for.
+        timeout_s (float): The longest time to wait.
+        region (Optional[Rectangle], optional): The region to search in. Defaults to the whole screen.
+        text_regions (Optional[Any], optional): The TextRegions to search with. Defaults to None,
+            meaning the screenshot is searched directly.
+        stable (bool, optional): Whether the text must be found at the same place on two
+            screenshots in a row. Defaults to False.
+        clock (Optional[Clock], optional): The clock to wait with. Defaults to the default clock.
+
+    Returns:
+        WaitResult: The rectangle bounding the found text, and how long the wait took.
+    """
+    if text_regions:
+        return wait_for(display, lambda screenshot: text_regions.find_text(screenshot, text, region),
+                        timeout_s, stable, clock)
+    return wait_for(display, lambda screenshot: screenshot.find_text(text, region), timeout_s, stable, clock)
+
+
+def wait_for_image(display: IDisplay, image: str, timeout_s: float, region: Optional[Rectangle] = None,
+                   stable: bool = False, clock: Optional[Clock] = None) -> WaitResult:
+    """
+    Waits until an image appears on the screen.
+
+    Args:
+        display (IDisplay): The display to grab.
+        image (str): The image file to wait for.
+        timeout_s (float): The longest time to wait.
+        region (Optional[Rectangle], optional): The region to search in. Defaults to the whole screen.
+        stable (bool, optional): Whether the image must be found at the same place on two
+            screenshots in a row. Defaults to False.
+        clock (Optional[Clock], optional): The clock to wait with. Defaults to the default clock.
+
+    Returns:
+        WaitResult: The rectangle bounding the found image, and how long the wait took.
+    """
+    return wait_for(display, lambda screenshot: screenshot.find_image(image, region), timeout_s, stable, clock)
+
+
+def wait_for_change(display: IDisplay, timeout_s: float, reference: Optional[Any] = None,
+                    clock: Optional[Clock] = None) -> WaitResult:
+    """
+    Waits until the screen differs from a reference screenshot.
+
+    Args:
+        display (IDisplay): The display to grab.
+        timeout_s (float): The longest time to wait.
+        reference (Optional[Any], optional): The screenshot to compare with. Defaults to a screenshot
+            grabbed when the wait starts.
+        clock (Optional[Clock], optional): The clock to wait with. Defaults to the default clock.
+
+    Returns:
+        WaitResult: The first changed screenshot as found, and how long the wait took.
+    """
+    if reference is None:
+        reference = display.grab()
+    reference_sample = frame_sample(reference)
+
+    def changed(screenshot: Any) -> Any:
+        if samples_differ(frame_sample(screenshot), reference_sample):
+            return screenshot
+        return None
+
+    return wait_for(display, changed, timeout_s, clock=clock)
+
+
+def _same(found: Any, previous: Any) -> bool:
+    """
+    Checks whether two probe results are the same, comparing rectangles by their corners.
+
+    Args:
+        found (Any): The current probe result.
+        previous (Any): The probe result on the previous screenshot.
+
+    Returns:
+        bool: True if both results are the same, False otherwise.
+    """
+    if isinstance(found, Rectangle) and isinstance(previous, Rectangle):
+        return ((found.p1.x, found.p1.y, found.p2.x, found.p2.y) ==
+                (previous.p1.x, previous.p1.y, previous.p2.x, previous.p2.y))
+    return previous is not None and found == previous
+
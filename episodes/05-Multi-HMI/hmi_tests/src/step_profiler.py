@@ -0,0 +1,265 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+import pytest
+
+# Environment variable with the JSON trace file to write. Profiling is off when it is not set.
+TRACE_ENV = "HMI_PROFILE_TRACE"
+
+# Fixtures whose objects are profiled, if a test uses them
+_PROFILED_FIXTURES = ("display", "mouse", "keyboard", "device_display", "device_touches", "device_buttons",
+                      "device_stream_display", "device_session_touches", "device_session_buttons")
+
+# Methods of the fixture objects and of the grabbed screenshots that are profiled
+_PROFILED_METHODS = ("grab", "click", "tap", "swipe", "press")
+_SCREENSHOT_METHODS = ("find_text", "find_image")
+
+# Functions of the helper modules that are profiled, with their span names
+_PROFILED_FUNCTIONS = {"recognize_lines": "ocr", "find_images": "match"}
+
+# Number of costs listed by the pytest summary
+_SUMMARY_TOP = 10
+
+# Modules wrapping the profiled calls themselves, left out of the span stacks
+_INSTRUMENTATION_MODULES = ("step_profiler", "replay", "clock")
+
+
+class Span:
+    """A timed call of a profiled operation."""
+
+    def __init__(self, name: str, stack: List[str], start_s: float, thread: int) -> None:
+        """
+        Initializes the span.
+
+        Args:
+            name (str): The operation, e.g. "grab" or "sleep".
+            stack (List[str]): The helpers the operation was called from, outermost first,
+                starting with the test.
+            start_s (float): When the call started, in perf_counter seconds.
+            thread (int): The thread the call was made from.
+        """
+        self.name = name
+        self.stack = stack
+        self.start_s = start_s
+        self.thread = thread
+        self.duration_s = 0.0
+        self.self_s = 0.0
+
+    @property
+    def step(self) -> str:
+        """The outermost helper the operation was called from, or the test if called from it directly."""
+        return self.stack[1] if len(self.stack) > 1 else self.stack[0]
+
+
+class StepProfiler:
+    """
+    Collects spans of the operations done in tests and reports them after the session.
+
+    The spans are written as a Chrome trace, which chrome://tracing and https://ui.perfetto.dev
+    show on a timeline, and as folded stacks next to it for flame graph tools. The pytest
+    summary lists the steps and operations that cost the most, and the share of time slept.
+    """
+
+    def __init__(self, trace_file: str) -> None:
+        """
+        Initializes the profiler.
+
+        Args:
+            trace_file (str): The JSON trace file to write.
+        """
+        self.trace_file = trace_file
+        self.spans: List[Span] = []
+        self.tests_s = 0.0
+        self._origin_s = time.perf_counter()
+        self._active = threading.local()
+
+    def wrap(self, name: str, function: Callable, sources: str, test: str) -> Callable:
+        """
+        Returns a function recording a span for every call of another function.
+
+        Args:
+            name (str): The span name.
+            function (Callable): The function to profile.
+            sources (str): The folder of the test sources, whose functions make up the span stack.
+            test (str): The name of the running test.
+
+        Returns:
+            Callable: The profiled function.
+        """
+        @functools.wraps(function)
+        def profiled(*args, **kwargs):
+            span = Span(name, helper_stack(sys._getframe(1), sources, test), time.perf_counter(),
+                        threading.get_ident())
+            parents = self._active.__dict__.setdefault("spans", [])
+            parents.append(span)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                span.duration_s = time.perf_counter() - span.start_s
+                span.self_s += span.duration_s
+                parents.pop()
+                if parents:
+                    parents[-1].self_s -= span.duration_s
+                self.spans.append(span)
+
+        return profiled
+
+    def write_trace(self) -> None:
+        """Writes the spans as a Chrome trace, and as folded stacks to the same file name with `.folded` added."""
+        events = [{
+            "name": span.name,
+            "cat": span.step,
+            "ph": "X",
+            "ts": round((span.start_s - self._origin_s) * 1e6, 1),
+            "dur": round(span.duration_s * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": span.thread,
+            "args": {"stack": ";".join(span.stack)},
+        } for span in self.spans]
+        with open(self.trace_file, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+        folded: Dict[str, float] = defaultdict(float)
+        for span in self.spans:
+            folded[";".join(span.stack + [span.name])] += span.self_s
+        with open(self.trace_file + ".folded", "w") as file:
+            for stack, self_s in sorted(folded.items()):
+                file.write(f"{stack} {round(self_s * 1e6)}\n")
+
+    def summary(self) -> List[str]:
+        """
+        Returns the report lines of the pytest summary.
+
+        Returns:
+            List[str]: The report lines.
+        """
+        costs: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0])
+        for span in self.spans:
+            cost = costs[(span.step, span.name)]
+            cost[0] += 1
+            cost[1] += span.self_s
+
+        slept_s = sum(span.self_s for span in self.spans if span.name == "sleep")
+        share = slept_s / self.tests_s * 100 if self.tests_s else 0.0
+        lines = [f"tests {self.tests_s:.3f}s, slept {slept_s:.3f}s ({share:.1f}%), trace {self.trace_file}",
+                 f"{'step':40} {'operation':12} {'calls':>6} {'total s':>9} {'mean ms':>9}"]
+        for (step, name), (calls, total_s) in sorted(costs.items(), key=lambda item: -item[1][1])[:_SUMMARY_TOP]:
+            lines.append(f"{step[:40]:40} {name:12} {calls:6} {total_s:9.3f} {total_s / calls * 1000:9.1f}")
+        return lines
+
+    def pytest_sessionfinish(self) -> None:
+        self.write_trace()
+
+    def pytest_terminal_summary(self, terminalreporter) -> None:
+        terminalreporter.write_sep("-", "step profile")
+        for line in self.summary():
+            terminalreporter.write_line(line)
+
+
+@pytest.fixture(autouse=True)
+def step_profile(request, monkeypatch) -> Iterator[Optional[StepProfiler]]:
+    """
+    Profiles the test if the HMI_PROFILE_TRACE environment variable names a trace file.
+
+    Grabs, text and image searches, OCR, template matching, clicks, taps, swipes, button presses
+    and `time.sleep` calls are timed, each attributed to the helper it was called from, e.g.
+    `login_logic` or `BtConnectivityTester.open_app`. It is used by importing it into a test module:
+        from step_profiler import step_profile
+    """
+    trace_file = os.environ.get(TRACE_ENV)
+    if not trace_file:
+        yield None
+        return
+
+    profiler = request.config.pluginmanager.get_plugin("step_profiler")
+    if profiler is None:
+        profiler = StepProfiler(os.path.abspath(trace_file))
+        request.config.pluginmanager.register(profiler, "step_profiler")
+
+    sources = os.path.dirname(str(request.fspath))
+    test = request.function.__name__
+    patched: Set[type] = set()
+
+    def hook_screenshot(screenshot: Any) -> Any:
+        if screenshot is not None and type(screenshot) not in patched:
+            patched.add(type(screenshot))
+            for method in _SCREENSHOT_METHODS:
+                if hasattr(type(screenshot), method):
+                    monkeypatch.setattr(type(screenshot), method,
+                                        profiler.wrap(method, getattr(type(screenshot), method), sources, test))
+        return screenshot
+
+    def hook(value: Any) -> None:
+        if isinstance(value, dict):
+            for item in value.values():
+                hook(item)
+            return
+        for method in _PROFILED_METHODS:
+            if callable(getattr(value, method, None)):
+                function = getattr(value, method)
+                if method == "grab":
+                    grab = function
+                    function = lambda: hook_screenshot(grab())
+                monkeypatch.setattr(value, method, profiler.wrap(method, function, sources, test))
+
+    for name in _PROFILED_FIXTURES:
+        if name in request.fixturenames:
+            hook(request.getfixturevalue(name))
+
+    for module in list(sys.modules.values()):
+        if os.path.dirname(getattr(module, "__file__", None) or "") != sources:
+            continue
+        for function_name, span_name in _PROFILED_FUNCTIONS.items():
+            if callable(getattr(module, function_name, None)):
+                monkeypatch.setattr(module, function_name,
+                                    profiler.wrap(span_name, getattr(module, function_name), sources, test))
+    monkeypatch.setattr(time, "sleep", profiler.wrap("sleep", time.sleep, sources, test))
+
+    start = time.perf_counter()
+    yield profiler
+    profiler.tests_s += time.perf_counter() - start
+
+
+def helper_stack(frame: Any, sources: str, test: str) -> List[str]:
+    """
+    Returns the functions of the test sources a call was made from, outermost first.
+
+    Args:
+        frame (Any): The frame of the caller.
+        sources (str): The folder of the test sources.
+        test (str): The name of the running test, the outermost entry of the stack.
+
+    Returns:
+        List[str]: The test followed by the helper functions, e.g. ["test_x", "login_logic", "wait_for_text"].
+    """
+    # A grab prefetched on another thread belongs to the helper that asked for it
+    frame = getattr(threading.current_thread(), "caller_frame", None) or frame
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        name = getattr(code, "co_qualname", code.co_name)
+        if (os.path.dirname(code.co_filename) == sources and name != test and "<lambda>" not in name
+                and frame.f_globals.get("__name__") not in _INSTRUMENTATION_MODULES):
+            stack.append(name.rsplit("<locals>.", 1)[-1])
+        frame = frame.f_back
+    stack.append(test)
+    return stack[::-1]
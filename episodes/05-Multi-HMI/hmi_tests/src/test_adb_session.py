@@ -0,0 +1,127 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import sys
+from typing import Iterator, List
+import numpy as np
+import pytest
+from aurora_tests.point import Point
+from adb_session import AdbSession
+from android_input import KEY_CODES, SessionButton, SessionTouches
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="The fake adb is started as a script")
+
+# Fake adb speaking the `adb exec-out sh` protocol of a 4x2 device, logging the commands it gets
+FAKE_ADB = """#!{python}
+import struct
+import sys
+
+log = open({log!r}, "a")
+log.write("start\\n")
+log.flush()
+for line in sys.stdin.buffer:
+    command = line.decode().strip()
+    if command == "exit":
+        sys.exit(0)
+    elif command == "getprop ro.build.version.sdk":
+        sys.stdout.buffer.write(b"30\\n")
+    elif command == "screencap":
+        sys.stdout.buffer.write(struct.pack("<IIII", 4, 2, 1, 0) + bytes(range(32)))
+    elif command.startswith("echo "):
+        sys.stdout.buffer.write(command[5:].encode() + b"\\n")
+    else:
+        log.write(command + "\\n")
+        log.flush()
+    sys.stdout.buffer.flush()
+"""
+
+
+@pytest.fixture
+def fake_adb(tmp_path) -> str:
+    """A fake adb executable, logging to `adb.log` next to it."""
+    adb = tmp_path / "adb"
+    adb.write_text(FAKE_ADB.format(python=sys.executable, log=str(tmp_path / "adb.log")))
+    adb.chmod(adb.stat().st_mode | stat.S_IXUSR)
+    return str(adb)
+
+
+@pytest.fixture
+def session(fake_adb) -> Iterator[AdbSession]:
+    """A session to the fake device."""
+    session = AdbSession("FAKE", fake_adb)
+    yield session
+    session.close()
+
+
+def logged(fake_adb: str) -> List[str]:
+    """Returns the lines logged by the fake adb."""
+    with open(os.path.join(os.path.dirname(fake_adb), "adb.log")) as file:
+        return file.read().splitlines()
+
+
+def test_run_returns_output(session, fake_adb):
+    assert session.run("echo hello", "echo world") == "hello\nworld\n"
+    assert session.run("input tap 1 2") == ""
+    assert logged(fake_adb) == ["start", "input tap 1 2"]
+
+
+def test_inputs_share_the_session(session, fake_adb):
+    SessionTouches(session).tap(Point(10, 20))
+    SessionTouches(session).swipe((1, 2, 3, 4))
+    SessionButton(session, KEY_CODES["AndroidButtonHome"]).press()
+
+    assert logged(fake_adb) == ["start", "input tap 10 20", "input swipe 1 2 3 4", "input keyevent 3"]
+
+
+def test_batch_is_one_round_trip(session, fake_adb):
+    touches = SessionTouches(session)
+    buttons = [SessionButton(session, KEY_CODES[f"AndroidButton{digit}"]) for digit in (2, 2, 1, 1)]
+    session.run("echo ready")
+    round_trips = session.round_trips
+
+    with session.batch() as batch:
+        touches.tap(Point(5, 6))
+        batch.pause(0.5)
+        for button in buttons:
+            button.press()
+
+    assert session.round_trips == round_trips + 1
+    assert logged(fake_adb)[1:] == ["input tap 5 6", "sleep 0.5", "input keyevent 9 9 8 8"]
+
+
+def test_screencap(session):
+    frame = session.screencap()
+
+    assert frame.shape == (2, 4, 4)
+    np.testing.assert_array_equal(frame.ravel(), np.arange(32, dtype=np.uint8))
+    assert session.run("echo after") == "after\n"
+
+
+def test_reconnects_after_the_channel_closes(session, fake_adb):
+    session.run("input tap 1 1")
+
+    with pytest.raises(RuntimeError):
+        session.run("exit")
+    session.run("input tap 2 2")
+
+    assert logged(fake_adb) == ["start", "input tap 1 1", "start", "input tap 2 2"]
+
+
+def test_unreachable_device(tmp_path):
+    session = AdbSession("FAKE", str(tmp_path / "missing_adb"))
+
+    with pytest.raises(RuntimeError):
+        session.run("input tap 1 1")
@@ -14,6 +14,9 @@
 
 from aurora_tests.pytest.fixtures import device_display, device_touches, device_buttons, device_resources
 from bt_connectiviy_tester import BtConnectivityTester
+from clock import clock
+from replay import record_session
+from step_profiler import step_profile
 
 # Device constants for easy reference
 DEV_HU = "HeadUnit"  # Represents the Head Unit device
@@ -37,7 +40,8 @@ def test_forget_device_hu(device_display, device_touches, device_buttons, device
         display=device_display[DEV_HU],
         touches=device_touches[DEV_HU],
         buttons=device_buttons[DEV_HU],
-        resources=device_resources[DEV_HU]
+        resources=device_resources[DEV_HU],
+        device=DEV_HU
     )
 
     # Step 1: Open the Settings app on the Head Unit
@@ -68,7 +72,8 @@ def test_forget_device_phone(device_display, device_touches, device_buttons, dev
         display=device_display[DEV_PH],
         touches=device_touches[DEV_PH],
         buttons=device_buttons[DEV_PH],
-        resources=device_resources[DEV_PH]
+        resources=device_resources[DEV_PH],
+        device=DEV_PH
     )
 
     # Step 1: Unlock the Phone using its PIN code
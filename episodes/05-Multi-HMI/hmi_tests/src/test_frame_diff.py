@@ -0,0 +1,62 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import timeit
+import cv2
+import numpy as np
+from frame_diff import ChangeDetector, frame_sample
+
+# Longest time allowed for sampling one 1080p frame, in seconds
+MAX_SAMPLE_TIME_S = 0.001
+
+
+def screen() -> np.ndarray:
+    """Returns a 1080p BGR screen with a header and a few buttons."""
+    image = np.full((1080, 1920, 3), (250, 250, 251), dtype=np.uint8)
+    image[:60] = (135, 92, 5)
+    for x in range(200, 1700, 300):
+        cv2.rectangle(image, (x, 400), (x + 200, 480), (200, 196, 192), cv2.FILLED)
+    return image
+
+
+def test_sampling_a_1080p_frame_is_fast():
+    image = screen()
+    frame_sample(image)
+
+    runs = 50
+    best_s = min(timeit.repeat(lambda: frame_sample(image), number=runs, repeat=5)) / runs
+
+    assert best_s < MAX_SAMPLE_TIME_S
+
+
+def test_small_text_is_a_change():
+    detector = ChangeDetector()
+    image = screen()
+    assert detector.changed(image)
+    assert not detector.changed(image.copy())
+
+    cv2.putText(image, "On", (900, 700), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (20, 20, 20), 2)
+
+    assert detector.changed(image)
+    assert not detector.changed(image)
+
+
+def test_grayscale_frames():
+    detector = ChangeDetector()
+    image = cv2.cvtColor(screen(), cv2.COLOR_BGR2GRAY)
+    assert detector.changed(image)
+
+    image[700:716, 900:904] = 0
+
+    assert detector.changed(image)
@@ -14,6 +14,10 @@
 
 from aurora_tests.pytest.fixtures import device_display, device_touches, device_buttons, device_resources
 from bt_connectiviy_tester import BtConnectivityTester
+from clock import clock
+from device_steps import run_parallel
+from replay import record_session
+from step_profiler import step_profile
 
 # Device constants for easy reference
 DEV_HU = "HeadUnit"  # Represents the Head Unit device
@@ -32,6 +36,8 @@ def test_pair_new_device(device_display, device_touches, device_buttons, device_
     4. Initiating a pairing request from the Phone to the Head Unit.
     5. Accepting the pairing request on both devices.
     6. Verifying that both devices are paired with each other.
+
+    Steps 1-3 run on both devices at the same time, as do steps 5 and 6.
     """
 
     # Instantiate a BtConnectivityTester for the Head Unit
@@ -39,7 +45,8 @@ def test_pair_new_device(device_display, device_touches, device_buttons, device_
         display=device_display[DEV_HU],
         touches=device_touches[DEV_HU],
         buttons=device_buttons[DEV_HU],
-        resources=device_resources[DEV_HU]
+        resources=device_resources[DEV_HU],
+        device=DEV_HU
     )
 
     # Instantiate a BtConnectivityTester for the Phone
@@ -47,27 +54,33 @@ def test_pair_new_device(device_display, device_touches, device_buttons, device_
         display=device_display[DEV_PH],
         touches=device_touches[DEV_PH],
         buttons=device_buttons[DEV_PH],
-        resources=device_resources[DEV_PH]
+        resources=device_resources[DEV_PH],
+        device=DEV_PH
     )
 
-    # Step 1: Open the Settings app and navigate to the "Connected devices" menu on the Head Unit
-    assert head_unit.open_app("Settings")
-    assert head_unit.open_settings_menu("Connected devices")
-
-    # Step 2: Unlock the Phone using its PIN code
-    assert phone.unlock("2211")
-
-    # Step 3: Open the Settings app and navigate to the "Connected devices" menu on the Phone
-    assert phone.open_app("Settings")
-    assert phone.open_settings_menu("Connected devices")
+    hu_ready, phone_ready = run_parallel(
+        # Step 1: Open the Settings app and navigate to the "Connected devices" menu on the Head Unit
+        lambda: head_unit.open_app("Settings") and head_unit.open_settings_menu("Connected devices"),
+        # Step 2: Unlock the Phone using its PIN code
+        # Step 3: Open the Settings app and navigate to the "Connected devices" menu on the Phone
+        lambda: (phone.unlock("2211") and phone.open_app("Settings") and
+                 phone.open_settings_menu("Connected devices")),
+    )
+    assert hu_ready, "Head Unit did not open the Connected devices menu"
+    assert phone_ready, "Phone did not open the Connected devices menu"
 
     # Step 4: Initiate a pairing request from the Phone to the Head Unit
     assert phone.request_to_pair("Head Unit")
 
     # Step 5: Accept the pairing request on both devices
-    assert head_unit.accept_to_pair()
-    assert phone.accept_to_pair()
+    hu_accepted, phone_accepted = run_parallel(head_unit.accept_to_pair, phone.accept_to_pair)
+    assert hu_accepted, "Head Unit did not accept the pairing request"
+    assert phone_accepted, "Phone did not accept the pairing request"
 
     # Step 6: Verify that both devices are paired with each other
-    assert head_unit.is_paired_to_device("moto e13")
-    assert phone.is_paired_to_device("Head Unit")
+    hu_paired, phone_paired = run_parallel(
+        lambda: head_unit.is_paired_to_device("moto e13"),
+        lambda: phone.is_paired_to_device("Head Unit"),
+    )
+    assert hu_paired, "Head Unit is not paired to the Phone"
+    assert phone_paired, "Phone is not paired to the Head Unit"
@@ -0,0 +1,125 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+from typing import Iterator
+import pytest
+
+# Environment variable switching the tests to virtual time, for runs against simulated devices and relays
+VIRTUAL_TIME_ENV = "HMI_VIRTUAL_TIME"
+
+
+class Clock:
+    """
+    The time helpers wait and measure with.
+
+    Helpers take a clock instead of calling `time.sleep` and `time.monotonic` themselves, so
+    runs against simulated devices can swap in a VirtualClock.
+    """
+
+    def monotonic(self) -> float:
+        """
+        Returns the current time.
+
+        Returns:
+            float: The time in seconds, only meaningful as a difference to another time of the same clock.
+        """
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Waits for a while.
+
+        Args:
+            seconds (float): The time to wait.
+        """
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """
+    Virtual time: sleeping returns at once and moves the clock ahead instead.
+
+    Sleeps of all threads move the same clock, so steps run in parallel wait out their sleeps
+    one after another in virtual time.
+    """
+
+    def __init__(self, real_time: bool = False) -> None:
+        """
+        Initializes the clock.
+
+        Args:
+            real_time (bool, optional): Whether the clock also runs with the real time, so computing
+                takes time too, e.g. to tell how long helpers would take on a device. Defaults to
+                False, meaning the time moves only by sleeping.
+        """
+        self.slept_s = 0.0
+        self._real_time = real_time
+        self._start_s = time.monotonic()
+        self._lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        if self._real_time:
+            return time.monotonic() - self._start_s + self.slept_s
+        return self.slept_s
+
+    def sleep(self, seconds: float) -> None:
+        with self._lock:
+            self.slept_s += max(seconds, 0.0)
+
+
+# The clock of helpers that are not given one
+_default_clock: Clock = Clock()
+
+
+def default_clock() -> Clock:
+    """
+    Returns the clock of helpers that are not given one.
+
+    Returns:
+        Clock: The real clock, or the clock the running test set up.
+    """
+    return _default_clock
+
+
+def set_default_clock(clock: Clock) -> Clock:
+    """
+    Sets the clock of helpers that are not given one.
+
+    Args:
+        clock (Clock): The new default clock.
+
+    Returns:
+        Clock: The previous default clock.
+    """
+    global _default_clock
+    previous, _default_clock = _default_clock, clock
+    return previous
+
+
+@pytest.fixture(autouse=True)
+def clock() -> Iterator[Clock]:
+    """
+    The clock of the test, also set as the default clock of the helpers during the test.
+
+    It is a VirtualClock if the HMI_VIRTUAL_TIME environment variable is set, the real clock
+    otherwise. It is used by importing it into a test module:
+        from clock import clock
+    """
+    test_clock = VirtualClock() if os.environ.get(VIRTUAL_TIME_ENV) else Clock()
+    previous = set_default_clock(test_clock)
+    yield test_clock
+    set_default_clock(previous)
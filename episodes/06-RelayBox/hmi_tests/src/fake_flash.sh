@@ -0,0 +1,26 @@
+#!/bin/sh
+# Fake flashing script printing fastboot-like output, to try the update without flashing a device.
+#
+# Usage: fake_flash.sh [PARTITION_TO_HANG_AT] [EXIT_CODE] [SLOW_PARTITION]
+# With a partition given, the script hangs after starting to write it, like a stalled transfer.
+# With a slow partition given, writing it takes over a second, reporting its progress in percent.
+
+hang="$1"
+slow="$3"
+for part in boot system vendor; do
+    echo "Sending '$part' (4096 KB)"
+    echo "OKAY [  0.100s]"
+    echo "Writing '$part'"
+    if [ "$part" = "$hang" ]; then
+        sleep 3600
+    fi
+    if [ "$part" = "$slow" ]; then
+        for percent in 25 50 75 100; do
+            sleep 0.3
+            echo "Progress: $percent%"
+        done
+    fi
+    echo "OKAY [  0.050s]"
+done
+echo "Finished. Total time: 0.450s"
+exit "${2:-0}"
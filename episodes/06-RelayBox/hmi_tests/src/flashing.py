@@ -0,0 +1,221 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import queue
+import re
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from power_lifecycle import PowerController
+
+# Environment variable with a flashing script to use instead of the one given, e.g. a fake one
+FLASH_SCRIPT_ENV = "HMI_FLASH_SCRIPT"
+
+# Phase of the script output before the first progress marker
+START_PHASE = "start"
+
+# Progress markers of the fastboot output, e.g. "Sending 'boot' (24576 KB)" or "Writing 'boot'"
+_PHASE_MARKER = re.compile(r"\b(Sending|Writing|Erasing|Flashing)\s+'([^']+)'", re.IGNORECASE)
+_PERCENT_MARKER = re.compile(r"\b(\d{1,3}(?:\.\d+)?)\s*%")
+
+# Lines of output kept for the result, from the end
+_TAIL_LINES = 50
+
+
+class FlashProgress(NamedTuple):
+    """A line of the flashing output, with the phase it belongs to."""
+
+    device: str
+    phase: str
+    # The progress within the phase in percent, if the line tells it
+    percent: Optional[float]
+    line: str
+
+
+class FlashResult:
+    """The outcome of flashing a device."""
+
+    def __init__(self, device: str) -> None:
+        """
+        Initializes the result of a flashing that has not started.
+
+        Args:
+            device (str): The device name.
+        """
+        self.device = device
+        self.exit_code: Optional[int] = None
+        self.timed_out_phase: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        self.tail: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        """Whether the script completed successfully."""
+        return self.exit_code == 0 and self.timed_out_phase is None
+
+    def __repr__(self) -> str:
+        if self.timed_out_phase:
+            return f"{self.device}: timed out in phase {self.timed_out_phase}"
+        return f"{self.device}: exit code {self.exit_code} after {sum(self.phases.values()):.1f}s"
+
+
+class Flasher:
+    """
+    Runs a flashing script, streaming its output and stopping it when a phase takes too long.
+
+    The phases are told by the fastboot progress markers in the output, e.g. "Writing 'boot'"
+    starts the phase "writing boot". Each phase has its own timeout for making no further
+    progress, i.e. no line telling a percentage and no next phase, so a hung transfer is stopped
+    without a long timeout for the whole script, while a long transfer reporting its progress runs on.
+    """
+
+    def __init__(self, script: str, args: Sequence[str] = (), phase_timeouts_s: Optional[Dict[str, float]] = None,
+                 default_phase_timeout_s: float = 120,
+                 on_progress: Optional[Callable[[FlashProgress], None]] = None) -> None:
+        """
+        Initializes the flasher.
+
+        Args:
+            script (str): The flashing script. The HMI_FLASH_SCRIPT environment variable replaces it if set.
+            args (Sequence[str], optional): The script arguments. Defaults to none.
+            phase_timeouts_s (Optional[Dict[str, float]], optional): The longest time of a phase without
+                further progress, i.e. a line telling a percentage or the next phase, by phase, e.g.
+                {"writing system": 600}. Defaults to none.
+            default_phase_timeout_s (float, optional): The timeout of the other phases. Defaults to 120.
+            on_progress (Optional[Callable[[FlashProgress], None]], optional): Called with every output line.
+                Defaults to None, meaning the lines are printed with the device and phase.
+        """
+        self.script = os.environ.get(FLASH_SCRIPT_ENV) or script
+        self.args = list(args)
+        self.phase_timeouts_s = phase_timeouts_s or {}
+        self.default_phase_timeout_s = default_phase_timeout_s
+        self.on_progress = on_progress or _print_progress
+
+    def flash(self, device: str = "HeadUnit", serial: Optional[str] = None) -> FlashResult:
+        """
+        Runs the flashing script and waits until it exits or a phase times out.
+
+        Args:
+            device (str, optional): The device name the progress is reported for. Defaults to "HeadUnit".
+            serial (Optional[str], optional): The fastboot serial of the device, passed to the script in
+                the ANDROID_SERIAL environment variable. Defaults to None, meaning the only connected device.
+
+        Returns:
+            FlashResult: The outcome of the flashing.
+        """
+        env = dict(os.environ)
+        if serial:
+            env["ANDROID_SERIAL"] = serial
+
+        # A new session, so a timed out script is stopped together with the fastboot it started
+        process = subprocess.Popen([self.script, *self.args], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, errors="replace", env=env, start_new_session=True)
+        lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=_read_lines, args=(process.stdout, lines), daemon=True).start()
+
+        result = FlashResult(device)
+        phase, phase_start_s = START_PHASE, time.monotonic()
+        progress_s = phase_start_s
+        while True:
+            timeout_s = self.phase_timeouts_s.get(phase, self.default_phase_timeout_s)
+            try:
+                line = lines.get(timeout=max(progress_s + timeout_s - time.monotonic(), 0))
+            except queue.Empty:
+                result.timed_out_phase = phase
+                _stop(process)
+                break
+            if line is None:
+                break
+
+            marker = _PHASE_MARKER.search(line)
+            if marker:
+                result.phases[phase] = result.phases.get(phase, 0.0) + time.monotonic() - phase_start_s
+                phase, phase_start_s = f"{marker.group(1).lower()} {marker.group(2)}", time.monotonic()
+            percent = _PERCENT_MARKER.search(line)
+            if marker or percent:
+                progress_s = time.monotonic()
+            result.tail = (result.tail + [line])[-_TAIL_LINES:]
+            self.on_progress(FlashProgress(device, phase, float(percent.group(1)) if percent else None, line))
+
+        result.phases[phase] = result.phases.get(phase, 0.0) + time.monotonic() - phase_start_s
+        result.exit_code = process.wait()
+        return result
+
+
+def flash_head_units(head_units: Dict[str, Tuple[PowerController, Optional[str]]], flasher: Flasher,
+                     max_parallel: int = 2, prog_mode_timeout_s: float = 5,
+                     shutdown_timeout_s: float = 2) -> Dict[str, FlashResult]:
+    """
+    Flashes several head units, each switched by its own relay channel, a few at a time.
+
+    Every head unit is powered on in programming mode, flashed, powered off and switched back
+    to normal mode. A head unit that does not enter programming mode is not flashed.
+
+    Args:
+        head_units (Dict[str, Tuple[PowerController, Optional[str]]]): The power controller and
+            fastboot serial of every head unit, by device name.
+        flasher (Flasher): The flasher running the flashing script.
+        max_parallel (int, optional): The most head units flashed at the same time, e.g. as many as
+            the USB hubs carry. Defaults to 2.
+        prog_mode_timeout_s (float, optional): The longest wait for programming mode while too few
+            boot times are recorded. Defaults to 5.
+        shutdown_timeout_s (float, optional): The longest wait for the shutdown while too few
+            shutdown times are recorded. Defaults to 2.
+
+    Returns:
+        Dict[str, FlashResult]: The outcome of flashing every head unit, by device name.
+    """
+    def update(device: str) -> FlashResult:
+        power, serial = head_units[device]
+        if not power.enter_prog_mode(prog_mode_timeout_s):
+            power.leave_prog_mode(shutdown_timeout_s)
+            result = FlashResult(device)
+            result.timed_out_phase = "programming mode"
+            return result
+        try:
+            return flasher.flash(device, serial)
+        finally:
+            power.leave_prog_mode(shutdown_timeout_s)
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        futures = {device: executor.submit(update, device) for device in head_units}
+        return {device: future.result() for device, future in futures.items()}
+
+
+def _read_lines(stream, lines: "queue.Queue[Optional[str]]") -> None:
+    """Puts every line of a stream into a queue, then None at the end of the stream."""
+    with stream:
+        for line in stream:
+            lines.put(line.rstrip("\n"))
+    lines.put(None)
+
+
+def _stop(process: subprocess.Popen) -> None:
+    """Stops a process together with the processes it started, forcibly if it does not exit."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _print_progress(progress: FlashProgress) -> None:
+    """Prints a line of the flashing output with its device and phase."""
+    print(f"[{progress.device} {progress.phase}] {progress.line}", flush=True)
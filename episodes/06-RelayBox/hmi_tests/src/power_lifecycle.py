@@ -0,0 +1,302 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+from clock import Clock, default_clock
+
+# Power states of a device
+OFF = "off"
+BOOTING = "booting"
+PROG_MODE = "prog_mode"
+READY = "ready"
+
+# Environment variable with the file keeping the recorded transition times
+BOOT_STATS_ENV = "HMI_BOOT_STATS"
+
+# Default file keeping the recorded transition times, in the folder the tests are run from
+BOOT_STATS_FILE = ".boot_stats.json"
+
+# Recorded transitions needed before timeouts are derived from them
+_MIN_SAMPLES = 5
+
+# Most recent transition times kept per device and transition
+_MAX_SAMPLES = 100
+
+# Percentile of the recorded times a derived timeout is based on, and the margin added on top
+_TIMEOUT_PERCENTILE = 95
+_TIMEOUT_MARGIN = 1.5
+
+# Shortest derived timeout, so a few quick recorded transitions cannot leave no time to poll
+_MIN_TIMEOUT_S = 5.0
+
+# Seconds between readiness checks
+_POLL_S = 0.5
+
+
+class BootStats:
+    """
+    Transition times of devices, e.g. how long the Head Unit takes to boot, kept across test sessions.
+
+    Timeouts derived from them follow the devices in the lab instead of fixed estimates.
+    """
+
+    def __init__(self, stats_file: str) -> None:
+        """
+        Loads the recorded transition times.
+
+        Args:
+            stats_file (str): The file keeping the times. It is created when the first time is recorded.
+        """
+        self.stats_file = stats_file
+        self.times: Dict[str, Dict[str, List[float]]] = {}
+        try:
+            with open(stats_file) as file:
+                self.times = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def record(self, device: str, transition: str, seconds: float) -> None:
+        """
+        Records how long a transition took and writes the times to the file.
+
+        Args:
+            device (str): The device name, e.g. "HeadUnit".
+            transition (str): The state the device moved to, e.g. READY.
+            seconds (float): The time the transition took.
+        """
+        samples = self.times.setdefault(device, {}).setdefault(transition, [])
+        samples.append(round(seconds, 3))
+        del samples[:-_MAX_SAMPLES]
+
+        # Written next to its final name first, so concurrent readers never see a partial file
+        folder = os.path.dirname(os.path.abspath(self.stats_file))
+        fd, temp_file = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.stats_file))
+        with os.fdopen(fd, "w") as file:
+            json.dump(self.times, file, indent=1)
+        os.replace(temp_file, self.stats_file)
+
+    def percentile(self, device: str, transition: str, percent: float) -> Optional[float]:
+        """
+        Returns a percentile of the recorded times of a transition.
+
+        Args:
+            device (str): The device name.
+            transition (str): The state the device moved to.
+            percent (float): The percentile, from 0 to 100.
+
+        Returns:
+            Optional[float]: The time in seconds, or None if no times are recorded.
+        """
+        samples = sorted(self.times.get(device, {}).get(transition, []))
+        if not samples:
+            return None
+        return samples[min(round(percent / 100 * (len(samples) - 1)), len(samples) - 1)]
+
+    def timeout(self, device: str, transition: str, default_s: float) -> float:
+        """
+        Returns the time to wait for a transition at most.
+
+        Args:
+            device (str): The device name.
+            transition (str): The state the device moves to.
+            default_s (float): The timeout while too few times are recorded.
+
+        Returns:
+            float: The 95th percentile of the recorded times with a margin, at least _MIN_TIMEOUT_S,
+                or the default.
+        """
+        if len(self.times.get(device, {}).get(transition, [])) < _MIN_SAMPLES:
+            return default_s
+        return max(self.percentile(device, transition, _TIMEOUT_PERCENTILE) * _TIMEOUT_MARGIN, _MIN_TIMEOUT_S)
+
+
+class PowerController:
+    """
+    The power lifecycle of a device switched by the RelayBox: off, booting, programming mode and ready.
+
+    Instead of sleeping for estimated boot times, every transition polls a readiness signal and
+    completes as soon as it is seen. The time it took is recorded, and the timeouts are derived
+    from the recorded times once there are enough of them.
+    """
+
+    def __init__(self, relays: Any, display: Any, name: str = "HeadUnit", serial: Optional[str] = None,
+                 switching_delay_s: float = 1, shutdown_settle_s: float = 2, stats: Optional[BootStats] = None,
+                 clock: Optional[Clock] = None) -> None:
+        """
+        Initializes the controller, detecting the current state from the relays and the display.
+
+        Args:
+            relays (Any): The relays fixture, with the `head_unit`, `hu_display` and `hu_prog_mode` relays.
+            display (Any): The display of the device.
+            name (str, optional): The device name the times are recorded for. Defaults to "HeadUnit".
+            serial (Optional[str], optional): The adb and fastboot serial of the device. Defaults to None,
+                meaning readiness is told by the display only, and any fastboot device counts.
+            switching_delay_s (float, optional): The time the programming mode relay takes to switch. Defaults to 1.
+            shutdown_settle_s (float, optional): The time the device takes to shut down once its power relay is
+                off, waited out when no serial tells the shutdown. Defaults to 2.
+            stats (Optional[BootStats], optional): The recorded transition times. Defaults to the file named
+                by the HMI_BOOT_STATS environment variable, or BOOT_STATS_FILE.
+            clock (Optional[Clock], optional): The clock to wait with. Defaults to the default clock.
+        """
+        self._relays = relays
+        self._display = display
+        self.name = name
+        self.serial = serial
+        self._switching_delay_s = switching_delay_s
+        self._shutdown_settle_s = shutdown_settle_s
+        self.stats = stats or BootStats(os.environ.get(BOOT_STATS_ENV) or BOOT_STATS_FILE)
+        self._clock = clock or default_clock()
+
+        if relays.head_unit.is_power_off():
+            self.state = OFF
+        elif relays.hu_prog_mode.is_enable():
+            self.state = PROG_MODE
+        else:
+            self.state = READY if self._is_ready() else BOOTING
+
+    def power_on(self, default_timeout_s: float = 60) -> bool:
+        """
+        Powers on the device and its display, and waits until it is ready.
+
+        Args:
+            default_timeout_s (float, optional): The longest wait while too few boot times are recorded.
+                Defaults to 60.
+
+        Returns:
+            bool: True if the device is ready, False if it did not get ready in time.
+        """
+        self._relays.hu_display.on()
+        self._relays.head_unit.power_on()
+        self.state = BOOTING
+        return self._wait_for(READY, self._is_ready, default_timeout_s)
+
+    def power_off(self, default_timeout_s: float = 10) -> bool:
+        """
+        Powers off the device and its display, and waits until it is off.
+
+        The device is off when adb no longer reaches it, or, from programming mode, when fastboot
+        no longer reaches it. Without a serial, the display going dark tells nothing as it is
+        switched off first, so the device counts as off once its power relay is off and the
+        shutdown settle time has passed.
+
+        Args:
+            default_timeout_s (float, optional): The longest wait while too few shutdown times are recorded.
+                Defaults to 10.
+
+        Returns:
+            bool: True if the device is off, False if it is still running.
+        """
+        if self.state == PROG_MODE:
+            is_off = lambda: not fastboot_reachable(self.serial)
+        elif self.serial:
+            is_off = lambda: not adb_reachable(self.serial)
+        else:
+            settled_s = self._clock.monotonic() + self._shutdown_settle_s
+            is_off = lambda: self._relays.head_unit.is_power_off() and self._clock.monotonic() >= settled_s
+        self._relays.hu_display.off()
+        self._relays.head_unit.power_off()
+        return self._wait_for(OFF, is_off, default_timeout_s)
+
+    def enter_prog_mode(self, default_timeout_s: float = 20) -> bool:
+        """
+        Powers on the device in programming mode and waits until fastboot reaches it.
+
+        Args:
+            default_timeout_s (float, optional): The longest wait while too few boot times are recorded.
+                Defaults to 20.
+
+        Returns:
+            bool: True if the device can be flashed, False if fastboot did not reach it in time.
+        """
+        self._relays.hu_prog_mode.enable()
+        self._clock.sleep(self._switching_delay_s)
+        self._relays.head_unit.power_on()
+        self.state = BOOTING
+        return self._wait_for(PROG_MODE, lambda: fastboot_reachable(self.serial), default_timeout_s)
+
+    def leave_prog_mode(self, default_timeout_s: float = 10) -> bool:
+        """
+        Powers off the device and switches programming mode off, so it boots normally next time.
+
+        Args:
+            default_timeout_s (float, optional): The longest wait for the shutdown while too few
+                shutdown times are recorded. Defaults to 10.
+
+        Returns:
+            bool: True if the device is off, False if it is still running.
+        """
+        off = self.power_off(default_timeout_s)
+        self._relays.hu_prog_mode.disable()
+        self._clock.sleep(self._switching_delay_s)
+        return off
+
+    def _wait_for(self, state: str, is_reached: Callable[[], bool], default_timeout_s: float) -> bool:
+        """
+        Polls a readiness signal until it is seen, then moves to the state and records the time it took.
+
+        Args:
+            state (str): The state to move to.
+            is_reached (Callable[[], bool]): Tells whether the state is reached.
+            default_timeout_s (float): The timeout while too few times of the transition are recorded.
+
+        Returns:
+            bool: True if the state is reached, False if not in time.
+        """
+        timeout_s = self.stats.timeout(self.name, state, default_timeout_s)
+        start_s = self._clock.monotonic()
+        while True:
+            if is_reached():
+                self.state = state
+                self.stats.record(self.name, state, self._clock.monotonic() - start_s)
+                return True
+            if self._clock.monotonic() - start_s >= timeout_s:
+                return False
+            self._clock.sleep(_POLL_S)
+
+    def _is_ready(self) -> bool:
+        """Tells whether the display shows content and, with a known serial, adb reaches the device."""
+        return self._display.grab() is not None and (self.serial is None or adb_reachable(self.serial))
+
+
+def adb_reachable(serial: str) -> bool:
+    """
+    Tells whether adb reaches a booted device.
+
+    Args:
+        serial (str): The device serial.
+
+    Returns:
+        bool: True if the device is online, False otherwise.
+    """
+    result = subprocess.run(["adb", "-s", serial, "get-state"], capture_output=True, text=True)
+    return result.returncode == 0 and result.stdout.strip() == "device"
+
+
+def fastboot_reachable(serial: Optional[str] = None) -> bool:
+    """
+    Tells whether fastboot reaches a device in programming mode.
+
+    Args:
+        serial (Optional[str], optional): The device serial. Defaults to None, meaning any device.
+
+    Returns:
+        bool: True if fastboot lists the device, False otherwise.
+    """
+    result = subprocess.run(["fastboot", "devices"], capture_output=True, text=True)
+    serials = [line.split()[0] for line in result.stdout.splitlines() if line.strip()]
+    return serial in serials if serial else bool(serials)
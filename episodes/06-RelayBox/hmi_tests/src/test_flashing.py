@@ -0,0 +1,129 @@
+# Copyright (C) 2024 DataJob Sweden AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import signal
+import sys
+import threading
+import time
+import pytest
+from flashing import FLASH_SCRIPT_ENV, Flasher, flash_head_units
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="The fake flashing script is a shell script")
+
+# Fake flashing script printing fastboot-like output, see the script for its arguments
+FAKE_FLASH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_flash.sh")
+
+
+class FakeHeadUnit:
+    """A power controller of a head unit, counting how many head units are in programming mode at once."""
+
+    # Head units in programming mode now and at most, shared by all fake head units
+    in_prog_mode = 0
+    most_in_prog_mode = 0
+    _lock = threading.Lock()
+
+    def __init__(self, enters_prog_mode: bool = True) -> None:
+        self.enters_prog_mode = enters_prog_mode
+        self.left_prog_mode = False
+
+    def enter_prog_mode(self, default_timeout_s: float) -> bool:
+        with FakeHeadUnit._lock:
+            FakeHeadUnit.in_prog_mode += 1
+            FakeHeadUnit.most_in_prog_mode = max(FakeHeadUnit.most_in_prog_mode, FakeHeadUnit.in_prog_mode)
+        # Booting takes a while, so head units flashed in parallel overlap
+        time.sleep(0.2)
+        return self.enters_prog_mode
+
+    def leave_prog_mode(self, default_timeout_s: float) -> bool:
+        with FakeHeadUnit._lock:
+            FakeHeadUnit.in_prog_mode -= 1
+        self.left_prog_mode = True
+        return True
+
+
+@pytest.fixture(autouse=True)
+def no_script_override(monkeypatch):
+    """Runs the fake script even if HMI_FLASH_SCRIPT names another one, with no head unit in programming mode."""
+    monkeypatch.delenv(FLASH_SCRIPT_ENV, raising=False)
+    FakeHeadUnit.in_prog_mode = FakeHeadUnit.most_in_prog_mode = 0
+
+
+def test_flash_streams_phases():
+    progress = []
+    result = Flasher(FAKE_FLASH_SCRIPT, on_progress=progress.append).flash("HeadUnit")
+
+    assert result.ok
+    assert result.exit_code == 0
+    assert result.timed_out_phase is None
+    assert list(result.phases) == ["start", "sending boot", "writing boot", "sending system", "writing system",
+                                   "sending vendor", "writing vendor"]
+    assert progress[2].phase == "writing boot" and progress[2].line == "Writing 'boot'"
+    assert result.tail[-1] == "Finished. Total time: 0.450s"
+
+
+def test_flash_exit_code():
+    result = Flasher(FAKE_FLASH_SCRIPT, args=["", "3"], on_progress=lambda progress: None).flash()
+
+    assert not result.ok
+    assert result.exit_code == 3
+    assert result.timed_out_phase is None
+
+
+def test_hung_phase_is_stopped():
+    flasher = Flasher(FAKE_FLASH_SCRIPT, args=["system"], phase_timeouts_s={"writing system": 0.5},
+                      default_phase_timeout_s=30, on_progress=lambda progress: None)
+
+    start_s = time.monotonic()
+    result = flasher.flash()
+
+    assert time.monotonic() - start_s < 10
+    assert not result.ok
+    assert result.timed_out_phase == "writing system"
+    assert result.exit_code == -signal.SIGTERM
+    assert "writing vendor" not in result.phases
+
+
+def test_phase_reporting_progress_runs_past_its_timeout():
+    flasher = Flasher(FAKE_FLASH_SCRIPT, args=["", "0", "system"], phase_timeouts_s={"writing system": 0.5},
+                      default_phase_timeout_s=30, on_progress=lambda progress: None)
+
+    result = flasher.flash()
+
+    assert result.ok
+    assert result.phases["writing system"] > 1.0
+
+
+def test_flash_head_units_a_few_at_a_time():
+    head_units = {f"HeadUnit{index}": (FakeHeadUnit(), None) for index in range(5)}
+    flasher = Flasher(FAKE_FLASH_SCRIPT, on_progress=lambda progress: None)
+
+    results = flash_head_units(head_units, flasher, max_parallel=2)
+
+    assert FakeHeadUnit.most_in_prog_mode == 2
+    assert list(results) == list(head_units)
+    assert all(result.ok for result in results.values())
+    assert all(power.left_prog_mode for power, _ in head_units.values())
+
+
+def test_head_unit_not_in_prog_mode_is_not_flashed():
+    progress = []
+    head_units = {"HeadUnit": (FakeHeadUnit(enters_prog_mode=False), None)}
+
+    results = flash_head_units(head_units, Flasher(FAKE_FLASH_SCRIPT, on_progress=progress.append))
+
+    assert results["HeadUnit"].timed_out_phase == "programming mode"
+    assert results["HeadUnit"].exit_code is None
+    assert not progress
+    assert head_units["HeadUnit"][0].left_prog_mode
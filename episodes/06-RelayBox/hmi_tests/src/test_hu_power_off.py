@@ -12,17 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
 from aurora_tests.pytest.fixtures import device_display, relays
+from clock import clock
+from power_lifecycle import PowerController
 
 # Device identifier for the Head Unit (HU)
 DEV_HU = "HeadUnit"
 
-# Estimated shutdown time for the Head Unit to power down
+# Time the Head Unit takes to power down once its power relay is off
 SHUTDOWN_TIME_S = 2
 
 
-def test_power_off(device_display, relays):
+def test_power_off(device_display, relays, clock):
     """
     Test Case: Verify the Head Unit powers off successfully.
 
@@ -41,12 +42,10 @@ def test_power_off(device_display, relays):
     assert device_display[DEV_HU].grab(
     ) is not None, "HU Display should show content when HU is powered on."
 
-    # Power off the HU display and Head Unit
-    relays.hu_display.off()
-    relays.head_unit.power_off()
-
-    # Wait for the Head Unit to shut down
-    time.sleep(SHUTDOWN_TIME_S)
+    # Power off the HU display and Head Unit, and wait until it has shut down
+    head_unit = PowerController(relays, device_display[DEV_HU], name=DEV_HU,
+                                shutdown_settle_s=SHUTDOWN_TIME_S, clock=clock)
+    assert head_unit.power_off(), "Head Unit did not shut down in time."
 
     # Verify final state: HU display should show no content
     assert device_display[DEV_HU].grab(
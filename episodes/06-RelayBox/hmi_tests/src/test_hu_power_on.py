@@ -12,17 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
 from aurora_tests.pytest.fixtures import device_display, relays
+from clock import clock
+from power_lifecycle import PowerController
 
 # Device identifier for the Head Unit (HU)
 DEV_HU = "HeadUnit"
 
-# Estimated boot-up time for the Head Unit to fully initialize
+# Longest wait for the Head Unit to boot up, until enough boot times are recorded to derive it
 BOOTUP_TIME_S = 30
 
 
-def test_power_on(device_display, relays):
+def test_power_on(device_display, relays, clock):
     """
     Test Case: Verify the Head Unit powers on successfully.
 
@@ -40,12 +41,9 @@ def test_power_on(device_display, relays):
     assert relays.head_unit.is_power_off(), "Head Unit should initially be off."
     assert device_display[DEV_HU].grab() is None, "No display content should be available when HU is off."
 
-    # Power on the HU display and Head Unit
-    relays.hu_display.on()
-    relays.head_unit.power_on()
-
-    # Wait for the Head Unit to boot up
-    time.sleep(BOOTUP_TIME_S)
+    # Power on the HU display and Head Unit, and wait until it has booted up
+    head_unit = PowerController(relays, device_display[DEV_HU], name=DEV_HU, clock=clock)
+    assert head_unit.power_on(BOOTUP_TIME_S), "Head Unit did not boot up in time."
 
     # Verify final state: HU display should show content
     assert device_display[DEV_HU].grab() is not None, "HU Display should show content after boot-up."
@@ -12,35 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import subprocess
-import time
 from aurora_tests.pytest.fixtures import device_display, relays
+from clock import clock
+from flashing import FlashResult, Flasher
+from power_lifecycle import PowerController
 
 # Device identifier for the Head Unit (HU)
 DEV_HU = "HeadUnit"
 
-# Estimated boot-up time for the Head Unit to fully initialize
+# Longest waits for the Head Unit to boot up, power down and boot up in Programming Mode,
+# until enough transition times are recorded to derive them
 BOOTUP_TIME_S = 30
-
-# Estimated shutdown time for the Head Unit to power down
 SHUTDOWN_TIME_S = 2
+PROG_MODE_BOOTUP_TIME_S = 5
 
 # Delay for relay switching operations
 SWITCHING_DELAY_S = 1
 
-# Estimated boot-up time for the HU in Programming Mode
-PROG_MODE_BOOTUP_TIME_S = 5
-
 # Path to the flashing script for updating the HU software
 FLASH_SCRIPT = "/home/mykola/Projects/my/ncar/device/linaro/hikey/installer/hikey960/uefi-flash-all.sh"
 
+# Longest time a flashing phase, e.g. writing one partition, makes no further progress before the flashing counts as hung
+FLASH_PHASE_TIMEOUT_S = 300
+
 
-def flash_head_unit():
-    """Executes the flashing script to update the Head Unit software."""
-    subprocess.run(FLASH_SCRIPT)
+def flash_head_unit() -> FlashResult:
+    """Executes the flashing script to update the Head Unit software, streaming its progress."""
+    return Flasher(FLASH_SCRIPT, default_phase_timeout_s=FLASH_PHASE_TIMEOUT_S).flash(DEV_HU)
 
 
-def test_sw_update(device_display, relays):
+def test_sw_update(device_display, relays, clock):
     """Test Scenario: Head Unit Software Update"""
 
     # Verify initial state: HU and its display should be powered off
@@ -49,29 +50,21 @@ def test_sw_update(device_display, relays):
     assert relays.hu_prog_mode.is_disable(), "Head Unit should not be in Programming Mode."
     assert device_display[DEV_HU].grab() is None, "No display content should be available when HU is off."
 
-    # Enable Programming Mode to prepare for flashing
-    relays.hu_prog_mode.enable()
-    time.sleep(SWITCHING_DELAY_S)  # Allow time for mode switching
+    head_unit = PowerController(relays, device_display[DEV_HU], name=DEV_HU,
+                                switching_delay_s=SWITCHING_DELAY_S, clock=clock)
 
-    # Power on the Head Unit in Programming Mode
-    relays.head_unit.power_on()
-    time.sleep(PROG_MODE_BOOTUP_TIME_S)  # Wait for the HU to initialize in this mode
+    # Power on the Head Unit in Programming Mode, until fastboot reaches it
+    assert head_unit.enter_prog_mode(PROG_MODE_BOOTUP_TIME_S), "Head Unit did not enter Programming Mode in time."
 
     # Start the flashing process
-    flash_head_unit()
-
-    # Power off the Head Unit after flashing is complete
-    relays.head_unit.power_off()
-    time.sleep(SHUTDOWN_TIME_S)  # Allow time for a complete shutdown
+    flashed = flash_head_unit()
 
-    # Disable Programming Mode to return to normal operation
-    relays.hu_prog_mode.disable()
-    time.sleep(SWITCHING_DELAY_S)  # Allow time for mode switching
+    # Power off the Head Unit after flashing is complete and disable Programming Mode to return to normal operation
+    assert head_unit.leave_prog_mode(SHUTDOWN_TIME_S), "Head Unit did not shut down in time."
+    assert flashed.ok, f"Flashing failed: {flashed}"
 
-    # Power on the HU display and Head Unit for verification
-    relays.hu_display.on()
-    relays.head_unit.power_on()
-    time.sleep(BOOTUP_TIME_S)  # Wait for the Head Unit to boot up fully
+    # Power on the HU display and Head Unit for verification, until it has booted up fully
+    assert head_unit.power_on(BOOTUP_TIME_S), "Head Unit did not boot up in time."
 
     # Verify final state: HU display should now be active and showing content
     assert device_display[DEV_HU].grab() is not None, "HU Display should show content after boot-up."